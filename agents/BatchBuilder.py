@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import json
+import json.encoder
+import time
+from lib import six
+
+# La función en C con la que json.dumps(ensure_ascii=False) codifica un string (en Python 2 no hay versión en C)
+_encode_string = None if six.PY2 else json.encoder.encode_basestring
+
+def encode(value):
+    """JSON en UTF-8 sin escapar los caracteres no ASCII (una 'ñ' ocupa 2 bytes y no los 6 de '\\u00f1')."""
+    if _encode_string is not None and isinstance(value, six.text_type):
+        return _encode_string(value).encode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _reject_constant(name):
+    raise ValueError(u"%s no es JSON válido" % name)
+
+# json.loads acepta NaN e Infinity, que no son JSON
+_decoder = json.JSONDecoder(parse_constant=_reject_constant)
+
+def encode_structured(line):
+    """
+    Como encode(), pero una línea que ya es un objeto JSON se devuelve tal
+    cual en UTF-8 (sin los espacios de los extremos), para insertarla en el
+    body como objeto y no como string escapado. Se valida una sola vez, con
+    el parser en C de json; las líneas que no son un objeto JSON válido se
+    codifican como string.
+    """
+    stripped = line.strip()
+    if stripped[:1] == '{' and stripped[-1:] == '}':
+        try:
+            _decoder.decode(stripped)
+        except ValueError:
+            pass
+        else:
+            return stripped.encode('utf-8')
+    return encode(line)
+
+def _offset(start):
+    return b'null' if start is None else str(start).encode('ascii')
+
+class BatchBuilder(object):
+    """
+    Arma el body JSON de un batch a partir de las líneas ya codificadas.
+
+    Cada línea y cada ruta se codifican a bytes JSON una sola vez, al
+    añadirlas; `size` lleva el tamaño exacto del body que devolverá body(), de
+    modo que no hace falta serializar para medir. El body se arma
+    concatenando esos bytes y se entrega tal cual al cliente HTTP:
+
+        {"logs":[...],"source":...,"timestamp":...,"files":[...],"file_index":[...]}
+
+    Las rutas van una sola vez en 'files' y 'file_index' indica, en paralelo a
+    'logs', el archivo de cada línea. Los batches pendientes de versiones
+    anteriores (solo líneas, sin ruta) se arman sin 'files' ni 'file_index'.
+
+    Con offsets=True (líneas reordenadas, ver BatchPacker) el body lleva
+    también 'offsets', en paralelo a 'logs': el offset donde empieza cada
+    línea en su archivo, o null si no tiene (inputs de red).
+
+    Con structured=True las líneas se codificaron con encode_structured(): en
+    'logs' los logs JSON van como objetos y el resto como strings. Solo afecta
+    a cómo se vuelven a codificar las líneas en from_entries() y split().
+    """
+
+    def __init__(self, source, offsets=False, structured=False):
+        self.source = source
+        self.structured = structured
+        self._source = encode(source)
+        # Esqueleto sin líneas ni archivos; el timestamp tiene 10 dígitos hasta el año 2286
+        self._base_size = len(b'{"logs":[],"source":,"timestamp":}') + len(self._source) + len(str(int(time.time())))
+        if offsets:
+            self._base_size += len(b',"offsets":[]')
+        self._files_size = len(b',"files":[],"file_index":[]')
+        self.entries = [] # [ruta, línea] (o [ruta, línea, offset]) de cada línea, para guardar el batch en el estado si falla el envío
+        self._logs = []
+        self._files = []
+        self._file_index = []
+        self._indexes = {}
+        self._offsets = [] if offsets else None
+        self.starts = {} # Offset de la primera línea de cada archivo: el checkpoint no lo pasa hasta que el batch se confirme
+        self.opened = time.time() # Desde cuándo puede estar esperando su primera línea
+        self.size = self._base_size
+        self.lines_size = 0 # Bytes de las líneas codificadas: el llenado se mide igual con y sin 'offsets'
+
+    def __len__(self):
+        return len(self._logs)
+
+    def size_with(self, path, encoded, start=None):
+        """Tamaño exacto del body si se añade la línea `encoded` (bytes de encode()) del archivo `path`."""
+        size = self.size + len(encoded) + (1 if self._logs else 0)
+        if self._offsets is not None:
+            size += len(_offset(start)) + (1 if self._offsets else 0)
+        if path is not None:
+            index = self._indexes.get(path)
+            if index is None:
+                index = len(self._files)
+                size += len(encode(path)) + (1 if self._files else self._files_size)
+            size += len(str(index)) + (1 if self._file_index else 0)
+        return size
+
+    def add(self, path, line, encoded, start=None):
+        self.size = self.size_with(path, encoded, start)
+        self.lines_size += len(encoded)
+        if start is not None and (path not in self.starts or start < self.starts[path]):
+            self.starts[path] = start
+        if self._offsets is not None:
+            self.entries.append([path, line, start])
+            self._offsets.append(_offset(start))
+        else:
+            self.entries.append([path, line] if path is not None else line)
+        self._logs.append(encoded)
+        if path is not None:
+            index = self._indexes.get(path)
+            if index is None:
+                index = self._indexes[path] = len(self._files)
+                self._files.append(encode(path))
+            self._file_index.append(str(index).encode('ascii'))
+
+    def body(self):
+        parts = [b'{"logs":[', b','.join(self._logs), b'],"source":', self._source,
+                 b',"timestamp":', str(int(time.time())).encode('ascii')]
+        if self._files:
+            parts.extend([b',"files":[', b','.join(self._files), b'],"file_index":[', b','.join(self._file_index), b']'])
+        if self._offsets is not None:
+            parts.extend([b',"offsets":[', b','.join(self._offsets), b']'])
+        parts.append(b'}')
+        return b''.join(parts)
+
+    def split(self):
+        """Divide el batch en dos mitades (por número de líneas), p. ej. si la API lo rechaza por tamaño."""
+        middle = len(self.entries) // 2
+        return (BatchBuilder.from_entries(self.source, self.entries[:middle], self.structured),
+                BatchBuilder.from_entries(self.source, self.entries[middle:], self.structured))
+
+    @classmethod
+    def from_entries(cls, source, entries, structured=False):
+        """
+        Arma un batch guardado en el estado: entradas [ruta, línea], [ruta, línea, offset]
+        o, en versiones anteriores, solo la línea. Con structured=True las líneas se
+        codifican con encode_structured().
+        """
+        batch = cls(source, offsets=any(isinstance(entry, (list, tuple)) and len(entry) == 3 for entry in entries),
+                    structured=structured)
+        encode_line = encode_structured if structured else encode
+        for entry in entries:
+            start = None
+            if isinstance(entry, (list, tuple)) and len(entry) == 3:
+                path, line, start = entry
+            elif isinstance(entry, (list, tuple)) and len(entry) == 2:
+                path, line = entry
+            else:
+                path, line = None, entry
+            if isinstance(line, (dict, list)):
+                line = json.dumps(line)
+            elif not isinstance(line, six.string_types):
+                line = six.text_type(line)
+            batch.add(path, line, encode_line(line), start)
+        return batch
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import time
+
+# Líneas que se juntan antes de repartirlas en batches (0: en orden, sin reordenar)
+REORDER_WINDOW = 0
+
+class BatchPacker(object):
+    """
+    Reparte las líneas en batches (BatchBuilder) bajo el límite de bytes.
+
+    Con window <= 1 (por defecto) las líneas van en orden y el batch se cierra
+    en cuanto la siguiente no cabe (greedy). Con una ventana de `window` líneas se reparten
+    con first-fit decreasing: de mayor a menor, cada línea va al primer batch
+    abierto donde cabe, así una línea de 5 KB tras un batch de 3 KB no deja
+    dos batches medio vacíos. Se entregan todos los batches menos el más
+    vacío, que sigue abierto para la ventana siguiente. Como las líneas se
+    reordenan, cada una lleva en el body el offset donde empieza ('offsets')
+    para que el servidor pueda recuperar el orden. Ese array cuesta bytes en
+    cada body, así que con líneas de tamaño parecido el reparto no compensa:
+    se activa solo si se pide.
+
+    `opened` de cada batch es desde cuándo puede estar esperando su línea más
+    antigua; expired() entrega los que superan una antigüedad y flush() todos.
+    """
+
+    def __init__(self, new_batch, window=REORDER_WINDOW):
+        self._new_batch = new_batch # Crea un BatchBuilder vacío; recibe offsets=True si las líneas se reordenan
+        self.window = window
+        self._reorder = window > 1
+        self._lines = [] # (ruta, línea, línea codificada, offset, desde cuándo espera) aún sin repartir
+        self.bins = [] # Batches abiertos
+
+    def __len__(self):
+        return len(self._lines) + sum(len(batch) for batch in self.bins)
+
+    @property
+    def pending_bytes(self):
+        """Bytes aún sin entregar: las líneas de la ventana y los batches abiertos."""
+        return sum(len(item[2]) for item in self._lines) + sum(batch.size for batch in self.bins)
+
+    def oldest(self):
+        """Desde cuándo espera la línea más antigua sin entregar (None si no hay)."""
+        times = [item[4] for item in self._lines] + [batch.opened for batch in self.bins if batch]
+        return min(times) if times else None
+
+    def add(self, path, line, encoded, start, limit, since):
+        """Añade una línea leída desde `since`. Devuelve los batches ya llenos."""
+        if self._reorder:
+            self._lines.append((path, line, encoded, start, since))
+            if len(self._lines) >= self.window:
+                return self.pack(limit)
+            return []
+        ready = []
+        if self.bins and self.bins[0] and self.bins[0].size_with(path, encoded, start) > limit:
+            ready.append(self.bins.pop(0))
+        self._place(self._open_bin(since), path, line, encoded, start, since)
+        return ready
+
+    def pack(self, limit):
+        """Reparte las líneas de la ventana (first-fit decreasing) y devuelve los batches cerrados."""
+        if not self._lines:
+            return []
+        self._lines.sort(key=lambda item: len(item[2]), reverse=True)
+        for path, line, encoded, start, since in self._lines:
+            for batch in self.bins:
+                # El espacio libre descarta rápido los batches llenos; size_with da el tamaño exacto
+                if limit - batch.size > len(encoded) and batch.size_with(path, encoded, start) <= limit:
+                    break
+            else:
+                batch = self._open_bin(since, new=True)
+            self._place(batch, path, line, encoded, start, since)
+        self._lines = []
+        # El batch más vacío sigue abierto para las líneas siguientes
+        self.bins.sort(key=lambda batch: batch.size)
+        ready, self.bins = self.bins[1:], self.bins[:1]
+        return ready
+
+    def expired(self, limit, max_age):
+        """Reparte la ventana y devuelve los batches llenos y los que esperan desde hace max_age segundos o más."""
+        ready = self.pack(limit)
+        now = time.time()
+        for batch in list(self.bins):
+            if batch and now - batch.opened >= max_age:
+                ready.append(batch)
+                self.bins.remove(batch)
+        return ready
+
+    def flush(self, limit):
+        """Todo lo pendiente, repartido en batches (shutdown)."""
+        ready = self.pack(limit) + [batch for batch in self.bins if batch]
+        self.bins = []
+        return ready
+
+    def held_offsets(self):
+        held = {}
+        starts = [{item[0]: item[3]} for item in self._lines if item[3] is not None]
+        starts.extend(batch.starts for batch in self.bins)
+        for offsets in starts:
+            for path, offset in offsets.items():
+                if path not in held or offset < held[path]:
+                    held[path] = offset
+        return held
+
+    def _open_bin(self, since, new=False):
+        if not new and self.bins:
+            return self.bins[0]
+        batch = self._new_batch(offsets=self._reorder)
+        batch.opened = since
+        self.bins.append(batch)
+        return batch
+
+    def _place(self, batch, path, line, encoded, start, since):
+        if since < batch.opened or not batch:
+            batch.opened = since
+        batch.add(path, line, encoded, start)
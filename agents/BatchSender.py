@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import time
+import logging
+import threading
+from agents.ByteQueue import ByteQueue
+
+logger = logging.getLogger(__name__)
+
+# Bytes de batches en cola esperando a los hilos de envío
+QUEUE_BYTES = 4 * 1024 * 1024
+# Batches enviados a la vez (cada uno en su hilo)
+CONCURRENCY = 4
+# Segundos que un hilo espera un batch antes de volver a reintentar los pendientes
+IDLE_INTERVAL = 0.5
+
+class BatchSender(object):
+    """
+    Hilos que envían los batches que arma el hilo lector, para que la lectura
+    de los archivos no espere a la API (timeouts y reintentos).
+
+    Con `concurrency` hilos hay hasta ese número de batches en vuelo a la vez:
+    con una latencia de 100 ms, un único envío a la vez limita el agente a
+    unos 10 batches por segundo. Los batches pasan por una ByteQueue de
+    max_queue_bytes: si la API no da abasto, submit() espera y el lector deja
+    de leer (backpressure) en vez de acumular en memoria. `send` envía un
+    batch o lo guarda como pendiente; `retry_pending` (solo en el primer
+    hilo) reintenta los pendientes del estado.
+
+    Los batches terminan en cualquier orden, así que el checkpoint avanza como
+    una ventana TCP: hasta el primer offset sin confirmar. Un batch cuenta como
+    no confirmado desde submit() hasta que `send` termina, y held_offsets()
+    devuelve, por archivo, el offset donde empieza su primera línea no
+    confirmada; todo lo anterior ya se confirmó.
+    """
+
+    def __init__(self, send, retry_pending=None, max_queue_bytes=QUEUE_BYTES, concurrency=CONCURRENCY):
+        self._send = send
+        self._retry_pending = retry_pending
+        self._queue = ByteQueue(max_queue_bytes)
+        self._lock = threading.Lock()
+        self._unacked = [] # Batches entregados y aún no confirmados (en orden)
+        self._stopping = False
+        self._drain_deadline = None
+        self._workers = [
+            threading.Thread(target=self._run, args=(index,), name='BatchSender-%d' % index)
+            for index in range(max(1, concurrency))
+        ]
+        for worker in self._workers:
+            worker.daemon = True
+        self.concurrency = len(self._workers)
+        self.handled_batches = 0
+        # Uso de los hilos: segundos enviando, y envíos en curso (hilo -> inicio)
+        self._busy_seconds = 0.0
+        self._sending = {}
+        self._last_stats = time.time()
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def is_alive(self):
+        for worker in self._workers:
+            if worker.is_alive():
+                return True
+        return False
+
+    def submit(self, batch, timeout=None):
+        """Encola un batch (BatchBuilder). Devuelve False si la cola sigue llena al vencer el timeout."""
+        with self._lock:
+            self._unacked.append(batch)
+        if self._queue.put(batch, batch.size, timeout):
+            return True
+        with self._lock:
+            self._unacked.remove(batch)
+        return False
+
+    def _run(self, index):
+        while True:
+            if index == 0 and self._retry_pending is not None and not self._stopping:
+                self._retry_pending()
+            batch = self._queue.get(timeout=IDLE_INTERVAL)
+            if batch is None:
+                if self._stopping:
+                    break
+                continue
+            if self._stopping and time.time() >= self._drain_deadline:
+                # Lo que queda en cola sigue sin confirmar: el checkpoint queda antes y se relee al reiniciar
+                logger.warning(u"BatchSender: Tiempo de vaciado agotado con %d batches en cola; se reenviarán al reiniciar.", len(self._queue) + 1)
+                break
+            started = time.time()
+            with self._lock:
+                self._sending[index] = started
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.error(u"BatchSender: Error enviando batch: %s", e, exc_info=True)
+            with self._lock:
+                del self._sending[index]
+                # Solo cuenta lo enviado desde la última llamada a stats()
+                self._busy_seconds += time.time() - max(started, self._last_stats)
+                self._unacked.remove(batch)
+                self.handled_batches += 1
+
+    def stop(self, timeout):
+        """Envía lo que queda en cola durante hasta `timeout` segundos y termina los hilos."""
+        if not self.is_alive():
+            return
+        logger.info(u"BatchSender: Vaciando la cola de envío (%d batches, %d bytes).", len(self._queue), self._queue.bytes)
+        self._drain_deadline = time.time() + timeout
+        self._stopping = True
+        for worker in self._workers:
+            worker.join(max(0, self._drain_deadline - time.time()) + IDLE_INTERVAL)
+
+    def held_offsets(self):
+        held = {}
+        with self._lock:
+            for batch in self._unacked:
+                for path, offset in batch.starts.items():
+                    if path not in held or offset < held[path]:
+                        held[path] = offset
+        return held
+
+    def stats(self):
+        """
+        Contadores de envío. 'send_utilization' es el porcentaje del tiempo que
+        los hilos pasaron enviando desde la llamada anterior: cerca de 100 la
+        concurrencia limita el throughput.
+        """
+        now = time.time()
+        with self._lock:
+            busy = self._busy_seconds
+            for started in self._sending.values():
+                busy += now - max(started, self._last_stats)
+            in_flight = len(self._sending)
+            self._busy_seconds = 0.0
+            elapsed = now - self._last_stats
+            self._last_stats = now
+        utilization = 100.0 * busy / (elapsed * self.concurrency) if elapsed > 0 else 0.0
+        return {
+            'queue_batches': len(self._queue),
+            'queue_bytes': self._queue.bytes,
+            'handled_batches': self.handled_batches,
+            'send_in_flight': in_flight,
+            'send_concurrency': self.concurrency,
+            'send_utilization': round(min(utilization, 100.0), 1)
+        }
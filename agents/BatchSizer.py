@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import time
+import logging
+import threading
+from lib import six
+
+logger = logging.getLogger(__name__)
+
+# Bytes que el límite crece con cada envío rápido (aumento aditivo)
+INCREASE_BYTES = 256
+# Factor que se aplica al límite con un 413, un 5xx o un timeout (disminución multiplicativa)
+DECREASE_FACTOR = 0.5
+# Límite mínimo del body de un batch
+MIN_BYTES = 1024
+
+class BatchSizer(object):
+    """
+    Límite de tamaño de los batches ajustado con AIMD (como la ventana de
+    congestión de TCP) según las respuestas de la API.
+
+    Un batch lleno (al menos 3/4 del límite) confirmado en menos de
+    `latency_target` segundos suma INCREASE_BYTES al límite, hasta `maximum`;
+    los batches pequeños no prueban que la API acepte uno mayor. Un 413 (body demasiado grande),
+    un 5xx o un timeout lo multiplica por DECREASE_FACTOR, hasta MIN_BYTES.
+    Los errores de conexión no lo cambian: no dependen del tamaño.
+
+    Con varios batches en vuelo, como en TCP, el límite cambia como mucho una
+    vez por ida y vuelta: un envío que empezó antes del último cambio no lo
+    hace crecer, ni lo reduce si empezó antes de la última reducción. Un
+    rechazo de un batch que ya supera el límite actual (armado antes de
+    reducirlo) tampoco lo reduce otra vez.
+
+    Los hilos de envío informan los resultados y el hilo lector consulta
+    `limit` al armar cada batch.
+    """
+
+    def __init__(self, maximum, initial=None, minimum=MIN_BYTES, latency_target=1.0):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.latency_target = latency_target
+        self.limit = self._clamp(initial if initial else maximum)
+        self.decreases = 0
+        self._last_change = 0
+        self._last_decrease = 0
+        self._lock = threading.Lock()
+
+    def _clamp(self, limit):
+        return int(max(self.minimum, min(self.maximum, limit)))
+
+    def success(self, size, sent_at):
+        """La API confirmó el batch de `size` bytes enviado en `sent_at`."""
+        now = time.time()
+        if now - sent_at > self.latency_target or size * 4 < self.limit * 3:
+            return
+        with self._lock:
+            if sent_at < self._last_change or self.limit >= self.maximum:
+                return
+            self.limit = self._clamp(self.limit + INCREASE_BYTES)
+            self._last_change = now
+
+    def overload(self, reason, size, sent_at):
+        """La API rechazó por tamaño o por carga (413, 5xx, timeout) el batch de `size` bytes enviado en `sent_at`."""
+        with self._lock:
+            if sent_at < self._last_decrease or size > self.limit:
+                return
+            previous = self.limit
+            self.limit = self._clamp(self.limit * DECREASE_FACTOR)
+            self._last_change = self._last_decrease = time.time()
+            self.decreases += 1
+        if self.limit != previous:
+            logger.warning(u"BatchSizer: %s. Límite de batch reducido de %d a %d bytes.", reason, previous, self.limit)
+
+    @staticmethod
+    def is_overload(response):
+        """Indica si la respuesta fallida de JSONAPIClient.send se debe al tamaño o a la carga de la API."""
+        if not isinstance(response, dict):
+            return False
+        code = response.get('code')
+        if code is not None:
+            return code == 413 or code >= 500
+        error = six.text_type(response.get('error'))
+        return error == 'timeout' or 'timed out' in error
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import time
+import threading
+from collections import deque
+
+class ByteQueue(object):
+    """
+    Cola FIFO entre hilos acotada por bytes en vez de por número de elementos.
+
+    put() espera mientras los elementos encolados sumen más de max_bytes
+    (backpressure: el productor se frena en vez de crecer en memoria). Un
+    elemento mayor que max_bytes entra igualmente si la cola está vacía.
+    Solo usa threading.Condition, disponible desde Python 2.6.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = deque()
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, size, timeout=None):
+        """Encola `item` de `size` bytes. Devuelve False si vence el timeout sin espacio."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._items and self.bytes + size > self.max_bytes:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._items.append((item, size))
+            self.bytes += size
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Saca el elemento más antiguo. Devuelve None si vence el timeout con la cola vacía."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while not self._items:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            item, size = self._items.popleft()
+            self.bytes -= size
+            self._condition.notify_all()
+            return item
@@ -2,16 +2,29 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function, division, absolute_import, unicode_literals
+import os
 import time
 import json
 import sys
 import logging
 import signal
+import threading
 from hashlib import md5
+from lib import six
 from agents.BaseAgent import BaseAgent
 from storage.StateManager import StateManager
 from storage.FileStateStorage import FileStateStorage
-from readers.FileLogReader import FileLogReader
+from readers.MultiFileLogReader import MultiFileLogReader
+from readers.BackfillReader import BackfillReader
+from readers.Fingerprint import ROTATED
+from readers.Inputs import create_input
+from processors.MultilineProcessor import MultilineProcessor
+from processors.FilterProcessor import FilterProcessor
+from processors.DedupProcessor import DedupProcessor
+from agents.BatchBuilder import BatchBuilder, encode, encode_structured
+from agents.BatchSender import BatchSender
+from agents.BatchSizer import BatchSizer
+from agents.BatchPacker import BatchPacker
 from clients.JSONAPIClient import JSONAPIClient
 from clients.auth.ApiKeyAuth import ApiKeyAuth
 
@@ -22,10 +35,14 @@ class LogAgent(BaseAgent):
         super(LogAgent, self).__init__()
         self.config = config
         
-        # AJUSTADO: Límite mucho más conservador para considerar overhead de Laravel/Pusher
-        self.MAX_BATCH_SIZE_BYTES = 7500   # Margen de seguridad de 2500 bytes
-        self.SAFETY_BUFFER = 2500
-        self.MAX_LINE_SIZE_BYTES = 6000    # Para truncar líneas individuales grandes
+        # Tope del body de un batch; por debajo, el límite lo ajusta batch_sizer según las respuestas de la API
+        self.MAX_BATCH_SIZE_BYTES = config.get('batch_max_bytes', 7500)
+        self.MAX_LINE_SIZE_BYTES = 6000    # Para truncar líneas individuales grandes (los lectores ya descartan el resto al leer)
+        self.PUSHER_OVERHEAD_BYTES = 1500  # Metadata adicional de Laravel + Pusher: el límite inicial lo deja de margen
+        self.MIN_LINE_SIZE_BYTES = 256     # Una línea rechazada por tamaño se recorta a la mitad hasta este mínimo
+        # Modo estructurado: los logs que ya son objetos JSON van en 'logs' como objetos, no como strings escapados
+        self.STRUCTURED_LOGS = config.get('structured_logs', False)
+        self._encode = encode_structured if self.STRUCTURED_LOGS else encode
         
         # Control de interrupción
         self._shutdown_requested = False
@@ -37,20 +54,156 @@ class LogAgent(BaseAgent):
             FileStateStorage(config['state_file'])
         )
 
-        # reader, lee el archivo de log.
-        self.log_reader = FileLogReader(config['log_file'])
+        # backfill, envía los archivos rotados (.1, .gz, .bz2) que quedaron sin leer con el agente detenido
+        # (o mientras el archivo estaba cerrado por el límite de descriptores).
+        self.backfill = None
+        if config.get('backfill_rotated', True):
+            self.backfill = BackfillReader(self.state_manager.state.get('backfill'), max_line_bytes=self.MAX_LINE_SIZE_BYTES)
+        self.BACKFILL_LINES_PER_PASS = 5000
+
+        # reader, lee los archivos de log (un FileLogReader por archivo). Sin archivos (solo INPUTS) no hay reader.
+        log_files = config.get('log_files') or ([config['log_file']] if config.get('log_file') else [])
+        self.log_reader = None
+        if log_files:
+            self.log_reader = MultiFileLogReader(
+                log_files,
+                rotate_wait=config.get('rotate_wait', 5),
+                max_line_bytes=self.MAX_LINE_SIZE_BYTES,
+                max_open_files=config.get('max_open_files', 256),
+                on_rotated=self.backfill.plan if self.backfill is not None else None,
+                drop_cache=config.get('drop_page_cache', True),
+                readahead=int(config.get('catchup_readahead_mb', 8) * 1024 * 1024)
+            )
+        # Máximo de bytes leídos de los archivos antes de pasarlos al batching: la memoria no crece con el backlog.
+        # Lo fija el perfil activo (ver PROFILES).
+        self.READ_BUFFER_BYTES = 1024 * 1024
+
+        # inputs, fuentes que no son archivos (syslog UDP/TCP, sockets Unix, stdin, FIFO). No bloquean al leer.
+        self.inputs = [
+            create_input(url, recv_buffer=config.get('input_buffer_kb', 4096) * 1024, max_line_bytes=self.MAX_LINE_SIZE_BYTES)
+            for url in config.get('inputs', [])
+        ]
+        if self.log_reader is None and not self.inputs:
+            raise ValueError(u"LogAgent: No hay archivos de log (LOG_FILE / LOG_FILES) ni INPUTS que leer.")
+        # Con inputs, cada cuántos segundos se consultan mientras se espera a los archivos
+        self.INPUT_POLL_INTERVAL = 0.05
+
+        # processors, etapas entre la lectura y el batching (en orden). Pueden retener líneas entre pasadas.
+        self.processors = []
+        if config.get('multiline_start') or config.get('multiline_continuation'):
+            self.processors.append(MultilineProcessor(
+                start=config.get('multiline_start'),
+                continuation=config.get('multiline_continuation'),
+                # Un evento nunca supera el límite por línea: no se recorta al codificarlo
+                max_event_size=min(config.get('multiline_max_size') or self.MAX_LINE_SIZE_BYTES, self.MAX_LINE_SIZE_BYTES),
+                timeout=config.get('multiline_timeout', 1.0)
+            ))
+        # Filtro, después de unir los eventos multilínea para descartar un stack trace entero con su línea de inicio.
+        # Lo descartado no se codifica ni se envía, y el checkpoint avanza sobre ello.
+        if (config.get('filter_include') or config.get('filter_exclude') or config.get('filter_levels')
+                or config.get('filter_services')):
+            self.processors.append(FilterProcessor(
+                include=config.get('filter_include'),
+                exclude=config.get('filter_exclude'),
+                levels=config.get('filter_levels'),
+                aliases=config.get('filter_level_aliases'),
+                services=config.get('filter_services')
+            ))
+        # Supresión de repeticiones, después del filtro para que lo descartado no ocupe la tabla
+        if config.get('dedup_window'):
+            self.processors.append(DedupProcessor(
+                window=config['dedup_window'],
+                masked=config.get('dedup_mask', False),
+                max_keys=config.get('dedup_max_keys', 10000)
+            ))
+
+        # batch_sizer, límite de tamaño de los batches (AIMD): crece con envíos rápidos y se reduce
+        # a la mitad con 413, 5xx o timeouts. Se guarda en el estado para no empezar de cero al reiniciar.
+        self.batch_sizer = BatchSizer(
+            self.MAX_BATCH_SIZE_BYTES,
+            initial=self.state_manager.state.get('batch_limit') or self.MAX_BATCH_SIZE_BYTES - self.PUSHER_OVERHEAD_BYTES,
+            latency_target=config.get('batch_latency_target', 1.0)
+        )
+        self.split_batches = 0
+        self.shortened_lines = 0
+        # Contadores y estimaciones que actualizan los hilos de envío a la vez
+        self._stats_lock = threading.Lock()
 
         # client, envia los logs a la api.
         self.api_client = JSONAPIClient(
             endpoint=config['api_url'],
             auth_handler=ApiKeyAuth(config['secret_token']),
-            ssl_cert_file=self.config.get('ssl_cert_file')
+            ssl_cert_file=self.config.get('ssl_cert_file'),
+            compression=config.get('compression'),
+            compression_level=config.get('compression_level', 6),
+            # Límites de envío (token bucket): tras una caída el backlog se reparte en el tiempo en vez de saturar el enlace
+            max_bytes_per_second=config.get('send_rate_kbps', 0) * 1024,
+            max_requests_per_second=config.get('send_rate_requests', 0),
+            burst_seconds=config.get('send_rate_burst', 2)
         )
+        # Con compresión los límites (batch_sizer y MAX_BATCH_SIZE_BYTES) son de bytes comprimidos: los batches
+        # se arman hasta el límite por la compresión estimada (EWMA de bytes sin comprimir / comprimidos),
+        # con COMPRESSION_MARGIN de margen porque cada batch comprime distinto.
+        self.COMPRESSION_ALPHA = 0.2
+        self.COMPRESSION_MARGIN = 0.9
+        self.MAX_COMPRESSION_RATIO = 10.0
+        self.compression_ratio = 2.0 if self.api_client.compression else 1.0
 
         # Configuración
         self.batch_interval = config.get('batch_interval', 0.5)
         self.max_retries = config.get('max_retries', 3)
         self.retry_delay = config.get('retry_delay', 5)
+
+        # sender, hilos que envían los batches (y reintentan los pendientes) para que la lectura no espere a la API.
+        # Hay hasta send_concurrency batches en vuelo; el checkpoint no pasa del primero sin confirmar.
+        # La cola entre lectura y envío está limitada en bytes: si la API no da abasto, la lectura se frena.
+        self.sender = BatchSender(
+            self._send_and_handle_batch,
+            retry_pending=self._process_pending_batches,
+            max_queue_bytes=int(config.get('send_queue_mb', 4) * 1024 * 1024),
+            concurrency=config.get('send_concurrency', 4)
+        )
+        # Segundos que el shutdown espera a que se envíe lo que queda en cola
+        self.SHUTDOWN_DRAIN_SECONDS = 10
+        # Offsets de líneas leídas que el shutdown dejó sin entregar al sender
+        self._unsent = {}
+        # Pasada en curso: si termina con una excepción, sus líneas no llegaron al sender y no hay checkpoint nuevo
+        self._pass_open = False
+
+        # Flush del batch: se envía al llenarse, cuando su primera línea lleva BATCH_MAX_LATENCY segundos
+        # esperando o en el shutdown. Mientras tanto pasa de una pasada a la siguiente (linger), así a ritmos
+        # bajos no se envían batches de una o dos líneas. La duración de las pasadas se adapta a la tasa de
+        # llegada (EWMA de bytes por segundo): el tiempo que se espera que tarde el batch en llenarse.
+        self.BATCH_MAX_LATENCY = config.get('batch_max_latency', 2.0)
+        self.ARRIVAL_RATE_ALPHA = 0.2
+        self.arrival_rate = 0.0
+        self.flush_interval = 0.0
+
+        # packer, reparte las líneas en batches, en orden. Con una ventana de reordenamiento (BATCH_REORDER_WINDOW
+        # líneas, desactivada por defecto) usa first-fit decreasing; las líneas llevan su offset para recuperar el orden.
+        self.packer = BatchPacker(self._new_batch, window=config.get('batch_reorder_window', 0))
+        # Llenado medio de los batches entregados (bytes de las líneas / límite; sin 'offsets' ni el resto del body)
+        self._fill_total = 0.0
+        self._fill_batches = 0
+
+        # Perfiles según el retraso de lectura (bytes escritos aún sin leer):
+        # - live: tramos de lectura pequeños y espera de datos nuevos hasta batch_interval (latencia baja).
+        # - catchup: tramos grandes, pasadas más largas (menos guardados del estado) y sin esperas (throughput).
+        # Se entra en catchup con CATCHUP_LAG_BYTES de retraso (o con archivos rotados por enviar)
+        # y se vuelve a live por debajo de CATCHUP_EXIT_BYTES.
+        self.CATCHUP_LAG_BYTES = int(config.get('catchup_lag_mb', 8) * 1024 * 1024)
+        self.CATCHUP_EXIT_BYTES = self.CATCHUP_LAG_BYTES // 8
+        self.PROFILES = {
+            'live': {'read_buffer_bytes': 1024 * 1024, 'pass_seconds': self.batch_interval, 'idle_wait': True},
+            'catchup': {'read_buffer_bytes': 8 * 1024 * 1024, 'pass_seconds': max(self.batch_interval, 2.0), 'idle_wait': False}
+        }
+        self.lag = 0
+        self._catchup_since = None
+        self._set_profile('live')
+
+        # Métricas: se escriben en el log cada METRICS_INTERVAL segundos
+        self.METRICS_INTERVAL = 60
+        self._last_metrics = time.time()
         
     def _setup_signal_handlers(self):
         """Configura manejadores para Ctrl+C y otras señales"""
@@ -71,31 +224,61 @@ class LogAgent(BaseAgent):
         # NUEVO: Limpiar batches pendientes que son demasiado grandes
         self._clean_oversized_pending_batches()
         
-        # Cargar last_position del estado
-        last_pos_from_state = self.state_manager.state.get('last_position')
+        if self.log_reader is None:
+            logger.info(u"LogAgent: Sin archivos de log; solo se leen los inputs.")
+            return
 
-        if last_pos_from_state is not None and last_pos_from_state > 0:
-            logger.info(u"LogAgent: Se encontró last_position %s en el estado. Aplicando al lector.", last_pos_from_state)
-            self.log_reader.set_initial_position(last_pos_from_state)
+        # Estados de versiones anteriores: un único archivo con 'last_position' y sin inode
+        legacy_position = self.state_manager.state.get('last_position')
+        single_file = len(self.log_reader.readers) == 1
+
+        for path, reader in sorted(self.log_reader.readers.items()):
+            file_state = self.state_manager.get_file_state(path)
+            if file_state is None and single_file and legacy_position:
+                file_state = {'position': legacy_position, 'inode': None}
+            self._restore_reader_position(path, reader, file_state)
+            # Con miles de archivos no se dejan todos abiertos tras posicionarlos
+            self.log_reader.mark_used(path)
+
+        self.state_manager.update_file_positions(self.log_reader.positions())
+        if self.backfill is not None:
+            self.state_manager.update_backfill(self.backfill.state())
+        logger.info(u"LogAgent: Posiciones iniciales guardadas para %d archivo(s).", len(self.log_reader.readers))
+
+    def _restore_reader_position(self, path, reader, file_state):
+        """Aplica el checkpoint de un archivo a su lector, o lo posiciona al final si no hay checkpoint."""
+        if not file_state:
+            logger.info(u"LogAgent: Sin posición guardada para %s. Posicionando lector al final del archivo.", path)
+            reader.seek_to_end_and_get_position()
+            return
+
+        # El archivo rotado que se estaba drenando al detenerse se termina de enviar desde su offset.
+        # Va antes que plan(), que lo tomaría desde 0 al ser un rotado posterior al checkpoint.
+        if file_state.get('rotated') and self.backfill is not None:
+            self.backfill.resume(path, file_state['rotated'])
+
+        # Se compara el contenido (fingerprint), no solo el inode: un inode reutilizado o un copytruncate
+        # con el archivo ya más largo que el offset guardado harían continuar en un offset que no corresponde
+        if reader.restore_checkpoint(file_state) == ROTATED:
+            logger.info(u"LogAgent: %s ya no es el archivo del checkpoint (rotación, truncamiento o inode reutilizado). Leyendo desde el principio.", path)
+            if self.backfill is not None:
+                self.backfill.plan(path, file_state)
         else:
-            logger.info(u"LogAgent: No se encontró last_position válida en el estado. Posicionando lector al final del archivo de log.")
-            end_position = self.log_reader.seek_to_end_and_get_position()
-            self.state_manager.update_position(end_position)
-            logger.info(u"LogAgent: Estado actualizado con la posición final del log: %s", end_position)
+            logger.info(u"LogAgent: Se encontró la posición %s para %s en el estado. Aplicando al lector.", file_state['position'], path)
 
     def run(self):
         """Loop principal del agente con manejo de shutdown limpio"""
         self.initialize()
+        self.sender.start()
         
         logger.info(u"Iniciando loop principal del LogAgent...")
         
         try:
             while self._should_continue():
+                # No hace falta pausa: el lector bloquea (inotify o polling)
+                # hasta que hay datos nuevos o vence batch_interval.
                 self.execute()
-                
-                # Pequeña pausa para evitar CPU alta cuando no hay datos
-                if self._should_continue():
-                    time.sleep(0.1)
+                self._report_metrics()
                     
         except KeyboardInterrupt:
             logger.info(u"KeyboardInterrupt recibido en LogAgent")
@@ -115,104 +298,287 @@ class LogAgent(BaseAgent):
         # Verificar shutdown al inicio
         if not self._should_continue():
             return
-            
-        # 1. Procesar batches pendientes (solo los de tamaño válido)
-        self._process_pending_batches()
 
-        # Verificar shutdown después de procesar pendientes
-        if not self._should_continue():
-            return
+        # Los batches pendientes los reintenta el hilo de envío (BatchSender).
+        # Con shutdown los lectores dejan de leer y lo ya leído se arma y se entrega igual (el cleanup vacía la cola).
+        # Cada línea se codifica a JSON una sola vez; el batch lleva el tamaño exacto del body.
+        # Lo que quedó sin llenar en la pasada anterior sigue armándose (ver BATCH_MAX_LATENCY).
+        self._pass_open = True
+        pass_start = time.time()
+        arrived_bytes = 0
 
-        # 2. NUEVA LÓGICA: Control granular por línea con interrupciones
-        current_batch = []
-        current_size_estimate = 0
-        last_position = self.log_reader._position  # Guardar posición inicial
-        
-        # Calcular overhead base del JSON una vez (más conservador)
-        base_overhead = len(json.dumps({
-            'logs': [],
-            'source': self.config.get('source', ''),
-            'timestamp': int(time.time())
-        }).encode('utf-8'))
-        
-        # Agregamos overhead adicional para Laravel/Pusher
-        laravel_pusher_overhead = 1500  # Metadata adicional de Laravel + Pusher
-        total_overhead = base_overhead + laravel_pusher_overhead
-        
-        for line in self.log_reader.read(timeout=self.batch_interval):
-            # Verificar interrupción antes de procesar cada línea
-            if not self._should_continue():
-                logger.info(u"Interrupción detectada durante procesamiento. Guardando estado...")
-                break
-                
+        records = self._iter_records()
+        for path, line, start in records:
             try:
-                # Convertir línea a string si es necesario
-                if isinstance(line, str):
-                    line_str = line
-                else:
-                    line_str = json.dumps(line)
-                
-                # Calcular tamaño real de la línea en el array JSON
-                line_size = len(json.dumps(line_str).encode('utf-8'))
-                
-                # Manejar líneas individuales demasiado grandes
-                if line_size > self.MAX_LINE_SIZE_BYTES:
-                    logger.warning(u"Línea de log demasiado grande (%d bytes), truncando a %d bytes", 
-                                 line_size, self.MAX_LINE_SIZE_BYTES)
-                    line_str = line_str[:self.MAX_LINE_SIZE_BYTES-50] + "...[TRUNCATED]"
-                    line_size = len(json.dumps(line_str).encode('utf-8'))
-                
-                # Estimar tamaño total del payload con esta línea (MÁS CONSERVADOR)
-                estimated_payload_size = total_overhead + current_size_estimate + line_size
-                if len(current_batch) > 0:
-                    estimated_payload_size += len(current_batch) - 1  # Comas entre elementos
-                
-                # Control granular: ¿Cabe en el batch actual?
-                if estimated_payload_size > self.MAX_BATCH_SIZE_BYTES:
-                    # Enviar batch actual si tiene contenido
-                    if current_batch:
-                        if not self._should_continue():
-                            logger.info(u"Interrupción detectada antes de envío. Guardando estado...")
-                            break
-                            
-                        self._send_and_handle_batch(current_batch)
-                        logger.debug(u"Batch enviado con %d líneas, estimado: %d bytes", 
-                                   len(current_batch), total_overhead + current_size_estimate)
-                    
-                    # Iniciar nuevo batch con la línea actual
-                    current_batch = [line_str]
-                    current_size_estimate = line_size
-                else:
-                    # La línea cabe en el batch actual
-                    current_batch.append(line_str)
-                    current_size_estimate += line_size
-                
-                # Actualizar última posición conocida
-                last_position = self.log_reader._position
-                
+                # Los lectores acumulan líneas durante la pasada, así que esperan desde su inicio
+                arrived_bytes += self._pack(path, line, start, pass_start)
             except Exception as e:
                 logger.error(u"Error procesando línea de log: %s", str(e))
                 continue
+
+        elapsed = time.time() - pass_start
+        if elapsed > 0:
+            self.arrival_rate += self.ARRIVAL_RATE_ALPHA * (arrived_bytes / elapsed - self.arrival_rate)
+
+        # Los batches sin llenar se encolan solo si su primera línea ya esperó BATCH_MAX_LATENCY
+        if self._should_continue():
+            for batch in self.packer.expired(self._batch_limit(), self.BATCH_MAX_LATENCY):
+                self._dispatch(batch)
+                logger.debug(u"Batch encolado con %d líneas, %d bytes", len(batch), batch.size)
         
-        # Enviar cualquier batch restante (si no hay interrupción)
-        if current_batch and self._should_continue():
-            self._send_and_handle_batch(current_batch)
-            logger.debug(u"Batch final enviado con %d líneas, estimado: %d bytes", 
-                       len(current_batch), total_overhead + current_size_estimate)
-        
-        # IMPORTANTE: Actualizar posición solo UNA VEZ al final
-        if last_position != self.state_manager.state.get('last_position'):
-            self.state_manager.update_position(last_position)
+        self._save_checkpoint()
+        self._pass_open = False
+
+    def _pass_length(self):
+        """
+        Segundos de la próxima pasada. En live, lo que se espera que tarde el
+        batch en llenarse según la tasa de llegada, sin pasar de lo que le queda
+        a la primera línea del batch para cumplir BATCH_MAX_LATENCY (con
+        batch_interval como mínimo, para no leer en un bucle sin esperas).
+        """
+        if not self._idle_wait:
+            return self._pass_seconds
+        budget = self.BATCH_MAX_LATENCY
+        oldest = self.packer.oldest()
+        if oldest is not None:
+            budget -= time.time() - oldest
+        if self.arrival_rate > 0:
+            fill_time = max(0, self._batch_limit() - self.packer.pending_bytes) / self.arrival_rate
+        else:
+            fill_time = budget
+        self.flush_interval = max(self._pass_seconds, min(budget, fill_time))
+        return self.flush_interval
+
+    def _pack(self, path, line, start, since):
+        """Codifica una línea leída desde `since` y la añade al packer; entrega los batches llenos. Devuelve sus bytes codificados."""
+        # Convertir línea a string si es necesario
+        if isinstance(line, six.string_types):
+            line_str = line
+        else:
+            line_str = json.dumps(line)
+        line_str, encoded = self._encode_line(line_str)
+
+        # Control granular: los batches que ya no admiten más líneas (según el límite aprendido de la API) se entregan
+        for batch in self.packer.add(path, line_str, encoded, start, self._batch_limit(), since):
+            # Mientras se envía este batch se sigue leyendo y armando el siguiente
+            self._dispatch(batch)
+            logger.debug(u"Batch encolado con %d líneas, %d bytes", len(batch), batch.size)
+        return len(encoded)
+
+    def _flush_held_records(self):
+        """
+        Shutdown: lo que retienen los processors (un evento multilínea a medias,
+        los resúmenes de repeticiones pendientes) pasa al packer. Las líneas de
+        inputs no tienen offset: si no se envían ahora se pierden.
+        """
+        now = time.time()
+        for path, line, start in list(self._flush_processors(force=True)):
+            try:
+                self._pack(path, line, start, now)
+            except Exception as e:
+                logger.error(u"Error procesando línea de log: %s", str(e))
+
+    def _flush_batches(self):
+        """Shutdown: encola los batches sin llenar; si la cola no los admite, sus líneas quedan antes del checkpoint."""
+        for batch in self.packer.flush(self._batch_limit()):
+            # Si ya quedaron líneas anteriores sin entregar, se releerán con estas al reiniciar
+            if self._unsent or not self.sender.submit(batch, timeout=1):
+                self._hold(batch.starts)
+            else:
+                self._record_fill(batch)
+
+    def _batch_limit(self):
+        """Bytes del body sin comprimir hasta los que se arma un batch: el límite de batch_sizer (bytes en la red) por la compresión estimada."""
+        if not self.api_client.compression:
+            return self.batch_sizer.limit
+        return int(self.batch_sizer.limit * self.compression_ratio * self.COMPRESSION_MARGIN)
+
+    def _record_fill(self, batch):
+        self._fill_total += batch.lines_size / self._batch_limit()
+        self._fill_batches += 1
+
+    def _dispatch(self, batch):
+        """
+        Entrega un batch al hilo de envío. Con la cola llena espera (backpressure)
+        mientras el agente siga corriendo; con shutdown lo intenta una sola vez, sin
+        esperar (con límites de envío la cola se vacía despacio y cada espera
+        retrasaría el cierre), y si la cola está llena el batch no se envía y sus
+        líneas quedan antes del checkpoint.
+        """
+        while True:
+            stopping = not self._should_continue()
+            if not (stopping and self._unsent) and self.sender.submit(batch, timeout=0 if stopping else 0.5):
+                self._record_fill(batch)
+                return True
+            if stopping:
+                break
+        if not self._unsent:
+            logger.info(u"Interrupción detectada antes de envío. Guardando estado...")
+        self._hold(batch.starts)
+        return False
+
+    def _hold(self, starts):
+        """Registra offsets de líneas leídas que no se enviarán, para que el checkpoint quede antes."""
+        for path, start in starts.items():
+            if start is not None and (path not in self._unsent or start < self._unsent[path]):
+                self._unsent[path] = start
+
+    def _save_checkpoint(self):
+        # IMPORTANTE: Actualizar posiciones solo UNA VEZ al final (un único guardado para todos los archivos)
+        # Las líneas retenidas por los processors (p. ej. un stack trace incompleto) o aún en cola de envío
+        # no se enviaron: el checkpoint queda antes de ellas para releerlas si el agente se detiene.
+        held = self._held_offsets()
+        if self.log_reader is not None:
+            positions = self.log_reader.positions(held)
+            self.state_manager.update_file_positions(positions)
+            # Lo ya enviado y guardado no se vuelve a leer: se libera de la page cache
+            self.log_reader.drop_cache(positions)
+        if self.backfill is not None:
+            self.state_manager.update_backfill(self.backfill.state(held))
+        self.state_manager.update_batch_limit(self.batch_sizer.limit)
             
+    def metrics(self):
+        """Contadores del agente y de sus lectores."""
+        metrics = self.log_reader.stats() if self.log_reader is not None else {}
+        metrics['mode'] = self.mode
+        metrics['lag_bytes'] = self.log_reader.lag() if self.log_reader is not None else 0
+        if self.backfill is not None:
+            metrics['truncated_lines'] = metrics.get('truncated_lines', 0) + self.backfill.truncated_lines
+            metrics['dropped_bytes'] = metrics.get('dropped_bytes', 0) + self.backfill.dropped_bytes
+        for source in self.inputs:
+            for key, value in source.stats().items():
+                metrics[key] = metrics.get(key, 0) + value
+        for processor in self.processors:
+            metrics.update(processor.stats())
+        metrics.update(self.sender.stats())
+        metrics.update(self.api_client.stats())
+        metrics['batch_limit_bytes'] = self.batch_sizer.limit
+        metrics['batch_limit_decreases'] = self.batch_sizer.decreases
+        metrics['split_batches'] = self.split_batches
+        metrics['shortened_lines'] = self.shortened_lines
+        metrics['arrival_bytes_per_second'] = int(self.arrival_rate)
+        metrics['flush_interval'] = round(self.flush_interval, 2)
+        metrics['batch_fill_ratio'] = round(self._fill_total / self._fill_batches, 3) if self._fill_batches else 0
+        metrics['compression_ratio'] = round(self.compression_ratio, 2)
+        return metrics
+
+    def _report_metrics(self, force=False):
+        if not force and time.time() - self._last_metrics < self.METRICS_INTERVAL:
+            return
+        self._last_metrics = time.time()
+        metrics = self.metrics()
+        logger.info(u"LogAgent: Métricas: %s", u", ".join(u"%s=%s" % (key, metrics[key]) for key in sorted(metrics)))
+
+    def _set_profile(self, mode):
+        profile = self.PROFILES[mode]
+        self.mode = mode
+        self.READ_BUFFER_BYTES = profile['read_buffer_bytes']
+        self._pass_seconds = profile['pass_seconds']
+        self._idle_wait = profile['idle_wait']
+
+    def _update_profile(self):
+        """Elige el perfil live o catchup según el retraso actual."""
+        self.lag = self.log_reader.lag() if self.log_reader is not None else 0
+        limit = self.CATCHUP_EXIT_BYTES if self.mode == 'catchup' else self.CATCHUP_LAG_BYTES
+        behind = self.lag >= limit or (self.backfill is not None and self.backfill.pending())
+        mode = 'catchup' if behind else 'live'
+        if mode == self.mode:
+            return
+        if mode == 'catchup':
+            self._catchup_since = time.time()
+            logger.info(u"LogAgent: %d bytes de retraso. Cambiando al perfil catch-up (throughput).", self.lag)
+        else:
+            logger.info(u"LogAgent: Catch-up completado en %.1f s. Volviendo al perfil live (baja latencia).", time.time() - self._catchup_since)
+            self._catchup_since = None
+        self._set_profile(mode)
+
+    def _iter_records(self):
+        """
+        Genera las tuplas (ruta, línea, offset donde empieza la línea) de una
+        pasada, ya procesadas, leyendo en tramos de READ_BUFFER_BYTES como
+        máximo. Con un backlog grande el primer batch sale en cuanto se llena,
+        en vez de esperar a leer todo el backlog.
+        """
+        self._update_profile()
+
+        # Los archivos rotados pendientes van antes que las líneas nuevas, por el mismo camino de batching
+        if self.backfill is not None and self.backfill.pending():
+            records = self.backfill.read(max_lines=self.BACKFILL_LINES_PER_PASS, max_bytes=self.READ_BUFFER_BYTES)
+            for record in self._pipeline(records):
+                yield record
+            for record in self._flush_processors():
+                yield record
+            return
+
+        deadline = time.time() + self._pass_length()
+        wait = self._idle_wait
+        idle = True # La pasada aún no leyó nada
+        while self._should_continue():
+            records = self._read_inputs()
+            timeout = max(0, deadline - time.time())
+            if not wait:
+                timeout = 0
+            elif self.inputs:
+                # Los inputs no despiertan la espera de los archivos: se consultan cada INPUT_POLL_INTERVAL
+                timeout = 0 if records else min(timeout, self.INPUT_POLL_INTERVAL)
+            if self.log_reader is not None:
+                records.extend(self.log_reader.read(timeout=timeout, max_bytes=self.READ_BUFFER_BYTES))
+            elif timeout:
+                time.sleep(timeout)
+            for record in self._pipeline(records):
+                yield record
+            # Lo que un processor retiene más de su timeout sale aunque no lleguen líneas nuevas
+            for record in self._flush_processors():
+                yield record
+            if records:
+                idle = False
+            if time.time() >= deadline:
+                break
+            # En catch-up no se espera a que lleguen datos: sin nada pendiente la pasada termina. Si la pasada
+            # no leyó nada (el retraso puede ser una línea sin terminar que se está descartando), espera a los
+            # datos como en live en vez de repetir pasadas vacías sin pausa.
+            if not records and not wait:
+                if not idle:
+                    break
+                wait = True
+
+    def _read_inputs(self):
+        """Mensajes ya recibidos por los inputs, sin esperar."""
+        records = []
+        for source in self.inputs:
+            records.extend(source.read(max_bytes=self.READ_BUFFER_BYTES))
+        return records
+
+    def _pipeline(self, records, first=0):
+        """Pasa los registros por los processors a partir del índice `first`."""
+        for processor in self.processors[first:]:
+            records = processor.process(records)
+        return records
+
+    def _flush_processors(self, force=False):
+        """Registros que cada processor deja de retener, pasados por los processors siguientes."""
+        for index, processor in enumerate(self.processors):
+            for record in self._pipeline(processor.flush(force), index + 1):
+                yield record
+
+    def _held_offsets(self):
+        """{ruta: offset} más bajo retenido por los processors, los batches en curso o sin enviar, para no adelantar el checkpoint."""
+        held = dict(self._unsent)
+        for stage in self.processors + [self.packer, self.sender]:
+            for path, offset in stage.held_offsets().items():
+                if path not in held or offset < held[path]:
+                    held[path] = offset
+        return held
+
     def _clean_oversized_pending_batches(self):
-        """Limpia batches pendientes que excedan el tamaño máximo"""
+        """Limpia batches pendientes que excedan el tamaño máximo (comprimidos, si hay compresión)"""
         pending_batches = self.state_manager.state.get('pending_batches', [])
         original_count = len(pending_batches)
         cleaned_batches = []
         
         for batch_info in pending_batches:
-            batch_data = batch_info.get('data', [])
-            batch_size = self._calculate_batch_size({'logs': batch_data, 'source': self.config.get('source', ''), 'timestamp': int(time.time())})
+            batch = BatchBuilder.from_entries(self.config.get('source', ''), batch_info.get('data', []), self.STRUCTURED_LOGS)
+            batch_size = len(self.api_client.compress(batch.body())) if self.api_client.compression else batch.size
             
             if batch_size <= self.MAX_BATCH_SIZE_BYTES:
                 cleaned_batches.append(batch_info)
@@ -225,34 +591,84 @@ class LogAgent(BaseAgent):
             self.state_manager.save()
             logger.info(u"Limpieza completada: %d batches eliminados por tamaño excesivo", 
                        original_count - len(cleaned_batches))
-            
+
+    def _new_batch(self, offsets=False):
+        return BatchBuilder(self.config.get('source', ''), offsets=offsets, structured=self.STRUCTURED_LOGS)
+
+    def _encode_line(self, line_str, max_size=None):
+        """
+        Devuelve (línea, línea codificada en JSON UTF-8), recortando las líneas
+        cuyo JSON supera max_size (por defecto MAX_LINE_SIZE_BYTES). En modo estructurado un log JSON
+        se codifica tal cual (objeto); recortado ya no es JSON y va como string.
+        """
+        max_size = max_size or self.MAX_LINE_SIZE_BYTES
+        encoded = self._encode(line_str)
+        if len(encoded) > max_size:
+            logger.warning(u"Línea de log demasiado grande (%d bytes), truncando a %d bytes", 
+                         len(encoded), max_size)
+            limit = max_size - 50
+            while len(encoded) > max_size:
+                # Recorte proporcional: con acentos o escapes un carácter ocupa más de un byte
+                line_str = line_str[:len(line_str) * limit // len(encoded)]
+                encoded = encode(line_str + "...[TRUNCATED]")
+            line_str += "...[TRUNCATED]"
+        return line_str, encoded
+
     def _send_and_handle_batch(self, batch):
-        """Envía un batch y maneja el resultado - MEJORADO"""
-        # Verificación de seguridad antes de enviar
-        payload = {
-            'logs': [str(line) if not isinstance(line, str) else line for line in batch],
-            'source': self.config.get('source', ''),
-            'timestamp': int(time.time())
-        }
-        
-        payload_size = self._calculate_batch_size(payload)
-        
-        if payload_size > self.MAX_BATCH_SIZE_BYTES:
-            logger.error(u"CRÍTICO: Batch de %d bytes excede límite de %d bytes. Esto no debería ocurrir con la nueva lógica. Descartando batch.", 
-                        payload_size, self.MAX_BATCH_SIZE_BYTES)
-            return  # No enviar ni guardar en pending
-        
-        if not self._send_batch(batch):
-            # Solo agregar a pending si falló por motivos de red, no por tamaño
-            batch_id = md5(json.dumps(batch).encode('utf-8')).hexdigest()
-            self.state_manager.add_pending_batch({
-                'id': batch_id,
-                'data': batch,
-                'timestamp': time.time(),
-                'retry_count': 0
-            })
-            logger.info(u"Batch agregado a pending por fallo de red: ID %s", batch_id)
+        """Envía un batch (BatchBuilder) y maneja el resultado - MEJORADO"""
+        body = batch.body()
+        success, response = self._send_batch(batch, body)
+        if not success and self._rejected_for_size(response):
+            if not self._split_to_pending(batch):
+                logger.error(u"CRÍTICO: La API rechaza por tamaño una línea de %d bytes ya recortada al mínimo. Queda como pendiente.", len(body))
+                self._add_pending(batch, body, u"rechazo por tamaño")
+            return
+        if not success:
+            self._add_pending(batch, body, u"fallo de red")
+
+    def _add_pending(self, batch, body=None, reason=None):
+        """Guarda el batch en pending_batches del estado; el hilo de pendientes lo reintenta con retry_delay entre fallos."""
+        batch_id = md5(body if body is not None else batch.body()).hexdigest()
+        self.state_manager.add_pending_batch({
+            'id': batch_id,
+            'data': batch.entries,
+            'timestamp': time.time(),
+            'retry_count': 0
+        })
+        logger.info(u"Batch agregado a pending por %s: ID %s", reason, batch_id)
     
+    def _rejected_for_size(self, response):
+        return isinstance(response, dict) and response.get('code') == 413
+
+    def _split_to_pending(self, batch):
+        """
+        Batch rechazado por tamaño: sus dos mitades, o su única línea recortada
+        a la mitad, quedan como batches pendientes. Los reintenta el hilo de
+        pendientes con su espera entre fallos (y se dividen otra vez si hace
+        falta), en vez de reenviarse aquí en cadena. Devuelve False si la línea
+        ya no se puede recortar más (MIN_LINE_SIZE_BYTES).
+        """
+        if len(batch) > 1:
+            with self._stats_lock:
+                self.split_batches += 1
+            logger.info(u"Dividiendo batch de %d líneas y %d bytes (límite actual %d bytes).", len(batch), batch.size, self.batch_sizer.limit)
+            for half in batch.split():
+                self._add_pending(half, reason=u"división de un batch rechazado por tamaño")
+            return True
+        entry = list(batch.entries[0]) if isinstance(batch.entries[0], (list, tuple)) else [None, batch.entries[0]]
+        line = entry[1] if isinstance(entry[1], six.string_types) else json.dumps(entry[1])
+        max_size = len(self._encode(line)) // 2
+        if max_size < self.MIN_LINE_SIZE_BYTES:
+            return False
+        if line.endswith("...[TRUNCATED]"):
+            line = line[:-len("...[TRUNCATED]")]
+        entry[1], _ = self._encode_line(line, max_size)
+        with self._stats_lock:
+            self.shortened_lines += 1
+        shorter = BatchBuilder.from_entries(batch.source, [entry if entry[0] is not None else entry[1]], batch.structured)
+        self._add_pending(shorter, reason=u"recorte de una línea rechazada por tamaño")
+        return True
+
     def _process_pending_batches(self):
         """Procesa batches pendientes - CON MANEJO DE INTERRUPCIONES"""
         for batch_info in list(self.state_manager.state.get('pending_batches', [])):
@@ -261,9 +677,15 @@ class LogAgent(BaseAgent):
                 logger.info(u"Interrupción detectada durante procesamiento de batches pendientes.")
                 break
                 
-            if self._send_batch(batch_info['data']):
+            batch = BatchBuilder.from_entries(self.config.get('source', ''), batch_info['data'], self.STRUCTURED_LOGS)
+            success, response = self._send_batch(batch)
+            if success:
                 logger.info(u"Batch pendiente ID %s enviado exitosamente. Eliminando.", batch_info.get('id'))
                 self.state_manager.remove_pending_batch(batch_info.get('id'))
+            elif self._rejected_for_size(response) and self._split_to_pending(batch):
+                # Las mitades (o la línea recortada) quedan como pendientes nuevos en lugar del batch original
+                logger.info(u"Batch pendiente ID %s rechazado por tamaño. Dividido o recortado.", batch_info.get('id'))
+                self.state_manager.remove_pending_batch(batch_info.get('id'))
             else:
                 batch_id = batch_info.get('id')
                 logger.warning(u"Fallo al enviar batch pendiente ID %s.", batch_id)
@@ -286,57 +708,47 @@ class LogAgent(BaseAgent):
                     time.sleep(1)
                 break 
 
-    def _send_batch(self, batch):
-        """Envía batch - MEJORADO con mejor validación"""
+    def _send_batch(self, batch, body=None):
+        """
+        Envía un batch (BatchBuilder); el body ya armado se entrega tal cual al cliente.
+        Devuelve (éxito, respuesta) como JSONAPIClient.send e informa el resultado a batch_sizer.
+        Con compresión, los tamaños que se comprueban e informan son los del body comprimido.
+        """
         try:
-            # Asegurar que batch sea una lista
-            if not isinstance(batch, list):
-                batch = [batch] if batch else []
-                
-            # Convertir cada línea de log a string si no lo está ya
-            processed_logs = []
-            for log_line in batch:
-                if isinstance(log_line, (dict, list)):
-                    processed_logs.append(json.dumps(log_line))
-                else:
-                    processed_logs.append(str(log_line))
-            
-            # Construir payload con estructura correcta
-            payload = {
-                'logs': processed_logs,
-                'source': self.config.get('source', ''),
-                'timestamp': int(time.time())
-            }
-
-            # Validación final de tamaño
-            payload_size = self._calculate_batch_size(payload)
-            if payload_size > self.MAX_BATCH_SIZE_BYTES:
-                logger.error(u"El tamaño del payload (%s bytes) excede el máximo permitido (%s bytes). Batch rechazado definitivamente.", 
-                           payload_size, self.MAX_BATCH_SIZE_BYTES)
-                return False  # Esto causará que NO se agregue a pending
+            if body is None:
+                body = batch.body()
+            wire = self.api_client.compress(body)
+            if self.api_client.compression and wire:
+                ratio = min(len(body) / len(wire), self.MAX_COMPRESSION_RATIO)
+                with self._stats_lock:
+                    self.compression_ratio += self.COMPRESSION_ALPHA * (ratio - self.compression_ratio)
+
+            # Validación final de tamaño: se trata como un 413 de la API para que se divida
+            if len(wire) > self.MAX_BATCH_SIZE_BYTES:
+                logger.error(u"El tamaño del payload (%s bytes) excede el máximo permitido (%s bytes).", 
+                           len(wire), self.MAX_BATCH_SIZE_BYTES)
+                return False, {'error': 'payload too large', 'code': 413}
             
-            logger.debug(u"Enviando batch de %d líneas, tamaño: %d bytes", len(processed_logs), payload_size)
+            logger.debug(u"Enviando batch de %d líneas, tamaño: %d bytes (%d en la red)", len(batch), len(body), len(wire))
             
-            success, response = self.api_client.send('logs', payload)
+            start_time = time.time()
+            success, response = self.api_client.send('logs', wire, compressed=True)
+            # La espera a los límites de envío no es latencia de la API
+            start_time += self.api_client.throttled_time()
             
             if success:
                 logger.debug(u"Batch enviado exitosamente")
+                self.batch_sizer.success(len(wire), start_time)
             else:
                 logger.warning(u"Fallo al enviar batch: %s", response)
+                if BatchSizer.is_overload(response):
+                    self.batch_sizer.overload(u"Respuesta %s de la API" % response.get('code', response.get('error')), len(wire), start_time)
                 
-            return success
+            return success, response
             
         except Exception as e:
             logger.error(u"Error sending batch: %s", str(e), exc_info=True)
-            return False
-        
-    def _calculate_batch_size(self, batch):
-        """Calcula el tamaño aproximado en bytes del batch serializado como JSON"""
-        try:
-            return len(json.dumps(batch).encode('utf-8'))
-        except Exception as e:
-            logger.error(u"Error calculando tamaño del batch: %s", str(e))
-            return 0
+            return False, {'error': str(e)}
 
     def cleanup(self):
         """Cleanup resources - MEJORADO para evitar múltiples ejecuciones"""
@@ -345,8 +757,20 @@ class LogAgent(BaseAgent):
             
         logger.info(u"Ejecutando cleanup del LogAgent...")
         try:
-            if hasattr(self.log_reader, '_file') and self.log_reader._file:
-                self.log_reader._file.close()
+            # Lo que queda en cola se envía (hasta SHUTDOWN_DRAIN_SECONDS) antes del último checkpoint
+            if not self._pass_open:
+                self._flush_held_records()
+                self._flush_batches()
+            self.sender.stop(self.SHUTDOWN_DRAIN_SECONDS)
+            if not self._pass_open:
+                self._save_checkpoint()
+            self._report_metrics(force=True)
+            if self.log_reader is not None:
+                self.log_reader.close()
+            if self.backfill is not None:
+                self.backfill.close()
+            for source in self.inputs:
+                source.close()
             self.state_manager.save()
             logger.info(u"Cleanup completado exitosamente")
         except Exception as e:
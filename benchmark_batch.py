@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark del armado de batches: CPU por línea del método anterior
+(json.dumps por línea para medir y el payload completo serializado de nuevo
+al validar, al enviar y en el cliente HTTP) frente a BatchBuilder (cada línea
+se codifica una vez y el body se arma concatenando bytes), en orden (greedy)
+y con BatchPacker (first-fit decreasing en una ventana de 256 líneas). El
+llenado es el tamaño medio de las líneas de cada batch respecto del límite,
+sin contar el resto del body ('offsets' de BatchPacker, rutas, source), para
+comparar los métodos por lo que realmente transportan. La fila
+'estructurado' es BatchBuilder con STRUCTURED_LOGS (los logs JSON van como
+objetos y no como strings escapados).
+
+Uso: python benchmark_batch.py [número de líneas]
+Las líneas se generan con las plantillas de generador_logs.py.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import sys
+import json
+import time
+import random
+from agents.BatchBuilder import BatchBuilder, encode, encode_structured
+from agents.BatchPacker import BatchPacker
+import generador_logs
+
+MAX_BATCH_SIZE_BYTES = 7500
+PUSHER_OVERHEAD_BYTES = 1500
+SOURCE = 'benchmark'
+PATH = '/var/log/app/prueba_de_carga.log'
+REORDER_WINDOW = 256
+
+def sample_lines(count):
+    random.seed(1)
+    lines = []
+    for sequence in range(count):
+        log_object = random.choice(generador_logs.log_generators)(sequence)
+        lines.append(json.dumps(log_object, ensure_ascii=False))
+    return lines
+
+def old_payload(batch):
+    logs, files, file_index, indexes = [], [], [], {}
+    for path, line in batch:
+        logs.append(line)
+        if path not in indexes:
+            indexes[path] = len(files)
+            files.append(path)
+        file_index.append(indexes[path])
+    return {'logs': logs, 'source': SOURCE, 'timestamp': int(time.time()), 'files': files, 'file_index': file_index}
+
+def old_send(batch, sent):
+    # _send_and_handle_batch, _send_batch y JSONAPIClient._prepare_request serializaban cada uno el payload
+    len(json.dumps(old_payload(batch)).encode('utf-8'))
+    len(json.dumps(old_payload(batch)).encode('utf-8'))
+    body = json.dumps(old_payload(batch)).encode('utf-8')
+    sent.append((len(body), sum(len(json.dumps(line).encode('utf-8')) for _, line in batch)))
+
+def run_old(lines):
+    sent = []
+    base_overhead = len(json.dumps({'logs': [], 'source': SOURCE, 'timestamp': int(time.time()), 'files': [], 'file_index': []}).encode('utf-8'))
+    total_overhead = base_overhead + PUSHER_OVERHEAD_BYTES
+    batch, paths, estimate = [], set(), 0
+    for line in lines:
+        line_size = len(json.dumps(line).encode('utf-8'))
+        tag_size = len(str(len(paths))) + 1
+        path_size = 0 if PATH in paths else len(json.dumps(PATH).encode('utf-8')) + 1
+        line_size += tag_size
+        estimated = total_overhead + estimate + line_size + path_size + max(0, len(batch) - 1)
+        if estimated > MAX_BATCH_SIZE_BYTES:
+            if batch:
+                old_send(batch, sent)
+            batch, paths, estimate = [[PATH, line]], set([PATH]), line_size + len(json.dumps(PATH).encode('utf-8')) + 1
+        else:
+            batch.append([PATH, line])
+            paths.add(PATH)
+            estimate += line_size + path_size
+    if batch:
+        old_send(batch, sent)
+    return sent
+
+def run_new(lines, encode_line=encode):
+    sent = []
+    batch = BatchBuilder(SOURCE)
+    for line in lines:
+        encoded = encode_line(line)
+        if batch and batch.size_with(PATH, encoded) > MAX_BATCH_SIZE_BYTES - PUSHER_OVERHEAD_BYTES:
+            sent.append((len(batch.body()), batch.lines_size))
+            batch = BatchBuilder(SOURCE)
+        batch.add(PATH, line, encoded)
+    if batch:
+        sent.append((len(batch.body()), batch.lines_size))
+    return sent
+
+def run_packed(lines):
+    sent = []
+    packer = BatchPacker(lambda offsets=False: BatchBuilder(SOURCE, offsets=offsets), window=REORDER_WINDOW)
+    offset = 0
+    for line in lines:
+        for batch in packer.add(PATH, line, encode(line), offset, MAX_BATCH_SIZE_BYTES - PUSHER_OVERHEAD_BYTES, 0):
+            sent.append((len(batch.body()), batch.lines_size))
+        offset += len(line) + 1
+    for batch in packer.flush(MAX_BATCH_SIZE_BYTES - PUSHER_OVERHEAD_BYTES):
+        sent.append((len(batch.body()), batch.lines_size))
+    return sent
+
+def measure(func, lines, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        sent = func(lines)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, sent
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    lines = sample_lines(count)
+    raw_bytes = sum(len(line.encode('utf-8')) for line in lines)
+    print(u"%d líneas, %.1f MB de texto" % (count, raw_bytes / 1024 / 1024))
+    limit = MAX_BATCH_SIZE_BYTES - PUSHER_OVERHEAD_BYTES
+    run_structured = lambda lines: run_new(lines, encode_structured)
+    for name, func in (('anterior', run_old), ('BatchBuilder', run_new), ('BatchPacker', run_packed), ('estructurado', run_structured)):
+        elapsed, sent = measure(func, lines)
+        print(u"%-13s %6.2f µs/línea  %5d batches  %7.1f líneas/batch  %9d bytes enviados  %5.1f%% llenado" % (
+            name, elapsed * 1e6 / count, len(sent), count / len(sent), sum(body for body, _ in sent),
+            100.0 * sum(lines for _, lines in sent) / (limit * len(sent))))
+
+if __name__ == '__main__':
+    main()
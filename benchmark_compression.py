@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la compresión de los batches (COMPRESSION, COMPRESSION_LEVEL):
+CPU por MB de body comprimido frente a bytes en la red, con gzip y deflate en
+varios niveles.
+
+Primero se comprimen los batches que arma el agente sin compresión (límite de
+6000 bytes). Después, como hace el agente con compresión, los batches se
+arman hasta el límite por la compresión medida (con el margen de 0.9) y se
+cuentan las requests necesarias y las que superan el tope de 7500 bytes
+comprimidos (se dividirían).
+
+Uso: python benchmark_compression.py [archivo de logs | número de líneas]
+Por defecto lee la salida de generador_logs.py (prueba_de_carga.log) si existe;
+si no, genera 50000 líneas con sus plantillas.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import io
+import os
+import sys
+import time
+from agents.BatchBuilder import BatchBuilder, encode
+from clients.JSONAPIClient import JSONAPIClient
+from benchmark_batch import sample_lines, SOURCE, PATH, MAX_BATCH_SIZE_BYTES, PUSHER_OVERHEAD_BYTES
+import generador_logs
+
+SETTINGS = [(None, 0), ('gzip', 1), ('gzip', 6), ('gzip', 9), ('deflate', 1), ('deflate', 6), ('deflate', 9)]
+MARGIN = 0.9
+
+def load_lines():
+    argument = sys.argv[1] if len(sys.argv) > 1 else generador_logs.LOG_FILE_PATH
+    if argument.isdigit():
+        return sample_lines(int(argument)), u"%s líneas generadas" % argument
+    if os.path.exists(argument):
+        with io.open(argument, encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip()], argument
+    return sample_lines(50000), u"50000 líneas generadas"
+
+def build_batches(lines, limit):
+    bodies = []
+    batch = BatchBuilder(SOURCE)
+    for line in lines:
+        encoded = encode(line)
+        if batch and batch.size_with(PATH, encoded) > limit:
+            bodies.append(batch.body())
+            batch = BatchBuilder(SOURCE)
+        batch.add(PATH, line, encoded)
+    if batch:
+        bodies.append(batch.body())
+    return bodies
+
+def compress_all(client, bodies, repeat=3):
+    best, wire = None, None
+    for _ in range(repeat):
+        start = time.time()
+        wire = [client.compress(body) for body in bodies]
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, wire
+
+def main():
+    lines, origin = load_lines()
+    limit = MAX_BATCH_SIZE_BYTES - PUSHER_OVERHEAD_BYTES
+    bodies = build_batches(lines, limit)
+    raw_bytes = sum(len(body) for body in bodies)
+    megabytes = raw_bytes / 1024 / 1024
+    print(u"%s: %d líneas, %d batches, %.1f MB de body" % (origin, len(lines), len(bodies), megabytes))
+    print(u"%-10s %9s %12s %8s %10s %12s %9s" % (u"compresión", u"ms/MB", u"bytes red", u"ratio", u"requests", u"líneas/req", u"divididos"))
+    for compression, level in SETTINGS:
+        client = JSONAPIClient('http://localhost', compression=compression, compression_level=level or 6)
+        elapsed, wire = compress_all(client, bodies)
+        wire_bytes = sum(len(body) for body in wire)
+        ratio = raw_bytes / wire_bytes
+        # Batches armados hasta el límite (bytes en la red) por la compresión medida, como el agente
+        packed = [client.compress(body) for body in build_batches(lines, int(limit * ratio * (MARGIN if compression else 1)))]
+        oversized = sum(1 for body in packed if len(body) > MAX_BATCH_SIZE_BYTES)
+        name = '%s-%d' % (compression, level) if compression else 'ninguna'
+        print(u"%-10s %9.2f %12d %8.2f %10d %12.1f %9d" % (
+            name, elapsed * 1000 / megabytes, wire_bytes, ratio, len(packed), len(lines) / len(packed), oversized))
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,10 @@ import json
 import socket
 import logging
 import time
+import zlib
+import threading
 from clients.BaseApiClient import BaseApiClient
+from clients.TokenBucket import TokenBucket
 import ssl
 
 # Configuración de imports para six (compatible con estructura de carpetas)
@@ -23,8 +26,12 @@ except ImportError as e:
 
 logger = logging.getLogger(__name__)
 
+# Content-Encoding admitidos -> wbits de zlib (gzip: cabecera gzip; deflate: formato zlib, RFC 9110)
+COMPRESSIONS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
 class JSONAPIClient(BaseApiClient):
-    def __init__(self, endpoint, auth_handler=None, timeout=10, ssl_cert_file=None):
+    def __init__(self, endpoint, auth_handler=None, timeout=10, ssl_cert_file=None, compression=None, compression_level=6,
+                 max_bytes_per_second=0, max_requests_per_second=0, burst_seconds=2):
         """
         Constructor mejorado.
 
@@ -32,13 +39,34 @@ class JSONAPIClient(BaseApiClient):
             endpoint (str): URL base de la API (sin trailing slash)
             auth_handler (BaseAuth, optional): Manejador de autenticación
             timeout (int, optional): Timeout en segundos. Default 10.
+            compression (str, optional): 'gzip' o 'deflate' para comprimir el body (Content-Encoding); 'none' o None, sin comprimir.
+            compression_level (int, optional): Nivel de zlib, de 1 (rápido) a 9 (más compresión). Default 6.
+            max_bytes_per_second (float, optional): Bytes de body por segundo que se envían como máximo. 0, sin límite.
+            max_requests_per_second (float, optional): Requests por segundo como máximo. 0, sin límite.
+            burst_seconds (float, optional): Ráfaga permitida tras un rato sin enviar, en segundos de cada límite. Default 2.
         """
+        if compression == 'none':
+            compression = None
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(u"JSONAPIClient: Compresión no soportada: %s" % compression)
         self.endpoint = endpoint.rstrip('/')
         self.auth_handler = auth_handler
         self.timeout = timeout
         self.retry_attempts = 3  # Nuevo: intentos de reintento
         self.retry_delay = 1     # Nuevo: delay entre reintentos (segundos)
         self.ssl_cert_file = ssl_cert_file
+        self.compression = compression or None
+        self.compression_level = compression_level
+        # Limitadores token bucket, cada uno con su coste por request: (limitador, True si cuesta los bytes del body)
+        self._limits = []
+        if max_bytes_per_second:
+            self._limits.append((TokenBucket(max_bytes_per_second, max_bytes_per_second * burst_seconds), True))
+        if max_requests_per_second:
+            self._limits.append((TokenBucket(max_requests_per_second, max(1, max_requests_per_second * burst_seconds)), False))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.throttled_seconds = 0.0
+        self.throttled_requests = 0
 
     def create_ssl_context(self):
         context = ssl.create_default_context()
@@ -46,8 +74,43 @@ class JSONAPIClient(BaseApiClient):
         context.verify_mode = ssl.CERT_NONE  # ¡Solo para desarrollo!
         return context
 
-    def _prepare_request(self, data):
-        """Prepara los headers y body de la request."""
+    def _throttle(self, body):
+        """Espera lo que indiquen los limitadores antes de enviar el body. Devuelve los segundos esperados."""
+        if not self._limits:
+            return 0.0
+        wait = max(bucket.reserve(len(body) if per_byte else 1) for bucket, per_byte in self._limits)
+        if wait > 0:
+            logger.debug(u"JSONAPIClient: Límite de envío alcanzado; esperando %.2fs.", wait)
+            time.sleep(wait)
+            with self._lock:
+                self.throttled_seconds += wait
+                self.throttled_requests += 1
+        return wait
+
+    def throttled_time(self):
+        """Segundos que la última llamada a send() de este hilo esperó a los limitadores."""
+        return getattr(self._local, 'throttled', 0.0)
+
+    def stats(self):
+        """Tiempo total esperado a los limitadores y requests que esperaron."""
+        with self._lock:
+            return {
+                'throttled_seconds': round(self.throttled_seconds, 1),
+                'throttled_requests': self.throttled_requests
+            }
+
+    def compress(self, body):
+        """Body tal como viaja por la red: comprimido si hay compresión configurada."""
+        if not self.compression:
+            return body
+        compressor = zlib.compressobj(self.compression_level, zlib.DEFLATED, COMPRESSIONS[self.compression])
+        return compressor.compress(body) + compressor.flush()
+
+    def _prepare_request(self, data, compressed=False):
+        """
+        Prepara los headers y body de la request. Un body ya codificado (bytes) se envía tal cual,
+        comprimido si hay compresión configurada y no viene ya comprimido (compressed=True).
+        """
         headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'LogAgent/1.0',
@@ -57,7 +120,12 @@ class JSONAPIClient(BaseApiClient):
         if self.auth_handler:
             headers = self.auth_handler.authenticate(headers)
         
-        return headers, json.dumps(data).encode('utf-8')
+        body = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+        if self.compression:
+            headers['Content-Encoding'] = self.compression
+            if not compressed:
+                body = self.compress(body)
+        return headers, body
 
     def _create_ssl_context(self):
         """Crea un contexto SSL que desactiva verificación para desarrollo local."""
@@ -105,13 +173,17 @@ class JSONAPIClient(BaseApiClient):
         
         return status in (200, 201, 204), None
 
-    def send(self, endpoint, data):
+    def send(self, endpoint, data, compressed=False):
         """
         Envía datos a la API con manejo de errores robusto.
         
         Args:
             endpoint (str): Endpoint específico (se une a self.endpoint)
-            data (dict): Datos a enviar
+            data (dict o bytes): Datos a enviar, o el body JSON ya codificado
+            compressed (bool): El body (bytes) ya pasó por compress()
+
+        Con límites de envío (max_bytes_per_second, max_requests_per_second) cada
+        intento espera antes a los limitadores; ver throttled_time() y stats().
             
         Returns:
             tuple: (success, response_data)
@@ -130,10 +202,15 @@ class JSONAPIClient(BaseApiClient):
         
         logger.debug(u"URL de destino: %s", url)
         
+        # El body se serializa una sola vez, no en cada reintento
+        headers, body = self._prepare_request(data, compressed)
+        self._local.throttled = 0.0
         for attempt in range(self.retry_attempts):
+            # Cada intento consume ancho de banda: también los reintentos pasan por los limitadores
+            self._local.throttled += self._throttle(body)
             try:
-                headers, body = self._prepare_request(data)
-                logger.debug(u"Request body: %s", body.decode('utf-8'))
+                if logger.isEnabledFor(logging.DEBUG) and not self.compression:
+                    logger.debug(u"Request body: %s", body.decode('utf-8'))
                 req = request.Request(url, body, headers)
                 start_time = time.time()
                 response = request.urlopen(req, timeout=self.timeout, context=ssl_context) #borrar
@@ -146,7 +223,8 @@ class JSONAPIClient(BaseApiClient):
                 error_reason = getattr(e, 'reason', 'Unknown Error')
                 logger.error(u"HTTP Error %s: %s (Attempt %d/%d)", 
                             e.code, error_reason, attempt+1, self.retry_attempts)
-                if attempt == self.retry_attempts - 1:
+                # Un body demasiado grande se rechazará igual en cada reintento
+                if attempt == self.retry_attempts - 1 or e.code == 413:
                     return False, {'error': error_reason, 'code': e.code}
                 
             except error.URLError as e:
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import time
+import threading
+
+class TokenBucket(object):
+    """
+    Limitador token bucket: `rate` tokens por segundo y hasta `capacity`
+    acumulados (la ráfaga que se permite tras un rato sin consumir).
+
+    reserve() toma los tokens enseguida aunque no alcancen y devuelve cuánto
+    hay que esperar para pagarlos: el saldo queda negativo y los siguientes
+    esperan detrás. Así varios hilos se reparten el ritmo en orden, y un
+    consumo mayor que `capacity` (un batch más grande que la ráfaga) espera
+    lo que le toca en vez de bloquearse para siempre.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Toma `amount` tokens y devuelve los segundos que hay que esperar antes de usarlos."""
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
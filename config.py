@@ -2,6 +2,7 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 import os
 import re
 import io
+import json
 
 def load_env_file():
     """Carga manualmente un archivo .env"""
@@ -18,6 +19,26 @@ def load_env_file():
         pass  # No se pudo decodificar el archivo .env
 
 
+def parse_log_files(value, default=None):
+    """
+    Convierte LOG_FILES (rutas o patrones glob separados por comas) en una lista.
+    Si no está definida, usa el valor por defecto (normalmente LOG_FILE).
+    """
+    if not value:
+        return [default] if default else []
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_level_aliases(value):
+    """Convierte FILTER_LEVEL_ALIASES ('alias=nivel' separados por comas) en un diccionario."""
+    aliases = {}
+    for item in parse_log_files(value):
+        if '=' in item:
+            alias, level = item.split('=', 1)
+            aliases[alias.strip()] = level.strip()
+    return aliases
+
+
 def load_config():
     load_env_file()  # Cargar variables primero
     
@@ -28,12 +49,48 @@ def load_config():
     # This is an internal implementation detail, not user configuration
     state_file_path = os.path.join(project_root, 'state', 'agent.state')
     
+    # Sin LOG_FILE ni LOG_FILES el agente solo lee sus INPUTS
+    log_file = os.getenv('LOG_FILE') or None
+
     return {
         'source': os.getenv('SOURCE'),
-        'log_file': os.getenv('LOG_FILE', '/var/log/syslog'),
+        'log_file': log_file,
+        'log_files': parse_log_files(os.getenv('LOG_FILES'), log_file),
         'api_url': os.getenv('API_URL', 'http://localhost:8000/api/logs'),
         'secret_token': os.getenv('SECRET_TOKEN', 'default-key'),
         'batch_interval': float(os.getenv('BATCH_INTERVAL', '0.5')),
+        'batch_max_latency': float(os.getenv('BATCH_MAX_LATENCY', '2')),
+        'batch_reorder_window': int(os.getenv('BATCH_REORDER_WINDOW', '0')),
+        'rotate_wait': float(os.getenv('ROTATE_WAIT', '5')),
+        'backfill_rotated': os.getenv('BACKFILL_ROTATED', 'true').lower() in ('1', 'true', 'yes', 'si'),
+        'max_open_files': int(os.getenv('MAX_OPEN_FILES', '256')),
+        'drop_page_cache': os.getenv('DROP_PAGE_CACHE', 'true').lower() in ('1', 'true', 'yes', 'si'),
+        'catchup_readahead_mb': float(os.getenv('CATCHUP_READAHEAD_MB', '8')),
+        'catchup_lag_mb': float(os.getenv('CATCHUP_LAG_MB', '8')),
+        'multiline_start': os.getenv('MULTILINE_START') or None,
+        'multiline_continuation': os.getenv('MULTILINE_CONTINUATION') or None,
+        'multiline_max_size': int(os.getenv('MULTILINE_MAX_SIZE', '0')),
+        'multiline_timeout': float(os.getenv('MULTILINE_TIMEOUT', '1')),
+        'filter_include': os.getenv('FILTER_INCLUDE') or None,
+        'filter_exclude': os.getenv('FILTER_EXCLUDE') or None,
+        'filter_levels': parse_log_files(os.getenv('FILTER_LEVELS')),
+        'filter_level_aliases': parse_level_aliases(os.getenv('FILTER_LEVEL_ALIASES')),
+        'filter_services': json.loads(os.getenv('FILTER_SERVICES') or '{}'),
+        'dedup_window': float(os.getenv('DEDUP_WINDOW', '0')),
+        'dedup_mask': os.getenv('DEDUP_MASK', 'false').lower() in ('1', 'true', 'yes', 'si'),
+        'dedup_max_keys': int(os.getenv('DEDUP_MAX_KEYS', '10000')),
+        'inputs': parse_log_files(os.getenv('INPUTS')),
+        'input_buffer_kb': int(os.getenv('INPUT_BUFFER_KB', '4096')),
+        'send_queue_mb': float(os.getenv('SEND_QUEUE_MB', '4')),
+        'send_concurrency': int(os.getenv('SEND_CONCURRENCY', '4')),
+        'send_rate_kbps': float(os.getenv('SEND_RATE_KBPS', '0')),
+        'send_rate_requests': float(os.getenv('SEND_RATE_REQUESTS', '0')),
+        'send_rate_burst': float(os.getenv('SEND_RATE_BURST', '2')),
+        'batch_max_bytes': int(os.getenv('BATCH_MAX_BYTES', '7500')),
+        'batch_latency_target': float(os.getenv('BATCH_LATENCY_TARGET', '1')),
+        'structured_logs': os.getenv('STRUCTURED_LOGS', 'false').lower() in ('1', 'true', 'yes', 'si'),
+        'compression': os.getenv('COMPRESSION', 'none').lower(),
+        'compression_level': int(os.getenv('COMPRESSION_LEVEL', '6')),
         'state_file': state_file_path,
         'max_retries': int(os.getenv('MAX_RETRIES', '3')),
         'retry_delay': int(os.getenv('RETRY_DELAY', '5')),
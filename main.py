@@ -75,6 +75,8 @@ def initialize_environment():
             # 1. Definir el estado inicial
             inicial_state = {
                 'last_position': 0,
+                'files': {},
+                'backfill': [],
                 'pending_batches': []
             }
              # 2. Serializar una cadena de texto JSON
@@ -89,21 +91,28 @@ def initialize_environment():
         except IOError as e:
             logger.error(u"Error creating state file: %s", str(e))
 
-    # Verificar el archivo de log
-    log_file = os.getenv('LOG_FILE')
-    if not log_file:
-        logger.error(u"LOG_FILE environment variable not set")
+    # Verificar los archivos de log (LOG_FILES admite varias rutas o patrones glob; LOG_FILE una sola ruta).
+    # Con INPUTS (sockets, stdin, FIFO) el agente puede funcionar sin archivos.
+    from config import parse_log_files
+    log_files = parse_log_files(os.getenv('LOG_FILES'), os.getenv('LOG_FILE'))
+    if not log_files and not parse_log_files(os.getenv('INPUTS')):
+        logger.error(u"LOG_FILE / LOG_FILES environment variable not set (or INPUTS)")
         sys.exit(1)
 
-    # Verificar el acceso al archivo de log
-    if not os.path.exists(log_file):
-        logger.error("Log file %s does not exist" % log_file)
-        sys.exit(1)
+    for log_file in log_files:
+        # Los patrones glob se resuelven en tiempo de ejecución; pueden no tener coincidencias todavía
+        if any(c in log_file for c in '*?['):
+            continue
 
-    # Verificar el acceso de lectura al archivo de log
-    if not os.access(log_file, os.R_OK):
-        logger.error(u"No read permissions for log file %s" % log_file)
-        sys.exit(1)
+        # Verificar el acceso al archivo de log
+        if not os.path.exists(log_file):
+            logger.error("Log file %s does not exist" % log_file)
+            sys.exit(1)
+
+        # Verificar el acceso de lectura al archivo de log
+        if not os.access(log_file, os.R_OK):
+            logger.error(u"No read permissions for log file %s" % log_file)
+            sys.exit(1)
 
 def load_env(filepath='.env'):
     """
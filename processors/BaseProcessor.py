@@ -0,0 +1,33 @@
+from __future__ import print_function, division, absolute_import, unicode_literals
+import abc
+from lib import six
+
+@six.add_metaclass(abc.ABCMeta)
+class BaseProcessor:
+
+    @abc.abstractmethod
+    def process(self, records):
+        """
+        Transform a stream of (path, line, offset) records, yielding (path, line, offset) records.
+
+        offset is where the record starts in its file (None when it has no offset to checkpoint).
+        """
+        pass
+
+    def flush(self, force=False):
+        """
+        Return the records held back whose wait expired (all of them if force is True).
+        """
+        return []
+
+    def held_offsets(self):
+        """
+        Return {path: offset} for files with records held back, so their checkpoint stays before them.
+        """
+        return {}
+
+    def stats(self):
+        """
+        Return the processor counters for the agent metrics.
+        """
+        return {}
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import re
+import json
+import time
+import datetime
+from collections import deque
+from hashlib import md5
+from processors.BaseProcessor import BaseProcessor
+
+# Segundos durante los que se suprimen las repeticiones de una línea
+WINDOW = 10.0
+# Líneas distintas que se recuerdan a la vez
+MAX_KEYS = 10000
+
+_UUID = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+# Sin literal inicial el patrón completo se prueba en cada carácter; este empieza por '-' y descarta rápido las líneas sin UUID
+_UUID_TAIL = re.compile(r'-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+_DIGITS = b'0123456789'
+
+def mask(line):
+    """
+    La línea en UTF-8 sin UUIDs ni dígitos, para que dos líneas que solo
+    difieren en ellos (fechas, ids, secuencias) coincidan. Borrar los dígitos
+    con translate() es varias veces más rápido que reemplazarlos con una regex.
+    """
+    if _UUID_TAIL.search(line):
+        line = _UUID.sub('<uuid>', line)
+    return line.encode('utf-8').translate(None, _DIGITS)
+
+def _timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+
+class DedupProcessor(BaseProcessor):
+    """
+    Suprime las líneas repetidas de un archivo durante `window` segundos
+    ("last message repeated N times"): durante un incidente un servicio puede
+    escribir miles de veces por segundo la misma línea.
+
+    La primera aparición se envía tal cual y la ventana empieza con ella. Las
+    repeticiones hasta el final de la ventana no se envían; al cerrarse, si
+    hubo alguna, sale un registro resumen en JSON con la línea, cuántas veces
+    se repitió ('count') y cuándo se vio la primera y la última repetición.
+    Con `masked`, dos líneas son iguales si lo son tras reemplazar UUIDs y
+    números (fechas, ids, secuencias).
+
+    La tabla guarda el md5 de cada línea distinta, como mucho `max_keys`; al
+    llenarse se cierra la ventana más antigua. Mientras un resumen está
+    pendiente, held_offsets() devuelve el offset de su primera repetición, para
+    que el checkpoint no dé por enviadas las repeticiones aún sin contar.
+    """
+
+    def __init__(self, window=WINDOW, masked=False, max_keys=MAX_KEYS):
+        self._window = window
+        self._masked = masked
+        self._max_keys = max(1, max_keys)
+        self._entries = {} # md5 de (ruta, línea) -> ventana {'path', 'line', 'opened', 'count', 'first', 'last', 'start'}
+        self._order = deque() # (md5, ventana) en orden de apertura; puede tener ventanas ya cerradas
+        self.suppressed_lines = 0
+        self.summaries = 0
+        self.evictions = 0
+
+    def _key(self, path, line):
+        text = mask(line) if self._masked else line.encode('utf-8')
+        return md5((path or '').encode('utf-8') + b'\n' + text).digest()
+
+    def _summary(self, entry):
+        self.summaries += 1
+        summary = {
+            'message': u"Línea repetida %d veces" % entry['count'],
+            'repeated_line': entry['line'],
+            'count': entry['count'],
+            'first_timestamp': _timestamp(entry['first']),
+            'last_timestamp': _timestamp(entry['last'])
+        }
+        return (entry['path'], json.dumps(summary, ensure_ascii=False), entry['start'])
+
+    def _close(self, key, entry):
+        """Quita la ventana de la tabla y devuelve su resumen (None si no hubo repeticiones)."""
+        del self._entries[key]
+        return self._summary(entry) if entry['count'] else None
+
+    def process(self, records):
+        for path, line, start in records:
+            now = time.time()
+            key = self._key(path, line)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['opened'] >= self._window:
+                summary = self._close(key, entry)
+                if summary is not None:
+                    yield summary
+                entry = None
+            if entry is not None:
+                if not entry['count']:
+                    entry['first'] = now
+                    entry['start'] = start
+                elif start is None or (entry['start'] is not None and start < entry['start']):
+                    # Repetición sin offset o de un archivo rotado: el offset guardado ya no es del archivo actual
+                    entry['start'] = None
+                entry['count'] += 1
+                entry['last'] = now
+                self.suppressed_lines += 1
+                continue
+            while len(self._entries) >= self._max_keys:
+                old_key, old_entry = self._order.popleft()
+                if self._entries.get(old_key) is old_entry:
+                    self.evictions += 1
+                    summary = self._close(old_key, old_entry)
+                    if summary is not None:
+                        yield summary
+            entry = {'path': path, 'line': line, 'opened': now, 'count': 0, 'first': None, 'last': None, 'start': None}
+            self._entries[key] = entry
+            self._order.append((key, entry))
+            yield (path, line, start)
+
+    def flush(self, force=False):
+        now = time.time()
+        summaries = []
+        while self._order and (force or now - self._order[0][1]['opened'] >= self._window):
+            key, entry = self._order.popleft()
+            if self._entries.get(key) is entry:
+                summary = self._close(key, entry)
+                if summary is not None:
+                    summaries.append(summary)
+        return summaries
+
+    def held_offsets(self):
+        held = {}
+        for entry in self._entries.values():
+            path, start = entry['path'], entry['start']
+            if entry['count'] and start is not None and (path not in held or start < held[path]):
+                held[path] = start
+        return held
+
+    def stats(self):
+        return {
+            'dedup_suppressed_lines': self.suppressed_lines,
+            'dedup_summaries': self.summaries,
+            'dedup_keys': len(self._entries),
+            'dedup_evictions': self.evictions
+        }
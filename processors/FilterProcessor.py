@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import re
+from lib import six
+from processors.BaseProcessor import BaseProcessor
+
+# Nivel de la línea: campo "level" de los logs JSON o 'entorno.NIVEL:' de Laravel ([fecha] production.ERROR: ...)
+LEVEL_PATTERN = r'"level"\s*:\s*"([^"]*)"|^\[[^\]]*\]\s+\w+\.(\w+):'
+# Servicio de la línea: campo "service" de los logs JSON
+SERVICE_PATTERN = r'"service"\s*:\s*"([^"]*)"'
+
+# Nombre que usan las aplicaciones -> nivel normalizado (en minúsculas)
+LEVEL_ALIASES = {
+    'debug': 'debug', 'dbg': 'debug', 'trace': 'debug', 'depuracion': 'debug', 'cache': 'debug',
+    'info': 'info', 'inf': 'info', 'information': 'info', 'informacion': 'info', 'access': 'info',
+    'acceso': 'info', 'success': 'info', 'exitoso': 'info', 'sent': 'info', 'enviado': 'info',
+    'notification': 'info', 'backup_info': 'info',
+    'notice': 'notice', 'maintenance': 'notice', 'mantenimiento': 'notice', 'scheduled': 'notice',
+    'warning': 'warning', 'warn': 'warning', 'war': 'warning', 'advertencia': 'warning', 'alerta': 'warning',
+    'caution': 'warning', 'limite': 'warning', 'throttle': 'warning',
+    'error': 'error', 'err': 'error', 'failure': 'error', 'fail': 'error', 'fallo': 'error', 'error_auth': 'error',
+    'critical': 'critical', 'crit': 'critical', 'critico': 'critical', 'fatal': 'critical', 'alert': 'critical',
+    'emergency': 'critical', 'emerg': 'critical', 'security': 'critical', 'alerta_seguridad': 'critical'
+}
+
+class FilterProcessor(BaseProcessor):
+    """
+    Descarta líneas antes del batching, así no cuestan serialización ni red.
+
+    - `include`: regex que la línea debe contener (search) para enviarse.
+    - `exclude`: regex de las líneas que no se envían.
+    - `levels`: niveles que se envían. El nivel se toma de la línea con
+      LEVEL_PATTERN y se normaliza con LEVEL_ALIASES (más `aliases`): 'warn',
+      'war', 'advertencia' y 'alerta' son 'warning'. Las líneas sin nivel
+      reconocible se envían.
+    - `services`: reglas por servicio (campo "service" de la línea),
+      {servicio: {'include', 'exclude', 'levels'}} (levels como lista o
+      separados por comas). Sus `levels` reemplazan a
+      los generales para ese servicio; `include` y `exclude` se suman a los
+      generales.
+
+    Los patrones se compilan una sola vez. Cada línea descartada cuenta en la
+    regla que la descartó ('exclude', 'include', 'levels' o
+    'servicio/regla'). Las líneas descartadas no se retienen: el checkpoint
+    avanza sobre ellas como sobre las enviadas.
+    """
+
+    def __init__(self, include=None, exclude=None, levels=None, aliases=None, services=None,
+                 level_pattern=LEVEL_PATTERN, service_pattern=SERVICE_PATTERN):
+        self._aliases = dict(LEVEL_ALIASES)
+        for alias, level in (aliases or {}).items():
+            self._aliases[alias.strip().lower()] = level.strip().lower()
+        self._level = re.compile(level_pattern)
+        self._service = re.compile(service_pattern)
+        self._rules = self._compile(include, exclude, levels)
+        self._service_rules = {}
+        for service, rules in (services or {}).items():
+            self._service_rules[service] = self._compile(rules.get('include'), rules.get('exclude'), rules.get('levels'), service + '/')
+        self.hits = dict((name, 0) for _, name, _ in self._all_rules())
+        self.filtered_lines = 0
+
+    def _compile(self, include, exclude, levels, prefix=''):
+        """Reglas (tipo, nombre, regex o conjunto de niveles) en el orden en que se aplican."""
+        rules = []
+        if isinstance(levels, six.string_types):
+            levels = [level for level in levels.split(',') if level.strip()]
+        if levels:
+            rules.append(('levels', prefix + 'levels', set(self._normalize(level) for level in levels)))
+        if exclude:
+            rules.append(('exclude', prefix + 'exclude', re.compile(exclude)))
+        if include:
+            rules.append(('include', prefix + 'include', re.compile(include)))
+        return rules
+
+    def _all_rules(self):
+        rules = list(self._rules)
+        for service_rules in self._service_rules.values():
+            rules.extend(service_rules)
+        return rules
+
+    def _normalize(self, level):
+        level = level.strip().lower()
+        return self._aliases.get(level, level)
+
+    def level(self, line):
+        """Nivel normalizado de la línea (None si no tiene)."""
+        match = self._level.search(line)
+        level = match.group(match.lastindex) if match is not None and match.lastindex else None
+        return self._normalize(level) if level else None
+
+    def _rejected_by(self, line):
+        """Nombre de la regla que descarta la línea, o None si se envía."""
+        rules = self._rules
+        if self._service_rules:
+            match = self._service.search(line)
+            service_rules = self._service_rules.get(match.group(1)) if match else None
+            if service_rules:
+                # Los niveles del servicio reemplazan a los generales
+                if any(kind == 'levels' for kind, _, _ in service_rules):
+                    rules = [rule for rule in rules if rule[0] != 'levels']
+                rules = service_rules + rules
+        level = False # Aún sin buscar: solo se extrae si hay una regla de niveles
+        for kind, name, rule in rules:
+            if kind == 'levels':
+                if level is False:
+                    level = self.level(line)
+                if level is not None and level not in rule:
+                    return name
+            elif kind == 'exclude':
+                if rule.search(line):
+                    return name
+            elif not rule.search(line):
+                return name
+        return None
+
+    def process(self, records):
+        for path, line, start in records:
+            name = self._rejected_by(line)
+            if name is None:
+                yield (path, line, start)
+            else:
+                self.hits[name] += 1
+                self.filtered_lines += 1
+
+    def stats(self):
+        return {
+            'filtered_lines': self.filtered_lines,
+            'filter_hits': dict((name, count) for name, count in self.hits.items() if count)
+        }
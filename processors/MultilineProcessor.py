@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import re
+import time
+import logging
+from processors.BaseProcessor import BaseProcessor
+from agents.BatchBuilder import encode
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo (bytes del evento codificado en JSON) de un evento; LogAgent pasa su límite por línea
+MAX_EVENT_SIZE = 6000
+# Segundos sin líneas nuevas de un archivo tras los que se envía el evento en curso
+FLUSH_TIMEOUT = 1.0
+
+class MultilineProcessor(BaseProcessor):
+    """
+    Une en un solo evento las líneas de un stack trace (PHP/Laravel, Java,
+    Python...) para que el batching vea una excepción como un único registro.
+
+    - `start`: regex de la línea que inicia un evento (p. ej. la fecha de
+      Laravel). Con solo este patrón, toda línea que no lo cumple continúa el
+      evento anterior.
+    - `continuation`: regex de las líneas que continúan un evento (p. ej.
+      '#0 ...', '    at ...'). Con ambos patrones, una línea que no cumple
+      ninguno es un evento propio.
+
+    Los patrones se compilan una sola vez y se aplican con match() (anclados al
+    inicio de la línea). Cada archivo lleva su propio evento en curso, que se
+    emite al llegar la siguiente línea de inicio, al superar max_event_size o
+    tras `timeout` segundos sin líneas nuevas de ese archivo.
+
+    El tamaño de un evento se mide como el del string JSON que arma el
+    batching (encode(): acentos en UTF-8, comillas y tabs escapados), que es
+    lo que se compara con el límite por línea del agente: un evento que no
+    supera max_event_size no se recorta con '...[TRUNCATED]'. Cada '\\n' del
+    evento ocupa 2 bytes ya escapado, los mismos que las comillas de la línea
+    que se une, así que el evento crece en len(encode(línea)).
+
+    El evento sale como (ruta, líneas unidas con '\\n', offset donde empieza
+    su primera línea). Mientras está retenido, held_offsets() devuelve ese
+    offset, para que el checkpoint no lo dé por enviado.
+    """
+
+    def __init__(self, start=None, continuation=None, max_event_size=MAX_EVENT_SIZE, timeout=FLUSH_TIMEOUT):
+        if not start and not continuation:
+            raise ValueError(u"MultilineProcessor: Se necesita un patrón de inicio o de continuación.")
+        self._start = re.compile(start) if start else None
+        self._continuation = re.compile(continuation) if continuation else None
+        self._max_event_size = max_event_size
+        self._timeout = timeout
+        self._events = {} # ruta -> evento en curso {'lines', 'size', 'start', 'time'}
+        self._last_start = {} # ruta -> offset de la última línea recibida con offset
+        self.multiline_events = 0
+        self.merged_lines = 0
+        self.split_events = 0
+
+    def _is_continuation(self, line):
+        if self._start is not None and self._start.match(line):
+            return False
+        if self._continuation is not None:
+            return self._continuation.match(line) is not None
+        return True
+
+    def _emit(self, path):
+        event = self._events.pop(path)
+        if len(event['lines']) > 1:
+            self.multiline_events += 1
+            return (path, u"\n".join(event['lines']), event['start'])
+        return (path, event['lines'][0], event['start'])
+
+    def process(self, records):
+        for path, line, start in records:
+            event = self._events.get(path)
+            if start is not None:
+                last_start = self._last_start.get(path)
+                if last_start is not None and start < last_start and event is not None:
+                    # El offset retrocedió: el archivo rotó o se truncó y la línea no continúa el evento anterior
+                    yield self._emit(path)
+                    event = None
+                self._last_start[path] = start
+
+            if event is not None and self._is_continuation(line):
+                size = len(encode(line))
+                if event['size'] + size <= self._max_event_size:
+                    event['lines'].append(line)
+                    event['size'] += size
+                    if start is None:
+                        # Línea del archivo ya rotado: el offset del evento no es del archivo actual
+                        event['start'] = None
+                    event['time'] = time.time()
+                    self.merged_lines += 1
+                    continue
+                logger.debug(u"MultilineProcessor: Evento de %s supera %d bytes; se envía dividido.", path, self._max_event_size)
+                self.split_events += 1
+            if event is not None:
+                yield self._emit(path)
+            self._events[path] = {'lines': [line], 'size': len(encode(line)), 'start': start, 'time': time.time()}
+
+    def flush(self, force=False):
+        now = time.time()
+        expired = [path for path, event in self._events.items() if force or now - event['time'] >= self._timeout]
+        return [self._emit(path) for path in sorted(expired)]
+
+    def held_offsets(self):
+        held = {}
+        for path, event in self._events.items():
+            if event['start'] is not None:
+                held[path] = event['start']
+        return held
+
+    def stats(self):
+        return {
+            'multiline_events': self.multiline_events,
+            'multiline_merged_lines': self.merged_lines,
+            'multiline_split_events': self.split_events
+        }
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import re
+import glob
+import logging
+from readers.CompressedLogReader import CompressedLogReader
+from readers.FileLogReader import MAX_LINE_BYTES
+from readers.Fingerprint import digest
+
+logger = logging.getLogger(__name__)
+
+# Sufijos de logrotate: app.log.1, app.log.2.gz, app.log.3.bz2, app.log-20240101.gz (dateext)
+ROTATED_SUFFIX = re.compile(r'^[.-]\d+(\.gz|\.bz2)?$')
+
+def find_rotated_files(path):
+    """Devuelve los archivos rotados (comprimidos o no) que logrotate generó a partir de `path`."""
+    rotated = []
+    for candidate in glob.glob(path + '[.-]*'):
+        if ROTATED_SUFFIX.match(candidate[len(path):]) and os.path.isfile(candidate):
+            rotated.append(candidate)
+    return rotated
+
+class BackfillReader(object):
+    """
+    Envía los archivos rotados que quedaron sin leer porque el agente estaba
+    detenido durante una rotación (incluidos los que logrotate ya comprimió).
+
+    Cada entrada de la cola es un dict serializable en el estado:
+    {'path', 'source', 'inode', 'position', 'done'}. 'position' es el offset
+    descomprimido ya enviado, de modo que tras un reinicio se continúa en la
+    misma línea. Como logrotate renombra (app.log.2.gz -> app.log.3.gz), la
+    entrada se vuelve a localizar por inode si su ruta ya no existe.
+    """
+
+    def __init__(self, entries=None, max_line_bytes=MAX_LINE_BYTES):
+        self.entries = [entry for entry in (entries or []) if not entry.get('done')]
+        self._max_line_bytes = max_line_bytes
+        self.truncated_lines = 0
+        self.dropped_bytes = 0
+        self._reader = None
+        self._entry = None
+
+    def plan(self, source_path, file_state):
+        """
+        Añade a la cola los archivos rotados de `source_path` con datos sin enviar.
+
+        `file_state` es el checkpoint guardado del archivo (position, inode, mtime,
+        fingerprint). Son candidatos los rotados modificados después de ese
+        checkpoint. El que estaba siendo leído continúa desde la posición guardada
+        y el resto desde 0. Se reconoce por el hash de sus primeros bytes
+        descomprimidos, que no cambia al comprimirse ni depende del inode; con
+        checkpoints sin fingerprint se usa el inode o, si ya fue comprimido, el
+        candidato más antiguo.
+        """
+        saved_mtime = file_state.get('mtime')
+        if saved_mtime is None:
+            logger.info(u"BackfillReader: El checkpoint de %s no tiene mtime (estado antiguo). No se buscan archivos rotados.", source_path)
+            return []
+
+        fingerprint = file_state.get('fingerprint')
+        queued = set(entry['inode'] for entry in self.entries)
+        candidates = []
+        for path in find_rotated_files(source_path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_ino in queued:
+                continue
+            if stat.st_mtime >= saved_mtime or (not fingerprint and stat.st_ino == file_state.get('inode')):
+                candidates.append((stat.st_mtime, path, stat.st_ino))
+        candidates.sort()
+
+        added = []
+        if fingerprint:
+            matches = [c for c in candidates if self._same_head(c[1], fingerprint)]
+            resumed = matches[0] if matches else None
+        else:
+            same_inode = [c for c in candidates if c[2] == file_state.get('inode')]
+            resumed = same_inode[0] if same_inode else (candidates[0] if candidates else None)
+        for mtime, path, inode in candidates:
+            entry = {
+                'path': path,
+                'source': source_path,
+                'inode': inode,
+                'position': file_state.get('position', 0) if (mtime, path, inode) == resumed else 0,
+                'done': False
+            }
+            logger.info(u"BackfillReader: Se enviará el archivo rotado %s desde el offset %s.", path, entry['position'])
+            self.entries.append(entry)
+            added.append(entry)
+        return added
+
+    def resume(self, source_path, checkpoint):
+        """
+        Añade a la cola el archivo rotado que FileLogReader estaba drenando al
+        detenerse el agente (checkpoint['rotated']), desde el offset guardado.
+        Se reconoce por inode o, si logrotate ya lo comprimió, por el hash de
+        sus primeros bytes descomprimidos. Devuelve la entrada o None.
+        """
+        fingerprint = checkpoint.get('fingerprint')
+        queued = set(entry['inode'] for entry in self.entries)
+        for path in find_rotated_files(source_path):
+            try:
+                inode = os.stat(path).st_ino
+            except OSError:
+                continue
+            if inode in queued or (inode != checkpoint.get('inode') and not fingerprint):
+                continue
+            if fingerprint and not self._same_head(path, fingerprint):
+                continue
+            entry = {'path': path, 'source': source_path, 'inode': inode, 'position': checkpoint.get('position', 0), 'done': False}
+            logger.info(u"BackfillReader: Se terminará de enviar el archivo rotado %s desde el offset %s.", path, entry['position'])
+            self.entries.append(entry)
+            return entry
+        logger.warning(u"BackfillReader: No se encontró el archivo rotado de %s que quedó sin terminar de leer.", source_path)
+        return None
+
+    def _same_head(self, path, fingerprint):
+        """True si los primeros bytes descomprimidos de `path` coinciden con la cabecera del fingerprint."""
+        head_len = fingerprint.get('head_len', 0)
+        head = CompressedLogReader(path).read_prefix(head_len)
+        return len(head) == head_len and digest(head) == fingerprint.get('head')
+
+    def pending(self):
+        return any(not entry['done'] for entry in self.entries)
+
+    def _locate(self, entry):
+        """Ruta actual de la entrada: la guardada o, si logrotate la renombró, la que tenga su inode."""
+        try:
+            if os.stat(entry['path']).st_ino == entry['inode']:
+                return entry['path']
+        except OSError:
+            pass
+        for path in find_rotated_files(entry['source']):
+            try:
+                if os.stat(path).st_ino == entry['inode']:
+                    return path
+            except OSError:
+                continue
+        return None
+
+    def _open_next(self):
+        for entry in self.entries:
+            if entry['done']:
+                continue
+            path = self._locate(entry)
+            if path is None:
+                logger.warning(u"BackfillReader: El archivo rotado %s ya no existe. Se omite.", entry['path'])
+                entry['done'] = True
+                continue
+            entry['path'] = path
+            self._entry = entry
+            self._reader = CompressedLogReader(path, start_position=entry['position'], max_line_bytes=self._max_line_bytes)
+            return True
+        return False
+
+    def read(self, max_lines=None, max_bytes=None):
+        """Devuelve una lista de tuplas (ruta, línea, offset descomprimido donde empieza la línea) del siguiente archivo rotado pendiente."""
+        while self._reader is not None or self._open_next():
+            entry = self._entry
+            reader = self._reader
+            truncated, dropped = reader.truncated_lines, reader.dropped_bytes
+            lines = reader.read(max_lines=max_lines, max_bytes=max_bytes, with_offsets=True)
+            self.truncated_lines += reader.truncated_lines - truncated
+            self.dropped_bytes += reader.dropped_bytes - dropped
+            entry['position'] = self._reader.get_current_position()
+            if self._reader.finished:
+                logger.info(u"BackfillReader: Archivo rotado %s leído por completo.", entry['path'])
+                entry['done'] = True
+                self._reader = None
+                self._entry = None
+            if lines:
+                return [(entry['path'], line, start) for line, start in lines]
+        return []
+
+    def state(self, held=None):
+        """
+        Entradas aún no terminadas, para guardar en el estado. `held` ({ruta: offset})
+        retrasa la posición de las entradas con líneas retenidas aún sin enviar.
+        """
+        held = held or {}
+        entries = []
+        for entry in self.entries:
+            if entry['path'] in held and held[entry['path']] < entry['position']:
+                entries.append(dict(entry, position=held[entry['path']], done=False))
+            elif not entry['done']:
+                entries.append(dict(entry))
+        return entries
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import io
+import bz2
+import zlib
+import logging
+from readers.BaseLogReader import BaseLogReader
+from readers.FileLogReader import CHUNK_SIZE, MAX_LINE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Máximo de bytes descomprimidos por llamada al descompresor, para acotar la memoria con ratios altos
+MAX_DECOMPRESSED_CHUNK = 4 * CHUNK_SIZE
+
+# BZ2Decompressor.decompress() acepta max_length desde Python 3.5
+BZ2_MAX_LENGTH = hasattr(bz2.BZ2Decompressor(), 'needs_input')
+
+# Sin max_length, bloques comprimidos pequeños para que cada llamada entregue poco
+BZ2_CHUNK_SIZE = 4 * 1024
+
+class CompressedLogReader(BaseLogReader):
+    """
+    Lee de principio a fin un archivo de log rotado, comprimido con gzip (.gz)
+    o bzip2 (.bz2), o sin comprimir (por ejemplo app.log.1).
+
+    Descomprime en bloques con memoria acotada y lleva el offset en bytes
+    *descomprimidos* de la última línea entregada, que coincide con el offset
+    que tenía la línea en el archivo original antes de comprimirse.
+    """
+
+    def __init__(self, file_path, start_position=0, chunk_size=CHUNK_SIZE, max_line_bytes=MAX_LINE_BYTES):
+        super(CompressedLogReader, self).__init__(file_path)
+        self._file = None
+        self._decompressor = None
+        self._chunk_size = chunk_size
+        if file_path.endswith('.bz2') and not BZ2_MAX_LENGTH:
+            self._chunk_size = min(chunk_size, BZ2_CHUNK_SIZE)
+        self._unconsumed = b'' # Datos comprimidos aún no entregados al descompresor
+        self._position = start_position # Offset descomprimido del final de la última línea entregada
+        self._skip = start_position # Bytes descomprimidos ya enviados en una ejecución anterior
+        self._buffer = b''
+        self._pending = []
+        self._max_line_bytes = max_line_bytes
+        self._discard = 0 # Bytes descartados de la línea larga en curso
+        self._pending_skip = 0 # Bytes descartados de la primera línea de _pending
+        self.truncated_lines = 0
+        self.dropped_bytes = 0
+        self.finished = False
+
+    def _new_decompressor(self):
+        if self.resource.endswith('.gz'):
+            # 16 + MAX_WBITS: formato gzip (cabecera y CRC) en lugar de zlib crudo
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.resource.endswith('.bz2'):
+            return bz2.BZ2Decompressor()
+        return None
+
+    def _open_file(self):
+        if self._file is not None:
+            return True
+        try:
+            self._file = io.open(self.resource, 'rb')
+        except (IOError, OSError) as e:
+            logger.error(u"CompressedLogReader: Error al abrir %s: %s", self.resource, e)
+            return False
+        self._decompressor = self._new_decompressor()
+        if self._skip:
+            logger.info(u"CompressedLogReader: Reanudando %s en el offset descomprimido %s.", self.resource, self._skip)
+        return True
+
+    def _decompress(self, data):
+        """Descomprime un bloque y prepara el siguiente miembro si el stream actual terminó."""
+        decompressor = self._decompressor
+        if isinstance(decompressor, bz2.BZ2Decompressor):
+            try:
+                if not BZ2_MAX_LENGTH:
+                    output = decompressor.decompress(data)
+                else:
+                    if not decompressor.needs_input:
+                        # Aún retiene salida de la entrada anterior: se pide sin añadir más datos
+                        self._unconsumed = data + self._unconsumed
+                        data = b''
+                    output = decompressor.decompress(data, MAX_DECOMPRESSED_CHUNK)
+            except EOFError:
+                # El stream anterior ya terminó: estos datos son del siguiente
+                self._unconsumed = data + self._unconsumed
+                self._decompressor = self._new_decompressor()
+                return b''
+        else:
+            output = decompressor.decompress(data, MAX_DECOMPRESSED_CHUNK)
+            self._unconsumed = decompressor.unconsumed_tail
+
+        unused = getattr(decompressor, 'unused_data', b'')
+        if unused:
+            # Archivos con varios miembros concatenados (p. ej. 'gzip >>' o pbzip2)
+            self._unconsumed = unused + self._unconsumed
+            self._decompressor = self._new_decompressor()
+        return output
+
+    def _next_data(self):
+        """Devuelve el siguiente bloque descomprimido, o b'' al final del archivo."""
+        while True:
+            if self._unconsumed:
+                compressed = self._unconsumed
+                self._unconsumed = b''
+            else:
+                compressed = self._file.read(self._chunk_size)
+
+            if not compressed:
+                if self._decompressor is None:
+                    return b''
+                if isinstance(self._decompressor, bz2.BZ2Decompressor):
+                    # Fin del archivo: lo que bz2 aún retenga por el límite de max_length
+                    if not BZ2_MAX_LENGTH or self._decompressor.needs_input or self._decompressor.eof:
+                        return b''
+                    data = self._decompress(b'')
+                else:
+                    # Fin del archivo: lo que zlib aún retenga internamente
+                    data = self._decompressor.flush()
+                    self._decompressor = None
+                    if not data:
+                        return b''
+            elif self._decompressor is None:
+                data = compressed
+            else:
+                data = self._decompress(compressed)
+
+            if self._skip:
+                # Lo ya enviado se descarta sin separar en líneas ni decodificar
+                dropped = min(self._skip, len(data))
+                data = data[dropped:]
+                self._skip -= dropped
+            if data:
+                return data
+
+    def read_prefix(self, length):
+        """Devuelve los primeros `length` bytes descomprimidos y cierra el archivo (para comparar fingerprints)."""
+        if not self._open_file():
+            return b''
+        data = b''
+        try:
+            while len(data) < length:
+                chunk = self._next_data()
+                if not chunk:
+                    break
+                data += chunk
+        except (IOError, OSError, EOFError, zlib.error) as e:
+            logger.warning(u"CompressedLogReader: No se pudo leer el inicio de %s: %s", self.resource, e)
+        finally:
+            self.close()
+        return data[:length]
+
+    def _decode(self, raw_line):
+        return raw_line.strip().decode('utf-8', 'ignore')
+
+    def _truncated(self, line_size):
+        dropped = line_size - self._max_line_bytes
+        self.truncated_lines += 1
+        self.dropped_bytes += dropped
+        logger.warning(u"CompressedLogReader: Línea de %d bytes en %s recortada a %d bytes (%d bytes descartados).", line_size, self.resource, self._max_line_bytes, dropped)
+
+    def read(self, max_lines=None, timeout=None, max_bytes=None, with_offsets=False):
+        """
+        Devuelve hasta max_lines líneas (o hasta max_bytes bytes descomprimidos);
+        con with_offsets=True, tuplas (línea, offset descomprimido donde empieza).
+        El archivo es estático, por lo que no se espera timeout: al llegar al
+        final se entrega la última línea sin '\\n' (si la hay), se cierra el
+        archivo y finished pasa a True.
+        """
+        if self.finished or not self._open_file():
+            return []
+
+        lines = []
+        read_bytes = 0
+        while (not max_lines or len(lines) < max_lines) and (not max_bytes or read_bytes < max_bytes):
+            if not self._pending:
+                try:
+                    data = self._next_data()
+                except (IOError, OSError, EOFError, zlib.error) as e:
+                    logger.error(u"CompressedLogReader: Archivo %s dañado o incompleto: %s. Se da por terminado.", self.resource, e)
+                    data = b''
+                if not data:
+                    if self._buffer:
+                        if self._discard:
+                            self._truncated(len(self._buffer) + self._discard)
+                        line_start = self._position
+                        self._position += len(self._buffer) + self._discard
+                        line = self._decode(self._buffer)
+                        lines.append((line, line_start) if with_offsets else line)
+                        self._buffer = b''
+                    self.close()
+                    self.finished = True
+                    break
+                if self._discard:
+                    # Resto de una línea demasiado larga: se descarta hasta su '\n'
+                    newline = data.find(b'\n')
+                    if newline < 0:
+                        self._discard += len(data)
+                        continue
+                    self._discard += newline
+                    data = data[newline:]
+                    self._pending_skip = self._discard
+                    self._discard = 0
+                parts = (self._buffer + data).split(b'\n')
+                self._buffer = parts.pop()
+                if self._max_line_bytes and len(self._buffer) > self._max_line_bytes:
+                    self._discard = len(self._buffer) - self._max_line_bytes
+                    self._buffer = self._buffer[:self._max_line_bytes]
+                self._pending = parts
+                continue
+
+            count = 0
+            for raw_line in self._pending:
+                if (max_lines and len(lines) >= max_lines) or (max_bytes and read_bytes >= max_bytes):
+                    break
+                line_start = self._position
+                if self._pending_skip:
+                    self._truncated(len(raw_line) + self._pending_skip)
+                    self._position += self._pending_skip
+                    read_bytes += self._pending_skip
+                    self._pending_skip = 0
+                self._position += len(raw_line) + 1
+                read_bytes += len(raw_line) + 1
+                if self._max_line_bytes and len(raw_line) > self._max_line_bytes:
+                    self._truncated(len(raw_line))
+                    raw_line = raw_line[:self._max_line_bytes]
+                lines.append((self._decode(raw_line), line_start) if with_offsets else self._decode(raw_line))
+                count += 1
+            del self._pending[:count]
+        return lines
+
+    def get_current_position(self):
+        return self._position
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -4,17 +4,208 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 import time
 import os
 import logging
+import mmap
 from readers.BaseLogReader import BaseLogReader
+from readers.FileWatcher import create_file_watcher
+from readers.PageCache import fadvise, POSIX_FADV_SEQUENTIAL, POSIX_FADV_WILLNEED, POSIX_FADV_DONTNEED
+from readers.Fingerprint import HEAD_SIZE, TAIL_SIZE, SAME, ROTATED, classify, make_fingerprint, read_range
 import io
 
 logger = logging.getLogger(__name__)
 
+# Tamaño de cada bloque leído del disco. Bloques grandes reducen las llamadas
+# al sistema cuando la aplicación escribe decenas de miles de líneas por segundo.
+CHUNK_SIZE = 64 * 1024
+
+# Modo catch-up: con más de CATCHUP_THRESHOLD bytes de retraso el lector mapea
+# en memoria la región pendiente y busca los '\n' con mmap.find() en vez de leer
+# bloque a bloque. Vuelve al tail normal cuando el retraso baja de CATCHUP_EXIT.
+CATCHUP_THRESHOLD = 8 * 1024 * 1024
+CATCHUP_EXIT = 1024 * 1024
+CATCHUP_MAP_SIZE = 32 * 1024 * 1024 # Ventana mapeada; se remapea al agotarla, así las páginas residentes no crecen con el backlog
+CATCHUP_BLOCK = 1024 * 1024 # Bytes de líneas extraídos del mapa por cada bloque
+
+# Segundos que el archivo rotado sigue abierto para los escritores que tardan en reabrir el log
+ROTATE_WAIT = 5
+
+# Page cache: lo ya enviado y guardado en el checkpoint se libera (POSIX_FADV_DONTNEED)
+# en ventanas alineadas de DROP_CACHE_WINDOW bytes, para no desplazar la caché de
+# otros procesos del host con logs que solo se leen una vez.
+DROP_CACHE_WINDOW = 16 * 1024 * 1024
+# Bytes que se piden por adelantado al kernel (POSIX_FADV_WILLNEED) durante el catch-up
+CATCHUP_READAHEAD = 8 * 1024 * 1024
+
+# Máximo de bytes por línea. Del resto de una línea más larga solo se cuentan
+# los bytes (se descartan mientras se leen), por lo que nunca se acumula en memoria.
+MAX_LINE_BYTES = 64 * 1024
+
 class FileLogReader(BaseLogReader):
-    def __init__(self, file_path):
-        super(FileLogReader, self).__init__(file_path) 
-        self._file = None # Archivo de log
-        self._position = 0 # Posición en el archivo
+    def __init__(self, file_path, chunk_size=CHUNK_SIZE, watcher=None, rotate_wait=ROTATE_WAIT,
+                 catchup_threshold=CATCHUP_THRESHOLD, max_line_bytes=MAX_LINE_BYTES, drop_cache=True,
+                 readahead=CATCHUP_READAHEAD):
+        super(FileLogReader, self).__init__(file_path)
+        self._file = None # Archivo de log (modo binario)
+        self._position = 0 # Offset en bytes del final de la última línea entregada
         self._inode = None # Inode del archivo
+        self._chunk_size = chunk_size
+        self._buffer = b'' # Línea parcial (sin '\n') pendiente del bloque anterior
+        self._pending = [] # Líneas completas (bytes) leídas pero aún no entregadas
+        self._max_line_bytes = max_line_bytes # None desactiva el límite
+        self._discard = 0 # Bytes descartados de la línea larga en curso (su inicio está en _buffer)
+        self._pending_skip = 0 # Bytes descartados de la primera línea de _pending, que cuentan para el offset
+        self.truncated_lines = 0 # Líneas recortadas a max_line_bytes
+        self.dropped_bytes = 0 # Bytes descartados de esas líneas
+        self._rotate_wait = rotate_wait
+        self._rotated = None # Archivo anterior a la rotación, abierto durante el periodo de gracia
+        self._catchup_threshold = catchup_threshold # None desactiva el modo catch-up
+        self._catching_up = False
+        self._map = None # mmap de la región pendiente durante el catch-up
+        self._map_offset = 0 # Offset en el archivo donde empieza el mapa (alineado)
+        self._map_pos = 0 # Siguiente byte del mapa por procesar
+        self._head = None # Primeros HEAD_SIZE bytes del archivo (fingerprint)
+        self._tail = None # Últimos TAIL_SIZE bytes entregados, justo antes de _position (fingerprint)
+        self._resume_check = None # (checkpoint, liberado) del archivo anterior a una rotación o a release(), para comparar contenido
+        self.lost_checkpoint = None # Checkpoint de un archivo que rotó mientras estaba liberado (para el backfill)
+        self._drop_cache = drop_cache
+        self._cache_dropped = 0 # Offset hasta el que ya se liberó la page cache
+        self._readahead = readahead # 0 desactiva el readahead explícito del catch-up
+        self._readahead_upto = 0 # Offset hasta el que ya se pidió readahead
+        self.cache_released_bytes = 0 # Bytes liberados de la page cache con POSIX_FADV_DONTNEED
+        self.bytes_read = 0 # Total de bytes entregados (líneas más su '\n'), para repartir presupuestos y métricas
+        self._idle = False # True tras llegar a EOF: la siguiente lectura verifica primero que no hubo truncamiento
+        # Notificador de cambios (inotify o polling). Si se recibe uno externo, se comparte y no se cierra aquí.
+        self._owns_watcher = watcher is None
+        self._watcher = watcher or create_file_watcher()
+
+    def _reset_buffers(self):
+        """Descarta los bytes leídos que aún no se han entregado como líneas."""
+        self._close_map(seek=False)
+        self._catching_up = False
+        self._buffer = b''
+        self._pending = []
+        self._discard = 0
+        self._pending_skip = 0
+
+    def _start_catchup(self):
+        """
+        Mapea en memoria la región entre la posición actual y EOF si el retraso
+        supera el umbral (o CATCHUP_EXIT si ya se está en catch-up).
+        Solo se hace sin bytes pendientes, cuando el descriptor está exactamente en _position.
+        """
+        if self._catchup_threshold is None or self._map is not None or self._buffer or self._pending or self._discard:
+            return False
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            lag = size - self._position
+            if lag < (CATCHUP_EXIT if self._catching_up else self._catchup_threshold):
+                if self._catching_up:
+                    logger.info(u"FileLogReader: Catch-up completado para %s. Volviendo al tail normal.", self.resource)
+                    self._catching_up = False
+                return False
+
+            offset = self._position - self._position % mmap.ALLOCATIONGRANULARITY
+            length = min(size - offset, CATCHUP_MAP_SIZE)
+            self._map = mmap.mmap(self._file.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+            self._map_offset = offset
+            self._map_pos = self._position - offset
+            if not self._catching_up:
+                logger.info(u"FileLogReader: %s tiene %d bytes de retraso. Entrando en modo catch-up (mmap).", self.resource, lag)
+            self._catching_up = True
+            return True
+        except (EnvironmentError, ValueError, OverflowError) as e:
+            logger.warning(u"FileLogReader: No se pudo mapear %s en memoria (%s). Se continúa con lectura por bloques.", self.resource, e)
+            self._map = None
+            self._catching_up = False
+            return False
+
+    def _read_mapped_block(self):
+        """
+        Extrae hasta CATCHUP_BLOCK bytes de líneas completas del mapa usando
+        mmap.find(). Al agotar el mapa (o no encontrar más '\n') lo libera y
+        deja el descriptor en el primer byte no extraído.
+        """
+        mm = self._map
+        map_len = len(mm)
+        # Un truncamiento (copytruncate) con el mapa activo provocaría SIGBUS al acceder a él
+        if os.fstat(self._file.fileno()).st_size < self._map_offset + map_len:
+            logger.info(u"FileLogReader: %s se redujo durante el catch-up. Liberando el mapa.", self.resource)
+            self._close_map()
+            return []
+
+        pos = self._map_pos
+        self._advise_readahead(self._map_offset + pos)
+        # Último '\n' dentro del bloque; si una línea es más larga que el bloque, el primero tras él
+        newline = mm.rfind(b'\n', pos, min(pos + CATCHUP_BLOCK, map_len))
+        if newline < 0:
+            newline = mm.find(b'\n', pos)
+            if newline >= 0 and self._max_line_bytes and newline - pos > self._max_line_bytes:
+                # Línea más larga que el límite: solo se copia su inicio
+                lines = [mm[pos:pos + self._max_line_bytes]]
+                self._pending_skip = newline - pos - self._max_line_bytes
+                self._map_pos = newline + 1
+                if self._map_pos >= map_len:
+                    self._close_map()
+                return lines
+        if newline < 0:
+            # Solo queda una línea incompleta: la terminará el tail normal
+            self._close_map()
+            return []
+
+        lines = mm[pos:newline].split(b'\n')
+        self._map_pos = newline + 1
+        if self._map_pos >= map_len:
+            self._close_map()
+        return lines
+
+    def _advise_readahead(self, position):
+        """Durante el catch-up pide al kernel los próximos `readahead` bytes antes de llegar a ellos."""
+        if not self._readahead or position + self._readahead // 2 < self._readahead_upto:
+            return
+        start = max(position, self._readahead_upto)
+        end = position + self._readahead
+        fadvise(self._file.fileno(), start, end - start, POSIX_FADV_WILLNEED)
+        self._readahead_upto = end
+
+    def drop_cache(self, position):
+        """
+        Libera de la page cache el archivo hasta `position` (lo ya enviado y
+        guardado en el checkpoint), en ventanas alineadas a DROP_CACHE_WINDOW.
+        Devuelve los bytes liberados.
+        """
+        if not self._drop_cache or not self.is_open():
+            return 0
+        end = min(position, self._position)
+        if self._map is not None:
+            # Las páginas mapeadas no se pueden liberar: se esperan al cerrar el mapa
+            end = min(end, self._map_offset)
+        end -= end % DROP_CACHE_WINDOW
+        if end <= self._cache_dropped:
+            return 0
+        released = end - self._cache_dropped
+        if not fadvise(self._file.fileno(), self._cache_dropped, released, POSIX_FADV_DONTNEED):
+            return 0
+        self._cache_dropped = end
+        self.cache_released_bytes += released
+        return released
+
+    def _drop_all_cache(self, fileobj, dropped=0):
+        """Libera de la page cache el resto de un archivo ya leído por completo, antes de cerrarlo."""
+        if not self._drop_cache:
+            return
+        try:
+            size = os.fstat(fileobj.fileno()).st_size
+        except OSError:
+            return
+        if size > dropped and fadvise(fileobj.fileno(), dropped, 0, POSIX_FADV_DONTNEED):
+            self.cache_released_bytes += size - dropped
+
+    def _close_map(self, seek=True):
+        if self._map is None:
+            return
+        self._map.close()
+        self._map = None
+        if seek and self._file is not None and not self._file.closed:
+            self._file.seek(self._map_offset + self._map_pos)
 
     def _open_file(self):
         """
@@ -22,96 +213,486 @@ class FileLogReader(BaseLogReader):
         Si el archivo no existe o no se puede abrir, devuelve False.
         """
         try:
+            if self._file is not None and not self._file.closed:
+                # Ya abierto: una rotación o desaparición se detecta en read() al llegar a EOF,
+                # después de haber leído todo lo que quedaba en el descriptor actual.
+                return True
+
             if not os.path.exists(self.resource):
                 logger.warning(u"FileLogReader: El archivo de log %s no existe.", self.resource)
-                if self._file and not self._file.closed:
-                    self._file.close()
-                    self._file = None 
-                self._inode = None 
+                self._inode = None
+                # Vigilar el directorio para despertar cuando el archivo vuelva a crearse
+                self._watcher.watch(self.resource)
                 return False
 
-            current_inode = os.stat(self.resource).st_ino
-            if self._file is None or self._file.closed or current_inode != self._inode:
-                if self._file and not self._file.closed:
-                    self._file.close()
-                
-                logger.debug(u"FileLogReader: Abriendo archivo %s. Inode actual: %s, Inode previo: %s", self.resource, current_inode, self._inode)
-                self._file = io.open(self.resource, 'r', encoding='utf-8', errors='ignore')
-                self._inode = current_inode
-                
-                logger.debug(u"FileLogReader: Aplicando seek a la posición %s", self._position)
-                self._file.seek(self._position)
+            self._file = io.open(self.resource, 'rb')
+            # fstat del descriptor abierto: el inode corresponde exactamente al archivo que se lee
+            current_inode = os.fstat(self._file.fileno()).st_ino
+            logger.debug(u"FileLogReader: Abriendo archivo %s. Inode actual: %s, Inode previo: %s", self.resource, current_inode, self._inode)
+            self._inode = current_inode
+            self._head = None
+            self._cache_dropped = 0
+            self._readahead_upto = 0
+            # El archivo se lee una sola vez de principio a fin
+            fadvise(self._file.fileno(), 0, 0, POSIX_FADV_SEQUENTIAL)
+            self._watcher.watch(self.resource)
+
+            if self._resume_check is not None:
+                # Tras una rotación o al reabrir un archivo liberado, se confirma por contenido que es el mismo:
+                # un inode nuevo con el mismo contenido (archivo reemplazado por una copia) no se reenvía entero
+                checkpoint, released = self._resume_check
+                self._resume_check = None
+                size = os.fstat(self._file.fileno()).st_size
+                if classify(self._file, size, current_inode, checkpoint) == SAME:
+                    if current_inode != checkpoint.get('inode'):
+                        logger.info(u"FileLogReader: %s tiene inode nuevo pero el mismo contenido. Se continúa en la posición %s.", self.resource, checkpoint['position'])
+                    self._position = checkpoint['position']
+                    self._tail = None
+                else:
+                    self._position = 0
+                    self._tail = b''
+                    if released:
+                        # Rotó o se truncó mientras estaba cerrado: lo no leído del archivo anterior no pasó por este lector
+                        logger.info(u"FileLogReader: %s cambió mientras estaba cerrado. Leyendo desde el principio.", self.resource)
+                        self.lost_checkpoint = checkpoint
+
+            logger.debug(u"FileLogReader: Aplicando seek a la posición %s", self._position)
+            self._file.seek(self._position)
+            self._reset_buffers()
 
         except (IOError, OSError) as e:
             logger.error(u"FileLogReader: Error al abrir/stat el archivo %s: %s", self.resource, str(e))
             if self._file and not self._file.closed:
                 self._file.close()
             self._file = None
-            self._inode = None 
-            time.sleep(1) 
+            self._inode = None
+            time.sleep(1)
             return False
         return True
 
-    def read(self, max_lines=None, timeout=None):
-        if not self._open_file():
-            return [] 
+    def _read_block(self):
+        """
+        Lee un bloque del archivo y lo separa en líneas completas de una sola vez.
 
-        lines = []
+        La última porción sin '\\n' se guarda en el buffer y se antepone al
+        siguiente bloque, por lo que una línea nunca se entrega a medias.
+        Devuelve la lista de líneas (bytes, sin '\\n') o una lista vacía en EOF.
+        """
+        if self._map is not None or (self._catching_up and self._start_catchup()):
+            lines = self._read_mapped_block()
+            if lines:
+                return lines
+
+        while True:
+            chunk = self._file.read(self._chunk_size)
+            if not chunk:
+                return []
+            if self._discard:
+                # Resto de una línea demasiado larga: se descarta hasta su '\n'
+                newline = chunk.find(b'\n')
+                if newline < 0:
+                    self._discard += len(chunk)
+                    continue
+                self._discard += newline
+                chunk = chunk[newline:]
+                self._pending_skip = self._discard
+                self._discard = 0
+            if self._buffer:
+                chunk = self._buffer + chunk
+            lines = chunk.split(b'\n')
+            self._buffer = lines.pop()
+            if self._max_line_bytes and len(self._buffer) > self._max_line_bytes:
+                self._discard = len(self._buffer) - self._max_line_bytes
+                self._buffer = self._buffer[:self._max_line_bytes]
+            if lines:
+                return lines
+
+    def _decode(self, raw_line):
+        """Decodifica una línea completa. '\\n' nunca aparece dentro de una secuencia UTF-8."""
+        return raw_line.strip().decode('utf-8', 'ignore')
+
+    def _truncated(self, line_size):
+        """Contabiliza una línea de line_size bytes recortada a max_line_bytes."""
+        dropped = line_size - self._max_line_bytes
+        self.truncated_lines += 1
+        self.dropped_bytes += dropped
+        logger.warning(u"FileLogReader: Línea de %d bytes en %s recortada a %d bytes (%d bytes descartados).", line_size, self.resource, self._max_line_bytes, dropped)
+
+    def _retire_file(self, lines, offsets=False):
+        """
+        Aparta el descriptor actual tras una rotación sin cerrarlo.
+
+        Se mantiene abierto rotate_wait segundos para entregar lo que los
+        escritores lentos sigan añadiendo al archivo anterior antes de reabrir el log.
+        """
+        if self._rotated is not None:
+            self._drain_rotated(lines, final=True, offsets=offsets)
+        if self._file is not None:
+            self._rotated = {
+                'file': self._file,
+                'inode': self._inode,
+                'position': self._position, # Fin de lo entregado del archivo rotado, para el checkpoint
+                'head': self._head,
+                'buffer': self._buffer,
+                'discard': self._discard,
+                'cache_dropped': self._cache_dropped,
+                'deadline': time.time() + self._rotate_wait
+            }
+        self._file = None
+        self._inode = None
+        self._reset_buffers()
+        self._drain_rotated(lines, offsets=offsets)
+
+    def _drain_rotated(self, lines, final=False, offsets=False):
+        """
+        Lee hasta EOF el archivo rotado y añade sus líneas a `lines` sin tocar
+        el offset del archivo actual. Al vencer el periodo de gracia (o con
+        final=True) entrega la última línea incompleta y cierra el descriptor.
+        Con offsets=True se añaden tuplas (línea, None): no tienen offset en el archivo actual.
+        """
+        rotated = self._rotated
+        if rotated is None:
+            return
+        expired = final or time.time() >= rotated['deadline']
+        try:
+            while True:
+                chunk = rotated['file'].read(self._chunk_size)
+                if not chunk:
+                    break
+                skip = 0
+                if rotated['discard']:
+                    # Resto de una línea demasiado larga: se descarta hasta su '\n' y se contabiliza como en read()
+                    newline = chunk.find(b'\n')
+                    if newline < 0:
+                        rotated['discard'] += len(chunk)
+                        continue
+                    skip = rotated['discard'] + newline
+                    chunk = chunk[newline:]
+                    rotated['discard'] = 0
+                parts = (rotated['buffer'] + chunk).split(b'\n')
+                rotated['buffer'] = parts.pop()
+                if self._max_line_bytes and len(rotated['buffer']) > self._max_line_bytes:
+                    rotated['discard'] = len(rotated['buffer']) - self._max_line_bytes
+                    rotated['buffer'] = rotated['buffer'][:self._max_line_bytes]
+                for raw_line in parts:
+                    rotated['position'] += len(raw_line) + skip + 1
+                    if skip:
+                        self._truncated(len(raw_line) + skip)
+                        skip = 0
+                    elif self._max_line_bytes and len(raw_line) > self._max_line_bytes:
+                        self._truncated(len(raw_line))
+                        raw_line = raw_line[:self._max_line_bytes]
+                    lines.append((self._decode(raw_line), None) if offsets else self._decode(raw_line))
+        except (IOError, OSError) as e:
+            logger.error(u"FileLogReader: Error al leer el archivo rotado de %s: %s", self.resource, e)
+            expired = True
+
+        if expired:
+            if rotated['buffer']:
+                rotated['position'] += len(rotated['buffer']) + rotated['discard']
+                if rotated['discard']:
+                    self._truncated(len(rotated['buffer']) + rotated['discard'])
+                lines.append((self._decode(rotated['buffer']), None) if offsets else self._decode(rotated['buffer']))
+            self._drop_all_cache(rotated['file'], rotated['cache_dropped'])
+            rotated['file'].close()
+            self._rotated = None
+            logger.info(u"FileLogReader: Archivo rotado de %s leído por completo y cerrado.", self.resource)
+
+    def _remember_tail(self, delivered):
+        """Guarda los últimos TAIL_SIZE bytes entregados (líneas con su '\\n') para el fingerprint."""
+        chunk = []
+        size = 0
+        for raw_line in reversed(delivered):
+            chunk.append(raw_line)
+            size += len(raw_line) + 1
+            if size >= TAIL_SIZE:
+                break
+        chunk.reverse()
+        data = b'\n'.join(chunk) + b'\n'
+        if size < TAIL_SIZE and self._tail:
+            data = self._tail + data
+        self._tail = data[-TAIL_SIZE:]
+
+    def _tail_changed(self, current_size):
+        """
+        True si los bytes justo antes de _position ya no son los que se entregaron.
+        Detecta un copytruncate en el que el archivo volvió a crecer por encima del offset.
+        """
+        if not self._tail or current_size < self._position:
+            return False
+        return read_range(self._file, self._position - len(self._tail), len(self._tail)) != self._tail
+
+    def _check_truncation(self, current_size):
+        """Vuelve al inicio si el archivo fue truncado, aunque ya haya crecido de nuevo por encima del offset."""
+        if current_size < self._position + len(self._buffer) + self._discard or self._tail_changed(current_size):
+            logger.info(u"FileLogReader: Truncamiento de log detectado para %s (tamaño actual %s, posición %s). Reseteando posición a 0.", self.resource, current_size, self._position)
+            self._position = 0
+            self._tail = b''
+            self._reset_buffers()
+            if self._file: self._file.seek(0)
+
+    def _wait_for_changes(self, start_time, timeout):
+        """Bloquea hasta que el archivo cambie o se agote el tiempo restante de la lectura."""
+        remaining = None
+        if timeout is not None:
+            remaining = max(0.0, timeout - (time.time() - start_time))
+        self._watcher.wait(remaining)
+
+    def read(self, max_lines=None, timeout=None, max_bytes=None, with_offsets=False):
+        """
+        Devuelve las líneas nuevas del archivo. Espera datos hasta que vence
+        el timeout (None: hasta tener al menos una línea; 0: no espera).
+
+        max_lines y max_bytes acotan lo que se acumula en una llamada: al
+        alcanzar cualquiera de los dos se devuelve de inmediato, sin esperar
+        el timeout, y el resto del backlog queda en disco para la siguiente.
+
+        Con with_offsets=True devuelve tuplas (línea, offset donde empieza la
+        línea), para que las etapas que retienen líneas sepan hasta dónde
+        se puede guardar el checkpoint.
+        """
         start_time = time.time()
+        lines = []
+        read_bytes = 0
+
+        # Lo que los escritores lentos sigan añadiendo al archivo rotado se entrega primero
+        self._drain_rotated(lines, offsets=with_offsets)
+
+        if not self._open_file():
+            # El archivo no existe todavía: esperar su creación en vez de devolver el control en bucle
+            if timeout != 0 and not lines:
+                self._wait_for_changes(start_time, timeout)
+            return lines
+
+        # Con un retraso grande (tras una caída o reinicio) se recorre el backlog con mmap
+        self._start_catchup()
 
         while True:
-            try:
-                line = self._file.readline()
-            except IOError as e:
-                logger.error(u"FileLogReader: Error al leer línea del archivo %s: %s. Intentando reabrir.", self.resource, e)
-                if self._file: self._file.close() 
-                self._file = None
-                self._inode = None 
-                return lines 
-            
-            if line:
-                lines.append(line.strip())
-                self._position = self._file.tell()
-                if max_lines and len(lines) >= max_lines: 
+            if not self._pending:
+                try:
+                    if self._idle:
+                        # Tras llegar a EOF, antes de leer lo nuevo se confirma que lo anterior al offset no cambió (copytruncate)
+                        self._idle = False
+                        self._check_truncation(os.fstat(self._file.fileno()).st_size)
+                    self._pending = self._read_block()
+                except (IOError, OSError) as e:
+                    logger.error(u"FileLogReader: Error al leer del archivo %s: %s. Intentando reabrir.", self.resource, e)
+                    if self._file: self._file.close()
+                    self._file = None
+                    self._inode = None
+                    self._reset_buffers()
+                    return lines
+
+            if self._pending:
+                count = 0
+                delivered_before = read_bytes
+                skipped = self._pending_skip
+                for raw_line in self._pending:
+                    if (max_lines and len(lines) >= max_lines) or (max_bytes and read_bytes >= max_bytes):
+                        break
+                    line_start = self._position
+                    if self._pending_skip:
+                        # La primera línea es el inicio de una línea larga cuyo resto se descartó al leer
+                        self._truncated(len(raw_line) + self._pending_skip)
+                        self._position += self._pending_skip
+                        read_bytes += self._pending_skip
+                        self._pending_skip = 0
+                    # El offset avanza por los bytes reales de la línea más el '\n'
+                    self._position += len(raw_line) + 1
+                    read_bytes += len(raw_line) + 1
+                    if self._max_line_bytes and len(raw_line) > self._max_line_bytes:
+                        self._truncated(len(raw_line))
+                        raw_line = raw_line[:self._max_line_bytes]
+                    lines.append((self._decode(raw_line), line_start) if with_offsets else self._decode(raw_line))
+                    count += 1
+                if count:
+                    self.bytes_read += read_bytes - delivered_before
+                    self._remember_tail(self._pending[:count])
+                    if skipped:
+                        # Los bytes entregados ya no son contiguos en disco: la cola se relee al calcular el fingerprint
+                        self._tail = None
+                    del self._pending[:count]
+                if (max_lines and len(lines) >= max_lines) or (max_bytes and read_bytes >= max_bytes):
                     break
-            else: 
+            else:
                 try:
-                    if os.path.exists(self.resource): 
+                    if os.path.exists(self.resource):
                         current_stat = os.stat(self.resource)
                         current_size = current_stat.st_size
                         current_inode = current_stat.st_ino
 
-                        if current_inode != self._inode: 
-                            logger.info(u"FileLogReader: Rotación de log detectada (cambio de inode) para %s. Reseteando posición a 0.", self.resource)
+                        if current_inode != self._inode:
+                            # Antes de cambiar de archivo, leer hasta EOF lo escrito en el anterior antes del rename
+                            self._pending = self._read_block()
+                            if self._pending:
+                                continue
+                            logger.info(u"FileLogReader: Rotación de log detectada (cambio de inode) para %s. Archivo anterior leído hasta EOF; reseteando posición a 0.", self.resource)
+                            self._resume_check = (self.get_checkpoint(), False)
+                            self._retire_file(lines, with_offsets)
                             self._position = 0
-                            if self._file: self._file.close()
-                            self._file = None 
-                            break 
-                        elif current_size < self._position:  
-                            logger.info(u"FileLogReader: Truncamiento de log detectado para %s (tamaño actual %s < posición %s). Reseteando posición a 0.", self.resource, current_size, self._position)
-                            self._position = 0
-                            if self._file: self._file.seek(0) 
-                    else: 
+                            self._tail = b''
+                            break
+                        else:
+                            self._check_truncation(current_size)
+                            self._idle = True
+                    else:
+                        self._pending = self._read_block()
+                        if self._pending:
+                            continue
                         logger.warning(u"FileLogReader: El archivo de log %s ha desaparecido.", self.resource)
-                        if self._file and not self._file.closed:
-                            self._file.close()
-                        self._file = None
-                        self._inode = None
-                        break 
-                except OSError as e:
+                        self._retire_file(lines, with_offsets)
+                        self._position = 0
+                        self._tail = b''
+                        break
+                except (IOError, OSError) as e:
                     logger.warning(u"FileLogReader: Error al hacer stat del archivo %s: %s", self.resource, e)
-                if timeout is not None and (time.time() - start_time) > timeout:
+                if timeout is None:
+                    if lines:
+                        break
+                elif (time.time() - start_time) >= timeout:
                     break
-                time.sleep(0.1) 
-        return lines 
-    
+                self._wait_for_changes(start_time, timeout)
+        return lines
+
+    def close(self):
+        """Cierra el archivo y, si es propio, el notificador de cambios."""
+        self._close_map(seek=False)
+        if self._file and not self._file.closed:
+            self._file.close()
+        self._file = None
+        if self._rotated is not None:
+            self._rotated['file'].close()
+            self._rotated = None
+        if self._owns_watcher:
+            self._watcher.close()
+
+    def is_open(self):
+        return self._file is not None and not self._file.closed
+
+    def has_pending(self):
+        """True si quedan datos ya leídos sin entregar o un archivo rotado por drenar."""
+        return bool(self._pending) or self._map is not None or self._rotated is not None
+
+    def release(self):
+        """
+        Cierra el descriptor conservando offset y checkpoint, para limitar los
+        archivos abiertos. El siguiente read() lo reabre y comprueba con el
+        fingerprint que sigue siendo el mismo archivo. Devuelve False si hay
+        trabajo en curso (datos sin entregar o un archivo rotado sin drenar).
+        """
+        if not self.is_open() or self.has_pending():
+            return False
+        self._resume_check = (self.get_checkpoint(), True)
+        self._close_map(seek=False)
+        self.drop_cache(self._position)
+        self._file.close()
+        self._file = None
+        self._reset_buffers()
+        self._watcher.unwatch(self.resource)
+        return True
+
     def get_current_position(self):
         return self._position
-    
+
+    def lag(self):
+        """Bytes escritos en el archivo que aún no se han entregado (0 si está cerrado)."""
+        if not self.is_open():
+            return 0
+        try:
+            return max(0, os.fstat(self._file.fileno()).st_size - self._position)
+        except OSError:
+            return 0
+
+    def get_checkpoint(self, position=None):
+        """
+        Offset, inode y mtime del archivo leído, tal como se guardan en el estado.
+        Con `position` (anterior a la posición actual, p. ej. el inicio de un
+        evento multilínea aún no enviado) el checkpoint apunta a ese offset.
+        """
+        if position is not None and position >= self._position:
+            position = None
+        if self._file is None and self._resume_check is not None and self._resume_check[1]:
+            # Archivo liberado: su checkpoint no cambia hasta que se reabra
+            checkpoint = dict(self._resume_check[0])
+            if position is not None:
+                # Sin descriptor no se calcula la cola en ese offset: se comparará solo por inode
+                checkpoint['position'] = position
+                checkpoint.pop('fingerprint', None)
+            return checkpoint
+        mtime = None
+        if self._file is not None and not self._file.closed:
+            try:
+                mtime = os.fstat(self._file.fileno()).st_mtime
+            except OSError:
+                pass
+        checkpoint = {'position': self._position if position is None else position, 'inode': self._inode, 'mtime': mtime}
+        if mtime is not None:
+            try:
+                checkpoint['fingerprint'] = self._fingerprint(position)
+            except (IOError, OSError) as e:
+                logger.warning(u"FileLogReader: No se pudo calcular el fingerprint de %s: %s", self.resource, e)
+        if self._rotated is not None:
+            rotated = self._rotated_checkpoint()
+            if rotated is not None:
+                checkpoint['rotated'] = rotated
+        return checkpoint
+
+    def _rotated_checkpoint(self):
+        """
+        Inode, offset ya entregado y fingerprint del archivo rotado que aún se
+        está drenando. Si el agente se detiene antes de terminarlo, al
+        reiniciar el backfill continúa en ese offset (ver BackfillReader.resume).
+        """
+        rotated = self._rotated
+        try:
+            if rotated['head'] is None or len(rotated['head']) < HEAD_SIZE:
+                rotated['head'] = read_range(rotated['file'], 0, HEAD_SIZE)
+            tail_len = min(rotated['position'], TAIL_SIZE)
+            tail = read_range(rotated['file'], rotated['position'] - tail_len, tail_len)
+        except (IOError, OSError, ValueError) as e:
+            logger.warning(u"FileLogReader: No se pudo calcular el fingerprint del archivo rotado de %s: %s", self.resource, e)
+            return None
+        return {'position': rotated['position'], 'inode': rotated['inode'], 'fingerprint': make_fingerprint(rotated['head'], tail)}
+
+    def _fingerprint(self, position=None):
+        """Hash de los primeros bytes del archivo y de los bytes justo antes de _position (o de `position`)."""
+        if self._head is None or len(self._head) < HEAD_SIZE:
+            self._head = read_range(self._file, 0, HEAD_SIZE)
+        if position is not None:
+            tail_len = min(position, TAIL_SIZE)
+            return make_fingerprint(self._head, read_range(self._file, position - tail_len, tail_len))
+        if self._tail is None:
+            tail_len = min(self._position, TAIL_SIZE)
+            self._tail = read_range(self._file, self._position - tail_len, tail_len)
+        return make_fingerprint(self._head, self._tail)
+
+    def restore_checkpoint(self, checkpoint):
+        """
+        Aplica un checkpoint guardado al arrancar.
+
+        Con el inode y el fingerprint se decide si el archivo actual es el del
+        checkpoint (se continúa en su offset) o es otro: rotación, inode
+        reutilizado o copytruncate. En ese caso se lee desde el principio.
+        Devuelve Fingerprint.SAME o Fingerprint.ROTATED.
+        """
+        if not self._open_file():
+            self.set_initial_position(0)
+            return ROTATED
+        size = os.fstat(self._file.fileno()).st_size
+        decision = classify(self._file, size, self._inode, checkpoint)
+        if decision == SAME:
+            self.set_initial_position(checkpoint['position'])
+        else:
+            self.set_initial_position(0)
+            self._tail = b''
+        return decision
+
     def set_initial_position(self, position):
         """Establece la posición inicial. Usado por el agente antes de la primera lectura."""
         logger.info(u"FileLogReader: Estableciendo posición inicial a %s para %s", position, self.resource)
         self._position = position
+        self._tail = None
+        self._reset_buffers()
         # Si el archivo ya está abierto y es el mismo inode, aplicar el seek.
         # De lo contrario, _open_file() lo manejará al abrir/reabrir.
         if self._file and not self._file.closed:
@@ -132,7 +713,9 @@ class FileLogReader(BaseLogReader):
         try:
             self._file.seek(0, os.SEEK_END)
             self._position = self._file.tell()
+            self._tail = None
+            self._reset_buffers()
             logger.info(u"FileLogReader: Posicionado al final del archivo %s en %s.", self.resource, self._position)
         except (IOError, OSError) as e:
             logger.error(u"FileLogReader: Error al intentar posicionar al final del archivo %s: %s", self.resource, e)
-        return self._position
\ No newline at end of file
+        return self._position
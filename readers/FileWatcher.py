@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Intervalo de espera del modo polling (comportamiento histórico del lector)
+POLL_INTERVAL = 0.1
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_MASK_ADD = 0x20000000
+
+FILE_EVENTS = IN_MODIFY | IN_MOVE_SELF | IN_DELETE_SELF
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+# Directorio con muchos archivos: un solo watch avisa de cambios en cualquiera de ellos
+DIR_CONTENT_EVENTS = DIR_EVENTS | IN_MODIFY
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT_HEADER = struct.Struct(str('iIII'))
+_READ_SIZE = 64 * 1024
+
+
+def _fs_path(path):
+    """Convierte la ruta a bytes para pasarla a la libc."""
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding() or 'utf-8')
+
+
+class PollingFileWatcher(object):
+    """
+    Fallback cuando inotify no está disponible: duerme en pasos cortos y
+    deja que el lector vuelva a hacer stat del archivo.
+    """
+
+    def watch(self, path):
+        pass
+
+    def watch_directory(self, directory):
+        pass
+
+    def unwatch(self, path):
+        pass
+
+    def changed(self):
+        """Sin eventos no se sabe qué cambió: None indica revisar todos los archivos."""
+        return None
+
+    def wait(self, timeout=None):
+        if timeout is None or timeout > POLL_INTERVAL:
+            timeout = POLL_INTERVAL
+        if timeout > 0:
+            time.sleep(timeout)
+        return True
+
+    def close(self):
+        pass
+
+
+class InotifyFileWatcher(object):
+    """
+    Bloquea hasta que el archivo vigilado cambia, usando inotify via ctypes
+    (compatible con Python 2.6, que no trae bindings propios).
+
+    Vigila el archivo (IN_MODIFY, IN_MOVE_SELF, IN_DELETE_SELF) y su directorio
+    padre (IN_CREATE, IN_MOVED_TO) para enterarse de la creación del archivo
+    nuevo tras una rotación. Si no se puede añadir algún watch, wait() vuelve a
+    esperar en pasos de POLL_INTERVAL para no perder cambios.
+
+    changed() devuelve qué rutas tuvieron eventos, para que con miles de
+    archivos solo se lean (y se abran) los que cambiaron.
+    """
+
+    def __init__(self):
+        if fcntl is None or not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, u"inotify solo está disponible en Linux")
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(str(libc_name), use_errno=True)
+        self._libc.inotify_init.argtypes = []
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        fd = self._libc.inotify_init()
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        self._fd = fd
+
+        self._file_watches = {} # wd -> ruta del archivo vigilado
+        self._dir_watches = {}  # wd -> nombres de archivo relevantes en ese directorio
+        self._dir_paths = {}    # wd -> ruta del directorio
+        self._dir_all = set()   # wd de directorios en los que cualquier archivo es relevante
+        self._changed = set()   # Rutas con eventos desde la última llamada a changed()
+        self._overflow = False
+        self._degraded = False
+
+    def _add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self._fd, _fs_path(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def watch(self, path):
+        """
+        Añade (o renueva tras una rotación) los watches del archivo y de su directorio.
+        Es idempotente: inotify devuelve el mismo wd para el mismo inode.
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        try:
+            # IN_MASK_ADD: no reemplazar la máscara si el directorio ya se vigila con watch_directory()
+            wd = self._add_watch(directory, DIR_EVENTS | IN_MASK_ADD)
+            self._dir_watches.setdefault(wd, set()).add(_fs_path(name))
+            self._dir_paths[wd] = directory
+        except OSError as e:
+            logger.warning(u"InotifyFileWatcher: No se pudo vigilar el directorio %s: %s. Usando polling.", directory, e)
+            self._degraded = True
+
+        try:
+            wd = self._add_watch(path, FILE_EVENTS)
+            self._file_watches[wd] = path
+        except OSError as e:
+            # ENOENT es normal si el archivo aún no existe: el watch del directorio avisará al crearse.
+            if e.errno != errno.ENOENT:
+                logger.warning(u"InotifyFileWatcher: No se pudo vigilar el archivo %s: %s. Usando polling.", path, e)
+                self._degraded = True
+
+    def watch_directory(self, directory):
+        """Vigila con un solo watch las modificaciones de todos los archivos de un directorio."""
+        directory = os.path.abspath(directory)
+        try:
+            wd = self._add_watch(directory, DIR_CONTENT_EVENTS | IN_MASK_ADD)
+            self._dir_watches.setdefault(wd, set())
+            self._dir_paths[wd] = directory
+            self._dir_all.add(wd)
+        except OSError as e:
+            logger.warning(u"InotifyFileWatcher: No se pudo vigilar el directorio %s: %s. Usando polling.", directory, e)
+            self._degraded = True
+
+    def unwatch(self, path):
+        """Quita el watch del archivo (p. ej. al cerrar su descriptor); el de su directorio se mantiene."""
+        for wd, watched in list(self._file_watches.items()):
+            if watched == path:
+                del self._file_watches[wd]
+                self._libc.inotify_rm_watch(self._fd, wd)
+
+    def changed(self):
+        """
+        Devuelve las rutas absolutas con eventos desde la llamada anterior, o
+        None si no se puede saber (watches fallidos o cola de eventos desbordada)
+        y hay que revisar todos los archivos.
+        """
+        self._drain_events()
+        changed = self._changed
+        self._changed = set()
+        if self._degraded or self._overflow:
+            self._overflow = False
+            return None
+        return changed
+
+    def _drain_events(self):
+        """Lee los eventos pendientes y devuelve True si alguno afecta a un archivo vigilado."""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return relevant
+                raise
+            if not data:
+                return relevant
+
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip(b'\0')
+                offset += name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    # Se perdieron eventos: el siguiente changed() pide revisar todo
+                    self._overflow = True
+                    relevant = True
+                elif wd in self._file_watches:
+                    self._changed.add(os.path.abspath(self._file_watches[wd]))
+                    if mask & IN_IGNORED:
+                        # El inode fue borrado o rotado; el lector renovará el watch al reabrir.
+                        del self._file_watches[wd]
+                    relevant = True
+                elif wd in self._dir_watches:
+                    if mask & IN_IGNORED:
+                        del self._dir_watches[wd]
+                        self._dir_all.discard(wd)
+                        self._degraded = True
+                    elif name in self._dir_watches[wd] or (name and wd in self._dir_all):
+                        self._changed.add(os.path.join(self._dir_paths[wd], name.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')))
+                        relevant = True
+
+    def wait(self, timeout=None):
+        """
+        Bloquea hasta que llega un evento relevante o vence el timeout (segundos).
+        Devuelve True si hubo actividad en un archivo vigilado.
+        """
+        if self._degraded and (timeout is None or timeout > POLL_INTERVAL):
+            timeout = POLL_INTERVAL
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+            except (select.error, IOError, OSError) as e:
+                # Una señal (SIGTERM/SIGINT) interrumpe la espera: se devuelve el control al lector.
+                if e.args and e.args[0] == errno.EINTR:
+                    return False
+                raise
+            if not readable:
+                return self._degraded
+            if self._drain_events():
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+
+def create_file_watcher():
+    """
+    Devuelve un watcher basado en inotify si el sistema lo soporta (Linux) y,
+    si no, el watcher de polling con el comportamiento anterior.
+    """
+    try:
+        return InotifyFileWatcher()
+    except (OSError, AttributeError, TypeError) as e:
+        logger.info(u"FileWatcher: inotify no disponible (%s). Usando polling cada %ss.", e, POLL_INTERVAL)
+        return PollingFileWatcher()
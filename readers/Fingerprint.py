@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+from hashlib import md5
+
+# Bytes del inicio del archivo que identifican su contenido
+HEAD_SIZE = 1024
+# Bytes justo antes del offset guardado que confirman que el checkpoint sigue siendo válido
+TAIL_SIZE = 256
+
+SAME = 'same'
+ROTATED = 'rotated'
+
+def digest(data):
+    return md5(data).hexdigest()
+
+def read_range(fileobj, start, length):
+    """Lee `length` bytes desde `start` sin alterar la posición de lectura del archivo."""
+    current = fileobj.tell()
+    try:
+        fileobj.seek(start)
+        return fileobj.read(length)
+    finally:
+        fileobj.seek(current)
+
+def make_fingerprint(head, tail):
+    """Construye el fingerprint que se guarda en el checkpoint a partir de los bytes de inicio y de cola."""
+    return {
+        'head': digest(head),
+        'head_len': len(head),
+        'tail': digest(tail),
+        'tail_len': len(tail)
+    }
+
+def classify(fileobj, size, inode, checkpoint):
+    """
+    Decide si el archivo abierto es el mismo del checkpoint (SAME) o es otro
+    archivo (ROTATED: rotación, reutilización de inode o copytruncate).
+
+    - Sin fingerprint (estados antiguos) se decide solo por inode.
+    - Si el inicio del archivo no coincide, es otro archivo aunque el inode sea el mismo.
+    - Si el archivo es más corto que el offset guardado, fue truncado.
+    - Si los bytes justo antes del offset no coinciden, el contenido fue reemplazado.
+    - Un inode distinto con el mismo contenido (archivo reemplazado por una copia)
+      solo se considera SAME con una cabecera completa de HEAD_SIZE bytes, para
+      no confundir dos archivos cortos que empiezan igual.
+    """
+    fingerprint = checkpoint.get('fingerprint')
+    saved_inode = checkpoint.get('inode')
+    position = checkpoint.get('position', 0)
+    same_inode = saved_inode is None or saved_inode == inode
+
+    if not fingerprint:
+        return SAME if same_inode else ROTATED
+
+    head_len = fingerprint.get('head_len', 0)
+    if size < head_len or digest(read_range(fileobj, 0, head_len)) != fingerprint.get('head'):
+        return ROTATED
+    if size < position:
+        return ROTATED
+
+    tail_len = fingerprint.get('tail_len', 0)
+    if digest(read_range(fileobj, position - tail_len, tail_len)) != fingerprint.get('tail'):
+        return ROTATED
+
+    if not same_inode and head_len < HEAD_SIZE:
+        return ROTATED
+    return SAME
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+from readers.FileLogReader import MAX_LINE_BYTES
+from readers.SocketLogReader import SocketLogReader, RECV_BUFFER
+from readers.PipeLogReader import PipeLogReader
+
+def create_input(url, recv_buffer=RECV_BUFFER, max_line_bytes=MAX_LINE_BYTES):
+    """
+    Crea la fuente de logs que no es un archivo:
+    'stdin' (o '-'), 'pipe:///ruta/al/fifo', 'udp://host:puerto', 'tcp://host:puerto',
+    'unix:///ruta/al/socket' (datagramas) o 'unixstream:///ruta/al/socket'.
+    """
+    if url in ('-', 'stdin'):
+        return PipeLogReader('-', max_line_bytes=max_line_bytes)
+    if url.startswith('pipe://'):
+        return PipeLogReader(url[len('pipe://'):], max_line_bytes=max_line_bytes)
+    return SocketLogReader(url, recv_buffer=recv_buffer, max_line_bytes=max_line_bytes)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import glob
+import fnmatch
+import time
+import logging
+from readers.BaseLogReader import BaseLogReader
+from readers.FileLogReader import FileLogReader, ROTATE_WAIT, MAX_LINE_BYTES, CATCHUP_READAHEAD
+from readers.FileWatcher import create_file_watcher
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se vuelven a expandir los patrones glob para descubrir archivos nuevos
+RESCAN_INTERVAL = 10
+# Máximo de archivos con descriptor abierto; el resto se cierra (LRU) y se reabre cuando cambia
+MAX_OPEN_FILES = 256
+# Sin inotify, cada cuántos segundos se hace stat de los archivos cerrados para ver si cambiaron
+COLD_CHECK_INTERVAL = 1
+
+def _is_pattern(path):
+    return any(c in path for c in '*?[')
+
+class MultiFileLogReader(BaseLogReader):
+    """
+    Lee varios archivos de log (rutas o patrones glob) desde un solo proceso.
+
+    Cada archivo tiene su propio FileLogReader (inode y offset independientes);
+    todos comparten un único notificador de cambios, de modo que la espera
+    cuando no hay datos es una sola para todos los archivos.
+
+    Para directorios con miles de archivos (uno por tenant o por worker) solo
+    se leen los archivos con eventos, y solo los max_open_files usados más
+    recientemente mantienen su descriptor abierto. Los demás se cierran
+    conservando su checkpoint y se reabren cuando vuelven a cambiar.
+    """
+
+    def __init__(self, patterns, rescan_interval=RESCAN_INTERVAL, rotate_wait=ROTATE_WAIT, max_line_bytes=MAX_LINE_BYTES,
+                 max_open_files=MAX_OPEN_FILES, on_rotated=None, drop_cache=True, readahead=CATCHUP_READAHEAD):
+        super(MultiFileLogReader, self).__init__(list(patterns))
+        self._watcher = create_file_watcher()
+        self._rescan_interval = rescan_interval
+        self._rotate_wait = rotate_wait
+        self._max_line_bytes = max_line_bytes
+        self._max_open_files = max_open_files
+        self._drop_cache = drop_cache
+        self._readahead = readahead
+        # Se llama con (ruta, checkpoint) si un archivo cerrado rotó antes de leerse entero
+        self._on_rotated = on_rotated
+        self._last_scan = 0
+        self._turn = 0 # Primer archivo a leer en la próxima pasada (reparto del presupuesto de bytes)
+        self._dirty = set() # Rutas por leer en la próxima pasada
+        self._lru = {} # ruta con descriptor abierto -> orden del último uso
+        self._tick = 0
+        self._cold = {} # ruta cerrada -> (inode, tamaño, mtime) al cerrarla
+        self._last_cold_check = 0
+        self._directories = set() # Directorios de patrones glob vigilados con un solo watch
+        self._absolute = {} # ruta absoluta -> ruta tal como se sigue
+        self.readers = {} # ruta -> FileLogReader
+        self.discover()
+
+    def _expand_patterns(self):
+        paths = set()
+        for pattern in self.resource:
+            if _is_pattern(pattern):
+                paths.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+            else:
+                # Las rutas explícitas se vigilan aunque aún no existan
+                paths.add(pattern)
+        return sorted(paths)
+
+    def discover(self):
+        """
+        Crea un FileLogReader por cada archivo nuevo que coincida con los patrones.
+        Devuelve la lista de rutas añadidas.
+        """
+        self._last_scan = time.time()
+        added = []
+        for path in self._expand_patterns():
+            if path not in self.readers:
+                logger.info(u"MultiFileLogReader: Siguiendo archivo %s", path)
+                self.readers[path] = FileLogReader(path, watcher=self._watcher, rotate_wait=self._rotate_wait,
+                                                   max_line_bytes=self._max_line_bytes, drop_cache=self._drop_cache,
+                                                   readahead=self._readahead)
+                self._absolute[os.path.abspath(path)] = path
+                if path not in self.resource:
+                    # Archivo de un patrón: un watch por directorio en vez de uno por archivo
+                    directory = os.path.dirname(os.path.abspath(path))
+                    if directory not in self._directories:
+                        self._directories.add(directory)
+                        self._watcher.watch_directory(directory)
+                self._dirty.add(path)
+                added.append(path)
+        return added
+
+    def _matches_pattern(self, path):
+        return any(_is_pattern(pattern) and fnmatch.fnmatch(path, os.path.abspath(pattern)) for pattern in self.resource)
+
+    def _collect_changes(self):
+        """Marca para leer los archivos que cambiaron desde la pasada anterior."""
+        changed = self._watcher.changed()
+        if changed is not None:
+            for path in changed:
+                if path in self._absolute:
+                    self._dirty.add(self._absolute[path])
+                elif self._matches_pattern(path):
+                    # Archivo nuevo en un directorio vigilado: descubrirlo sin esperar al próximo rescan
+                    self._last_scan = 0
+            return
+
+        # Sin eventos por archivo: los abiertos se revisan en cada pasada y los cerrados por stat cada COLD_CHECK_INTERVAL
+        check_cold = time.time() - self._last_cold_check >= COLD_CHECK_INTERVAL
+        if check_cold:
+            self._last_cold_check = time.time()
+        for path in self.readers:
+            if path not in self._cold:
+                self._dirty.add(path)
+            elif check_cold and self._signature(path) != self._cold[path]:
+                self._dirty.add(path)
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def mark_used(self, path):
+        """Registra el uso de un archivo en el LRU y cierra los menos usados si se supera max_open_files."""
+        if self.readers[path].is_open():
+            self._tick += 1
+            self._lru[path] = self._tick
+            self._cold.pop(path, None)
+        else:
+            self._lru.pop(path, None)
+        if self._max_open_files and len(self._lru) > self._max_open_files:
+            for victim in sorted(self._lru, key=self._lru.get):
+                if len(self._lru) <= self._max_open_files:
+                    break
+                self._release(victim)
+
+    def _release(self, path):
+        reader = self.readers[path]
+        signature = self._signature(path)
+        if not reader.release():
+            return
+        del self._lru[path]
+        self._cold[path] = signature
+        if os.path.dirname(os.path.abspath(path)) in self._directories:
+            # El watch del directorio avisará cuando vuelva a cambiar
+            self._watcher.unwatch(path)
+
+    def read(self, timeout=None, max_bytes=None):
+        """
+        Lee las líneas nuevas de los archivos que cambiaron.
+
+        Devuelve una lista de tuplas (ruta, línea, offset donde empieza la
+        línea; None si viene del archivo anterior a una rotación). Igual que FileLogReader,
+        acumula líneas hasta que vence el timeout; mientras no hay datos
+        bloquea en el notificador compartido en vez de dormir. Con max_bytes
+        devuelve en cuanto las líneas acumuladas alcanzan ese tamaño, de modo
+        que un backlog grande se entrega en tramos de memoria acotada.
+        """
+        start_time = time.time()
+        records = []
+        read_bytes = 0
+
+        while True:
+            if time.time() - self._last_scan >= self._rescan_interval:
+                # Los archivos que aparecen mientras el agente corre se leen desde el principio
+                self.discover()
+            self._collect_changes()
+
+            paths = sorted(self._dirty)
+            # Si el presupuesto se agota, la siguiente llamada empieza por el archivo siguiente
+            start = self._turn % len(paths) if paths else 0
+            for index, path in enumerate(paths[start:] + paths[:start]):
+                reader = self.readers[path]
+                before = reader.bytes_read
+                for line, offset in reader.read(timeout=0, max_bytes=max_bytes - read_bytes if max_bytes else None, with_offsets=True):
+                    records.append((path, line, offset))
+                read_bytes += reader.bytes_read - before
+                if reader.lost_checkpoint is not None:
+                    if self._on_rotated is not None:
+                        self._on_rotated(path, reader.lost_checkpoint)
+                    reader.lost_checkpoint = None
+                self.mark_used(path)
+                if max_bytes and read_bytes >= max_bytes:
+                    # Puede quedar backlog en disco: el archivo sigue marcado para la próxima pasada
+                    self._turn = (start + index + 1) % len(paths)
+                    return records
+                if not reader.has_pending():
+                    self._dirty.discard(path)
+
+            elapsed = time.time() - start_time
+            if timeout is None:
+                if records:
+                    break
+            elif elapsed >= timeout:
+                break
+            self._watcher.wait(None if timeout is None else timeout - elapsed)
+        return records
+
+    def positions(self, held=None):
+        """
+        Devuelve {ruta: {'position': offset, 'inode': inode, 'mtime': mtime}} de cada archivo seguido.
+        `held` ({ruta: offset}) retrasa el checkpoint de los archivos con líneas retenidas aún sin enviar.
+        """
+        held = held or {}
+        result = {}
+        for path, reader in self.readers.items():
+            result[path] = reader.get_checkpoint(held.get(path))
+        return result
+
+    def drop_cache(self, positions):
+        """Libera de la page cache lo ya guardado en el checkpoint ({ruta: checkpoint}, como positions())."""
+        released = 0
+        for path, checkpoint in positions.items():
+            reader = self.readers.get(path)
+            if reader is not None:
+                released += reader.drop_cache(checkpoint['position'])
+        return released
+
+    def lag(self):
+        """
+        Retraso total en bytes de los archivos abiertos. Los cerrados por el
+        límite de descriptores no cuentan: se cerraron al día y se reabren en
+        cuanto cambian.
+        """
+        return sum(self.readers[path].lag() for path in self._lru)
+
+    def stats(self):
+        """Contadores acumulados de todos los archivos seguidos."""
+        readers = list(self.readers.values())
+        return {
+            'files': len(readers),
+            'open_files': len(self._lru),
+            'bytes_read': sum(reader.bytes_read for reader in readers),
+            'truncated_lines': sum(reader.truncated_lines for reader in readers),
+            'dropped_bytes': sum(reader.dropped_bytes for reader in readers),
+            'cache_released_bytes': sum(reader.cache_released_bytes for reader in readers)
+        }
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+        self._watcher.close()
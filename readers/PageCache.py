@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import logging
+import ctypes
+import ctypes.util
+
+logger = logging.getLogger(__name__)
+
+# Constantes de <fcntl.h> (Linux)
+POSIX_FADV_SEQUENTIAL = 2
+POSIX_FADV_WILLNEED = 3
+POSIX_FADV_DONTNEED = 4
+
+def _load_fadvise():
+    """posix_fadvise de os (Python 3.3+) o, en Python 2, de la libc via ctypes."""
+    if hasattr(os, 'posix_fadvise'):
+        return os.posix_fadvise
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(str(ctypes.util.find_library('c') or 'libc.so.6'), use_errno=True)
+        # La variante 64 acepta offsets de 64 bits también en sistemas de 32 bits
+        func = getattr(libc, 'posix_fadvise64', None) or libc.posix_fadvise
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong, ctypes.c_int]
+    func.restype = ctypes.c_int
+
+    def fadvise(fd, offset, length, advice):
+        # posix_fadvise devuelve el código de error en vez de usar errno
+        err = func(fd, offset, length, advice)
+        if err:
+            raise OSError(err, os.strerror(err))
+    return fadvise
+
+_fadvise = _load_fadvise()
+
+def available():
+    return _fadvise is not None
+
+def fadvise(fd, offset, length, advice):
+    """
+    Aplica posix_fadvise al rango indicado (length 0: hasta el final del archivo).
+    Es solo una sugerencia al kernel: devuelve False si no está disponible o falla.
+    """
+    if _fadvise is None:
+        return False
+    try:
+        _fadvise(fd, offset, length, advice)
+        return True
+    except (OSError, IOError) as e:
+        logger.debug(u"PageCache: posix_fadvise(%s, %s, %s) falló: %s", offset, length, advice, e)
+        return False
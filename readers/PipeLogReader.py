@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import stat
+import errno
+import fcntl
+import select
+import logging
+from readers.BaseLogReader import BaseLogReader
+from readers.FileLogReader import CHUNK_SIZE, MAX_LINE_BYTES
+from readers.Syslog import StreamFramer, decode_message
+
+logger = logging.getLogger(__name__)
+
+# fcntl F_SETPIPE_SZ de Linux (no está en el módulo fcntl de Python 2)
+F_SETPIPE_SZ = 1031
+# Capacidad pedida para el pipe (por defecto 64 KiB), para absorber ráfagas; la limita /proc/sys/fs/pipe-max-size
+PIPE_BUFFER = 1024 * 1024
+
+class PipeLogReader(BaseLogReader):
+    """
+    Lee líneas de la entrada estándar ('-') o de un named pipe (FIFO), por
+    ejemplo 'app | python main.py' o 'mkfifo /run/agent.fifo'.
+
+    read() no bloquea: entrega lo disponible hasta max_bytes y vuelve. El
+    FIFO se abre con O_NONBLOCK; la entrada estándar se consulta con select(),
+    porque sus flags se comparten con la terminal o la shell que la abrió.
+    Con la entrada estándar, el fin de datos termina la
+    fuente (finished). Un FIFO se crea si no existe y se sigue leyendo
+    aunque el proceso que escribe se cierre y vuelva a abrirlo.
+    """
+
+    def __init__(self, path, max_line_bytes=MAX_LINE_BYTES, pipe_buffer=PIPE_BUFFER):
+        super(PipeLogReader, self).__init__(path)
+        self._stdin = path == '-'
+        self._framer = StreamFramer(max_line_bytes, octet_counting=False)
+        self.received_messages = 0
+        self.received_bytes = 0
+        self.finished = False
+        if self._stdin:
+            self._fd = sys.stdin.fileno()
+        else:
+            if not os.path.exists(path):
+                os.mkfifo(path, 0o600)
+            elif not stat.S_ISFIFO(os.stat(path).st_mode):
+                raise ValueError(u"PipeLogReader: %s no es un named pipe." % path)
+            # O_NONBLOCK: open() no espera a que haya un proceso escribiendo, y read() no espera datos
+            self._fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        if stat.S_ISFIFO(os.fstat(self._fd).st_mode):
+            try:
+                fcntl.fcntl(self._fd, F_SETPIPE_SZ, pipe_buffer)
+            except (IOError, OSError) as e:
+                logger.debug(u"PipeLogReader: No se pudo ampliar el buffer de %s: %s", path, e)
+        logger.info(u"PipeLogReader: Leyendo de %s.", 'la entrada estándar' if self._stdin else path)
+
+    def _deliver(self, raw, lines):
+        self.received_messages += 1
+        line = decode_message(raw)
+        if line:
+            lines.append((self.resource, line, None))
+
+    def read(self, max_lines=None, timeout=None, max_bytes=None):
+        """Devuelve las líneas disponibles como tuplas (ruta, línea, None). No bloquea: `timeout` se ignora."""
+        if self.finished:
+            return []
+        lines = []
+        read_bytes = 0
+        while (not max_lines or len(lines) < max_lines) and (not max_bytes or read_bytes < max_bytes):
+            try:
+                if self._stdin and not select.select([self._fd], [], [], 0)[0]:
+                    break
+                data = os.read(self._fd, CHUNK_SIZE)
+            except (IOError, OSError, select.error) as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    logger.error(u"PipeLogReader: Error al leer de %s: %s", self.resource, e)
+                break
+            if not data:
+                # Sin procesos escribiendo. Un FIFO sigue abierto para el siguiente escritor
+                remainder = self._framer.finish()
+                if remainder is not None:
+                    self._deliver(remainder, lines)
+                if self._stdin:
+                    logger.info(u"PipeLogReader: Fin de la entrada estándar.")
+                    self.finished = True
+                break
+            read_bytes += len(data)
+            self.received_bytes += len(data)
+            for message in self._framer.feed(data):
+                self._deliver(message, lines)
+        return lines
+
+    def stats(self):
+        return {
+            'input_messages': self.received_messages,
+            'input_bytes': self.received_bytes,
+            'truncated_lines': self._framer.truncated,
+            'dropped_bytes': self._framer.dropped_bytes
+        }
+
+    def close(self):
+        if not self._stdin and self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        self.finished = True
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import io
+import errno
+import select
+import socket
+import stat
+import logging
+from readers.BaseLogReader import BaseLogReader
+from readers.FileLogReader import CHUNK_SIZE, MAX_LINE_BYTES
+from readers.Syslog import StreamFramer, decode_message
+
+logger = logging.getLogger(__name__)
+
+# Buffer de recepción del kernel (SO_RCVBUF): absorbe las ráfagas entre dos pasadas del agente
+RECV_BUFFER = 4 * 1024 * 1024
+# Tamaño máximo de un datagrama UDP
+MAX_DATAGRAM = 65535
+# Conexiones simultáneas aceptadas en los sockets de tipo stream (select() admite hasta 1024 descriptores)
+MAX_CONNECTIONS = 256
+
+SCHEMES = ('udp', 'tcp', 'unix', 'unixstream')
+_RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+def parse_address(url):
+    """
+    Convierte 'udp://host:puerto', 'tcp://host:puerto', 'unix:///ruta' (datagramas)
+    o 'unixstream:///ruta' en (esquema, familia, tipo de socket, dirección).
+    """
+    scheme, sep, address = url.partition('://')
+    if not sep or scheme not in SCHEMES:
+        raise ValueError(u"SocketLogReader: Dirección no soportada: %s" % url)
+    if scheme.startswith('unix'):
+        kind = socket.SOCK_DGRAM if scheme == 'unix' else socket.SOCK_STREAM
+        return scheme, socket.AF_UNIX, kind, address
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]') or '0.0.0.0'
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    kind = socket.SOCK_DGRAM if scheme == 'udp' else socket.SOCK_STREAM
+    return scheme, family, kind, (host, int(port))
+
+class SocketLogReader(BaseLogReader):
+    """
+    Recibe logs por la red o por un socket local, sin pasar por disco:
+    syslog por UDP (un mensaje por datagrama, RFC 5426) o TCP (octet-counting
+    o '\\n', RFC 6587), y sockets Unix de datagramas o de tipo stream.
+
+    Los sockets son no bloqueantes: cada read() vacía lo que el kernel tenga
+    en cola hasta max_bytes y vuelve, sin esperar. Entre lectura y lectura las
+    ráfagas quedan en el buffer de recepción (recv_buffer, SO_RCVBUF). Si se
+    llena, el kernel descarta datagramas UDP: se cuentan en 'input_overflows'
+    (contador 'drops' de /proc/net/udp) para que la pérdida sea visible. Solo
+    UDP pierde datos así: en TCP y en los sockets Unix el buffer lleno frena
+    al emisor (control de flujo, o EAGAIN si no bloquea), y para ellos
+    'input_overflows' es siempre 0.
+
+    Los mensajes se entregan como (dirección, texto, None): no tienen offset
+    que guardar en el checkpoint.
+    """
+
+    def __init__(self, url, recv_buffer=RECV_BUFFER, max_line_bytes=MAX_LINE_BYTES, max_connections=MAX_CONNECTIONS):
+        super(SocketLogReader, self).__init__(url)
+        self._scheme, self._family, self._kind, self._address = parse_address(url)
+        self._recv_buffer = recv_buffer
+        self._max_line_bytes = max_line_bytes
+        self._max_connections = max_connections
+        self._clients = {} # socket de cada conexión -> StreamFramer
+        self.received_messages = 0
+        self.received_bytes = 0
+        self.truncated_lines = 0
+        self.dropped_bytes = 0
+        self.rejected_connections = 0
+        self._socket = self._listen()
+
+    def _listen(self):
+        if self._family == socket.AF_UNIX:
+            self._remove_stale_socket()
+        sock = socket.socket(self._family, self._kind)
+        try:
+            if self._kind == socket.SOCK_STREAM and self._family != socket.AF_UNIX:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._set_recv_buffer(sock)
+            sock.bind(self._address)
+            if self._kind == socket.SOCK_STREAM:
+                sock.listen(128)
+            sock.setblocking(False)
+        except (socket.error, OSError) as e:
+            sock.close()
+            logger.error(u"SocketLogReader: No se pudo escuchar en %s: %s", self.resource, e)
+            raise
+        logger.info(u"SocketLogReader: Escuchando en %s.", self.resource)
+        return sock
+
+    def _remove_stale_socket(self):
+        """Borra el socket Unix que dejó una ejecución anterior (solo si es un socket)."""
+        try:
+            if stat.S_ISSOCK(os.stat(self._address).st_mode):
+                os.unlink(self._address)
+        except OSError:
+            pass
+
+    def _set_recv_buffer(self, sock):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._recv_buffer)
+            effective = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        except (socket.error, OSError) as e:
+            logger.warning(u"SocketLogReader: No se pudo ajustar el buffer de recepción de %s: %s", self.resource, e)
+            return
+        # Linux devuelve el doble de lo pedido y lo limita a net.core.rmem_max
+        if effective < self._recv_buffer:
+            logger.warning(u"SocketLogReader: Buffer de recepción de %s limitado a %d bytes (pedidos %d). Ajuste net.core.rmem_max para absorber ráfagas mayores.", self.resource, effective, self._recv_buffer)
+
+    def _deliver(self, raw, lines):
+        self.received_messages += 1
+        if self._max_line_bytes and len(raw) > self._max_line_bytes:
+            self.truncated_lines += 1
+            self.dropped_bytes += len(raw) - self._max_line_bytes
+            raw = raw[:self._max_line_bytes]
+        line = decode_message(raw)
+        if line:
+            lines.append((self.resource, line, None))
+
+    def read(self, max_lines=None, timeout=None, max_bytes=None):
+        """
+        Devuelve los mensajes ya recibidos como tuplas (dirección, texto, None),
+        hasta max_lines mensajes o max_bytes bytes. No bloquea: `timeout` se ignora.
+        """
+        if self._socket is None:
+            return []
+        if self._kind == socket.SOCK_DGRAM:
+            return self._read_datagrams(max_lines, max_bytes)
+        return self._read_streams(max_lines, max_bytes)
+
+    def _read_datagrams(self, max_lines, max_bytes):
+        lines = []
+        read_bytes = 0
+        while (not max_lines or len(lines) < max_lines) and (not max_bytes or read_bytes < max_bytes):
+            try:
+                data = self._socket.recv(MAX_DATAGRAM)
+            except (socket.error, OSError) as e:
+                if e.args[0] not in _RETRY_ERRNOS:
+                    logger.error(u"SocketLogReader: Error al recibir en %s: %s", self.resource, e)
+                break
+            read_bytes += len(data)
+            self.received_bytes += len(data)
+            self._deliver(data, lines)
+        return lines
+
+    def _read_streams(self, max_lines, max_bytes):
+        lines = []
+        read_bytes = 0
+        try:
+            ready = select.select([self._socket] + list(self._clients), [], [], 0)[0]
+        except (select.error, ValueError) as e:
+            logger.error(u"SocketLogReader: Error en select() de %s: %s", self.resource, e)
+            return lines
+        for sock in ready:
+            if sock is self._socket:
+                self._accept()
+                continue
+            framer = self._clients[sock]
+            while (not max_lines or len(lines) < max_lines) and (not max_bytes or read_bytes < max_bytes):
+                try:
+                    data = sock.recv(CHUNK_SIZE)
+                except (socket.error, OSError) as e:
+                    if e.args[0] in _RETRY_ERRNOS:
+                        break
+                    logger.warning(u"SocketLogReader: Error en una conexión de %s: %s", self.resource, e)
+                    data = b''
+                if not data:
+                    remainder = framer.finish()
+                    if remainder is not None:
+                        self._deliver(remainder, lines)
+                    self._close_client(sock)
+                    break
+                read_bytes += len(data)
+                self.received_bytes += len(data)
+                truncated, dropped = framer.truncated, framer.dropped_bytes
+                for message in framer.feed(data):
+                    self._deliver(message, lines)
+                self.truncated_lines += framer.truncated - truncated
+                self.dropped_bytes += framer.dropped_bytes - dropped
+        return lines
+
+    def _accept(self):
+        while True:
+            try:
+                conn, peer = self._socket.accept()
+            except (socket.error, OSError) as e:
+                if e.args[0] not in _RETRY_ERRNOS:
+                    logger.warning(u"SocketLogReader: Error al aceptar conexión en %s: %s", self.resource, e)
+                return
+            if len(self._clients) >= self._max_connections:
+                self.rejected_connections += 1
+                logger.warning(u"SocketLogReader: Conexión rechazada en %s: límite de %d conexiones.", self.resource, self._max_connections)
+                conn.close()
+                continue
+            conn.setblocking(False)
+            self._set_recv_buffer(conn)
+            self._clients[conn] = StreamFramer(self._max_line_bytes, octet_counting=self._scheme == 'tcp')
+            logger.debug(u"SocketLogReader: Nueva conexión en %s desde %s.", self.resource, peer)
+
+    def _close_client(self, sock):
+        self._clients.pop(sock, None)
+        sock.close()
+
+    def _kernel_drops(self):
+        """Datagramas UDP descartados por el kernel con el buffer lleno (columna 'drops' de /proc/net/udp). 0 en los demás sockets."""
+        if self._scheme != 'udp' or self._socket is None:
+            return 0
+        inode = str(os.fstat(self._socket.fileno()).st_ino)
+        for table in ('/proc/net/udp', '/proc/net/udp6'):
+            try:
+                with io.open(table, 'r') as f:
+                    next(f)
+                    for row in f:
+                        fields = row.split()
+                        if len(fields) > 12 and fields[9] == inode:
+                            return int(fields[-1])
+            except (IOError, OSError, StopIteration):
+                continue
+        return 0
+
+    def stats(self):
+        return {
+            'input_messages': self.received_messages,
+            'input_bytes': self.received_bytes,
+            'input_overflows': self._kernel_drops(),
+            'input_rejected_connections': self.rejected_connections,
+            'truncated_lines': self.truncated_lines,
+            'dropped_bytes': self.dropped_bytes
+        }
+
+    def close(self):
+        for sock in list(self._clients):
+            self._close_client(sock)
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            if self._family == socket.AF_UNIX:
+                self._remove_stale_socket()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import re
+
+# Trama con octet-counting (RFC 6587): "<longitud> <PRI>...". Sin ella, los mensajes terminan en '\n'
+OCTET_FRAME = re.compile(b'([1-9][0-9]{0,8}) <')
+# Marca de orden de bytes con la que RFC 5424 indica que MSG va en UTF-8
+BOM = '\ufeff'
+
+def decode_message(raw):
+    """Texto de un mensaje recibido: UTF-8, sin el BOM de RFC 5424 ni espacios o '\\r\\n' al final."""
+    text = raw.strip().decode('utf-8', 'ignore')
+    if BOM in text:
+        text = text.replace(BOM, '', 1)
+    return text
+
+class StreamFramer(object):
+    """
+    Separa en mensajes los bytes de un stream (TCP, socket Unix de tipo stream,
+    pipe). Con octet_counting admite las dos tramas de syslog sobre TCP
+    (RFC 6587): longitud delante del mensaje, o mensaje terminado en '\\n'.
+
+    Los mensajes de más de max_bytes se recortan y el resto se descarta sin
+    acumularlo en memoria; truncated y dropped_bytes los cuentan.
+    """
+
+    def __init__(self, max_bytes, octet_counting=True):
+        self._max_bytes = max_bytes
+        self._octet_counting = octet_counting
+        self._buffer = b''
+        self._skip = 0 # Bytes que faltan de un mensaje con longitud ya recortado
+        self._discard = False # Descartando el resto de una línea demasiado larga hasta su '\n'
+        self.truncated = 0
+        self.dropped_bytes = 0
+
+    def _truncated(self, size):
+        self.truncated += 1
+        self.dropped_bytes += size - self._max_bytes
+
+    def feed(self, data):
+        """Añade los bytes recibidos y devuelve la lista de mensajes completos."""
+        buf = self._buffer + data if self._buffer else data
+        size = len(buf)
+        messages = []
+        pos = 0
+        while pos < size:
+            if self._skip:
+                count = min(self._skip, size - pos)
+                self._skip -= count
+                pos += count
+                continue
+            if self._discard:
+                newline = buf.find(b'\n', pos)
+                if newline < 0:
+                    self.dropped_bytes += size - pos
+                    pos = size
+                    break
+                self.dropped_bytes += newline - pos
+                pos = newline + 1
+                self._discard = False
+                continue
+            if self._octet_counting:
+                frame = OCTET_FRAME.match(buf, pos)
+                if frame is not None:
+                    length = int(frame.group(1))
+                    start = frame.end() - 1
+                    if length > self._max_bytes:
+                        if size - start < self._max_bytes:
+                            break
+                        messages.append(buf[start:start + self._max_bytes])
+                        self._truncated(length)
+                        self._skip = length - self._max_bytes
+                        pos = start + self._max_bytes
+                        continue
+                    if size - start < length:
+                        break
+                    messages.append(buf[start:start + length])
+                    pos = start + length
+                    continue
+            newline = buf.find(b'\n', pos)
+            if newline < 0:
+                if size - pos > self._max_bytes:
+                    messages.append(buf[pos:pos + self._max_bytes])
+                    self._truncated(size - pos)
+                    self._discard = True
+                    pos = size
+                break
+            if newline - pos > self._max_bytes:
+                messages.append(buf[pos:pos + self._max_bytes])
+                self._truncated(newline - pos)
+            elif newline > pos:
+                messages.append(buf[pos:newline])
+            pos = newline + 1
+        self._buffer = buf[pos:]
+        return messages
+
+    def finish(self):
+        """Mensaje sin terminar que queda al cerrarse el stream (o None)."""
+        buf, self._buffer = self._buffer, b''
+        if self._skip or self._discard or not buf.strip():
+            self._skip = 0
+            self._discard = False
+            return None
+        return buf
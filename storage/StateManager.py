@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function, division, absolute_import, unicode_literals
+import threading
+
 class StateManager:
     def __init__(self, storage):
         self.storage = storage
+        # El hilo lector (checkpoints) y el de envío (batches pendientes) modifican y guardan el estado
+        self._lock = threading.RLock()
         self.state = {
             'last_position': 0,
+            'files': {},
+            'backfill': [],
             'pending_batches': []
         }
         self._load()
@@ -19,6 +25,10 @@ class StateManager:
         saved_state = self.storage.load()
         if saved_state:
             self.state = saved_state
+        # Estados anteriores a la lectura multi-archivo no tienen 'files'
+        self.state.setdefault('files', {})
+        self.state.setdefault('backfill', [])
+        self.state.setdefault('pending_batches', [])
 
     def save(self):
         """
@@ -28,7 +38,8 @@ class StateManager:
         save method. It is called whenever the state is updated.
         """
 
-        self.storage.save(self.state)
+        with self._lock:
+            self.storage.save(self.state)
 
     def update_position(self, position):
         """
@@ -42,8 +53,64 @@ class StateManager:
         :type position: int
         """
 
-        self.state['last_position'] = position
-        self.save()
+        with self._lock:
+            self.state['last_position'] = position
+            self.save()
+
+    def get_file_state(self, path):
+        """
+        Devuelve el checkpoint guardado para un archivo de log.
+
+        :param path: Ruta del archivo.
+        :type path: str
+        :return: Dict con 'position' e 'inode', o None si el archivo no tiene checkpoint.
+        """
+        return self.state['files'].get(path)
+
+    def update_file_positions(self, positions):
+        """
+        Update the checkpoint (offset and inode) of several log files at once.
+
+        Only files whose checkpoint changed are updated, and the state is
+        saved a single time. Each position must be the acknowledged
+        watermark: the start of the first line not yet confirmed by the API
+        (see BatchSender.held_offsets), so that a crash never skips data.
+
+        :param positions: Dict path -> {'position': int, 'inode': int}.
+        :type positions: dict
+        """
+        with self._lock:
+            changed = False
+            for path, file_state in positions.items():
+                if self.state['files'].get(path) != file_state:
+                    self.state['files'][path] = file_state
+                    changed = True
+            if changed:
+                self.save()
+
+    def update_backfill(self, entries):
+        """
+        Guarda el progreso del envío de archivos rotados (ver BackfillReader).
+
+        :param entries: Entradas aún no terminadas.
+        :type entries: list
+        """
+        with self._lock:
+            if self.state['backfill'] != entries:
+                self.state['backfill'] = entries
+                self.save()
+
+    def update_batch_limit(self, limit):
+        """
+        Guarda el límite de tamaño de batch aprendido de la API (ver BatchSizer).
+
+        :param limit: Límite en bytes.
+        :type limit: int
+        """
+        with self._lock:
+            if self.state.get('batch_limit') != limit:
+                self.state['batch_limit'] = limit
+                self.save()
 
     def add_pending_batch(self, batch):
         """
@@ -55,23 +122,26 @@ class StateManager:
         :param batch: The batch to be added.
         :type batch: dict
         """
-        self.state['pending_batches'].append(batch)
-        self.save()
+        with self._lock:
+            self.state['pending_batches'].append(batch)
+            self.save()
 
     def increment_batch_retry(self, batch_id):
         """
         Incrementa el contador de reintentos para un batch específico y guarda el estado.
         Devuelve el nuevo contador de reintentos, o -1 si el batch no se encuentra.
         """
-        for batch_in_state in self.state.get('pending_batches', []):
-            if batch_in_state.get('id') == batch_id:
-                batch_in_state['retry_count'] = batch_in_state.get('retry_count', 0) + 1
-                self.save()
-                return batch_in_state['retry_count']
-        return -1
+        with self._lock:
+            for batch_in_state in self.state.get('pending_batches', []):
+                if batch_in_state.get('id') == batch_id:
+                    batch_in_state['retry_count'] = batch_in_state.get('retry_count', 0) + 1
+                    self.save()
+                    return batch_in_state['retry_count']
+            return -1
 
     def remove_pending_batch(self, batch_id):
-        self.state['pending_batches'] = [
-            b for b in self.state['pending_batches'] if b['id'] != batch_id
-        ]
-        self.save()
\ No newline at end of file
+        with self._lock:
+            self.state['pending_batches'] = [
+                b for b in self.state['pending_batches'] if b['id'] != batch_id
+            ]
+            self.save()
\ No newline at end of file
@@ -48,7 +48,7 @@ class AgentTester(object):
         """
         self.config = load_config()
         
-        self.log_reader = FileLogReader(self.config.get('log_file'))
+        self.log_readers = [FileLogReader(path) for path in self.config.get('log_files', [])]
         
         auth_handler = ApiKeyAuth(self.config.get('secret_token'))
         self.api_client = JSONAPIClient(
@@ -85,13 +85,23 @@ class AgentTester(object):
 
     def test_log_file_access(self):
         """
-        Verifica que se puede acceder al archivo de logs usando la clase FileLogReader.
+        Verifica que se puede acceder a los archivos de logs usando la clase FileLogReader.
         """
-        if not self.config.get('log_file'):
-            logger.error(u"  -> Variable de entorno LOG_FILE no esta configurada.")
+        if not self.log_readers:
+            if self.config.get('inputs'):
+                logger.info(u"  -> Sin archivos de logs: el agente solo leera INPUTS (%s).", u", ".join(self.config['inputs']))
+                return True
+            logger.error(u"  -> Variable de entorno LOG_FILE / LOG_FILES no esta configurada.")
             return False
-            
-        return self.log_reader._open_file()
+
+        for reader in self.log_readers:
+            # Los patrones glob se resuelven al ejecutar el agente
+            if any(c in reader.resource for c in '*?['):
+                logger.info(u"  -> Patron %s: se resolvera al ejecutar el agente.", reader.resource)
+                continue
+            if not reader._open_file():
+                return False
+        return True
 
     def test_api_connectivity(self):
         """
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+import gzip
+import shutil
+import tempfile
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from readers.FileLogReader import FileLogReader
+from readers.BackfillReader import BackfillReader, find_rotated_files
+
+def _gzip(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    compressed = gzip.open(path + '.gz', 'wb')
+    compressed.write(data)
+    compressed.close()
+    os.remove(path)
+
+def test_find_rotated_files():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        names = ['app.log', 'app.log.1', 'app.log.2.gz', 'app.log.3.bz2', 'app.log-20240101.gz', 'app.log.bak', 'app.log.1.tmp']
+        for name in names:
+            open(os.path.join(directory, name), 'w').close()
+        found = sorted(os.path.basename(p) for p in find_rotated_files(path))
+        assert found == ['app.log-20240101.gz', 'app.log.1', 'app.log.2.gz', 'app.log.3.bz2']
+    finally:
+        shutil.rmtree(directory)
+
+def test_plan_resumes_rotated_file_compressed_during_downtime():
+    """Tras una rotación con el agente detenido, se envía lo que faltaba del archivo rotado (ya comprimido) y nada anterior"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        # Un rotado antiguo, ya enviado antes del checkpoint
+        with open(path + '.2', 'w') as f:
+            f.write('antigua\n')
+        _gzip(path + '.2')
+        past = time.time() - 3600
+        os.utime(path + '.2.gz', (past, past))
+
+        with open(path, 'w') as f:
+            f.write('uno\ndos\n')
+        reader = FileLogReader(path)
+        reader.read(timeout=0)
+        checkpoint = reader.get_checkpoint()
+        reader.close()
+
+        # Con el agente detenido: más líneas, rotación y compresión
+        with open(path, 'a') as f:
+            f.write('tres\ncuatro\n')
+        os.rename(path, path + '.1')
+        _gzip(path + '.1')
+        with open(path, 'w') as f:
+            f.write('nuevo\n')
+
+        backfill = BackfillReader()
+        added = backfill.plan(path, checkpoint)
+        assert [entry['path'] for entry in added] == [path + '.1.gz']
+        assert added[0]['position'] == len('uno\ndos\n')
+
+        assert [(line, start) for _, line, start in backfill.read(max_lines=1)] == [(u'tres', len('uno\ndos\n'))]
+        # El avance se guarda en el estado y se continúa en la línea siguiente
+        backfill = BackfillReader(backfill.state())
+        assert [line for _, line, _ in backfill.read()] == [u'cuatro']
+        assert not backfill.pending()
+    finally:
+        shutil.rmtree(directory)
+
+def test_renamed_entry_is_located_by_inode():
+    """Si logrotate renombra el archivo pendiente (app.log.1 -> app.log.2), se encuentra por inode"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path + '.1', 'w') as f:
+            f.write('uno\ndos\n')
+        entry = {'path': path + '.1', 'source': path, 'inode': os.stat(path + '.1').st_ino, 'position': 4, 'done': False}
+        os.rename(path + '.1', path + '.2')
+        backfill = BackfillReader([entry])
+        assert backfill.read() == [(path + '.2', u'dos', 4)]
+    finally:
+        shutil.rmtree(directory)
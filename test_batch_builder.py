@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import json
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from agents.BatchBuilder import BatchBuilder, encode, encode_structured
+
+LINES = [u'simple', u'acentos ñáé y "comillas"', u'tab\tbarra\\ y  ', u'emoji \U0001F600', u'']
+
+def test_size_is_exact_after_each_line():
+    """size coincide con len(body()) después de cada línea, con varias rutas, offsets y caracteres especiales"""
+    for offsets in (False, True):
+        batch = BatchBuilder(u'fuente "ñ"', offsets=offsets)
+        assert batch.size == len(batch.body())
+        for number in range(30):
+            path = u'/var/log/%s.log' % ('app', 'ñ', 'otro')[number % 3]
+            line = LINES[number % len(LINES)]
+            start = None if number % 4 == 0 else number * 100
+            expected = batch.size_with(path, encode(line), start)
+            batch.add(path, line, encode(line), start)
+            assert batch.size == expected == len(batch.body())
+
+def test_body_matches_json_dumps():
+    batch = BatchBuilder(u'fuente', offsets=True)
+    batch.add(u'/a.log', LINES[1], encode(LINES[1]), 10)
+    batch.add(u'/b.log', LINES[2], encode(LINES[2]), None)
+    batch.add(u'/a.log', LINES[3], encode(LINES[3]), 5)
+    body = json.loads(batch.body().decode('utf-8'))
+    assert body['logs'] == [LINES[1], LINES[2], LINES[3]]
+    assert body['files'] == [u'/a.log', u'/b.log']
+    assert body['file_index'] == [0, 1, 0]
+    assert body['offsets'] == [10, None, 5]
+    assert body['source'] == u'fuente'
+    # El checkpoint de cada archivo no pasa de su primera línea sin confirmar
+    assert batch.starts == {u'/a.log': 5}
+
+def test_from_entries_rebuilds_pending_batches():
+    """Los batches guardados en el estado (actuales y de versiones anteriores) se vuelven a armar igual"""
+    batch = BatchBuilder(u'fuente')
+    for line in LINES:
+        batch.add(u'/a.log', line, encode(line))
+    rebuilt = BatchBuilder.from_entries(u'fuente', json.loads(json.dumps(batch.entries)))
+    assert rebuilt.body() == batch.body()
+
+    legacy = BatchBuilder.from_entries(u'fuente', [u'uno', {'dos': 2}])
+    body = json.loads(legacy.body().decode('utf-8'))
+    assert body['logs'] == [u'uno', u'{"dos": 2}'] and 'files' not in body
+    assert legacy.size == len(legacy.body())
+
+    first, second = batch.split()
+    assert [entry[1] for entry in first.entries + second.entries] == LINES
+
+def test_structured_lines_are_embedded_as_objects():
+    """Las líneas que son un objeto JSON válido van como objeto; el resto (o JSON inválido, NaN) como string"""
+    lines = [u'  {"level": "error", "msg": "ñ"}  ', u'texto plano', u'{"roto": }', u'{"x": NaN}', u'[1, 2]']
+    assert encode_structured(lines[0]) == u'{"level": "error", "msg": "ñ"}'.encode('utf-8')
+    for line in lines[1:]:
+        assert encode_structured(line) == encode(line)
+
+    batch = BatchBuilder(u'fuente', structured=True)
+    for line in lines:
+        batch.add(u'/a.log', line, encode_structured(line))
+    body = json.loads(batch.body().decode('utf-8'))
+    assert body['logs'][0] == {'level': 'error', 'msg': u'ñ'}
+    assert body['logs'][1:] == lines[1:]
+    assert batch.size == len(batch.body())
+    # Al reconstruir (pendientes, split) se vuelven a codificar igual
+    rebuilt = BatchBuilder.from_entries(u'fuente', batch.entries, structured=True)
+    assert rebuilt.body() == batch.body()
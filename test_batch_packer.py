@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import json
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from agents.BatchBuilder import BatchBuilder, encode
+from agents.BatchPacker import BatchPacker
+
+PATH = '/var/log/app.log'
+
+def _new_batch(offsets=False):
+    return BatchBuilder('test', offsets=offsets)
+
+def _pack(packer, lines, limit):
+    batches = []
+    offset = 0
+    for line in lines:
+        batches.extend(packer.add(PATH, line, encode(line), offset, limit, 0))
+        offset += len(line) + 1
+    return batches + packer.flush(limit)
+
+def test_default_is_greedy_without_offsets():
+    """Por defecto las líneas van en orden y el body no lleva 'offsets'"""
+    lines = [u'linea %d %s' % (number, 'x' * (number % 7) * 100) for number in range(40)]
+    batches = _pack(BatchPacker(_new_batch), lines, 2000)
+    assert [line for batch in batches for _, line in batch.entries] == lines
+    for batch in batches:
+        body = json.loads(batch.body().decode('utf-8'))
+        assert 'offsets' not in body
+        assert len(batch.body()) == batch.size <= 2000
+
+def test_reorder_window_packs_mixed_sizes_into_fewer_batches():
+    """Con ventana, first-fit decreasing junta las líneas medianas separadas por grandes y cada una lleva su offset"""
+    # En orden ninguna línea cabe junto a la siguiente; dos medianas sí caben juntas
+    lines = []
+    for number in range(30):
+        lines.append(u'm%d %s' % (number, 'x' * 900))
+        lines.append(u'g%d %s' % (number, 'y' * 1500))
+    greedy = _pack(BatchPacker(_new_batch), lines, 2000)
+    packed = _pack(BatchPacker(_new_batch, window=64), lines, 2000)
+
+    assert len(packed) < len(greedy)
+    assert sorted(line for batch in packed for _, line, _ in batch.entries) == sorted(lines)
+    for batch in packed:
+        body = json.loads(batch.body().decode('utf-8'))
+        assert len(body['offsets']) == len(body['logs'])
+        assert len(batch.body()) == batch.size <= 2000
+        # El llenado se mide sin el array de offsets
+        assert batch.lines_size == sum(len(encode(line)) for line in body['logs'])
+
+def test_held_offsets_cover_the_window():
+    packer = BatchPacker(_new_batch, window=10)
+    for offset in (100, 50, 200):
+        packer.add(PATH, u'linea', encode(u'linea'), offset, 2000, 0)
+    assert packer.held_offsets() == {PATH: 50}
+    packer.flush(2000)
+    assert packer.held_offsets() == {}
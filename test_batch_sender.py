@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+import threading
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from agents.BatchBuilder import BatchBuilder, encode
+from agents.BatchSender import BatchSender
+from agents.ByteQueue import ByteQueue
+
+PATH = '/var/log/app.log'
+
+def _batch(start, line=u'linea'):
+    batch = BatchBuilder('test')
+    batch.add(PATH, line, encode(line), start)
+    return batch
+
+def test_byte_queue_blocks_when_full():
+    """put() espera mientras la cola supera max_bytes; un elemento grande entra solo con la cola vacía"""
+    queue = ByteQueue(100)
+    assert queue.put('a', 60, timeout=0)
+    assert not queue.put('b', 60, timeout=0.05)
+    assert queue.get(timeout=0) == 'a'
+    assert queue.put('grande', 500, timeout=0)
+    assert queue.bytes == 500 and len(queue) == 1
+    assert queue.get(timeout=0) == 'grande'
+    assert queue.get(timeout=0.01) is None
+
+def test_submit_fails_without_room_and_stays_unheld():
+    """Si la cola sigue llena al vencer el timeout, submit() devuelve False y el batch no retiene el checkpoint"""
+    sender = BatchSender(lambda batch: None, max_queue_bytes=1)
+    assert sender.submit(_batch(0), timeout=0)
+    assert not sender.submit(_batch(100), timeout=0.05)
+    assert sender.held_offsets() == {PATH: 0}
+
+def test_stop_drains_the_queue():
+    """Al detenerse se envía lo que queda en cola antes de terminar los hilos"""
+    sent = []
+    sender = BatchSender(lambda batch: sent.append(batch.entries[0][1]), concurrency=2)
+    for number in range(20):
+        assert sender.submit(_batch(number * 10, u'linea %d' % number))
+    sender.start()
+    sender.stop(5)
+    assert sorted(sent) == sorted(u'linea %d' % number for number in range(20))
+    assert sender.held_offsets() == {}
+    assert not sender.is_alive()
+
+def test_reader_does_not_wait_for_slow_sends():
+    """Con envíos lentos, submit() vuelve de inmediato mientras haya sitio en la cola"""
+    release = threading.Event()
+    sender = BatchSender(lambda batch: release.wait(5), concurrency=1)
+    sender.start()
+    start = time.time()
+    for number in range(10):
+        assert sender.submit(_batch(number), timeout=0)
+    assert time.time() - start < 0.5
+    release.set()
+    sender.stop(5)
+
+def test_checkpoint_watermark_waits_for_the_oldest_unacked_batch():
+    """Con varios batches en vuelo, held_offsets() no pasa del primero sin confirmar aunque los siguientes terminen antes"""
+    release = threading.Event()
+    done = []
+    def send(batch):
+        if batch.starts[PATH] == 0:
+            release.wait(5)
+        done.append(batch.starts[PATH])
+    sender = BatchSender(send, concurrency=3)
+    sender.start()
+    for start in (0, 100, 200):
+        sender.submit(_batch(start))
+    deadline = time.time() + 5
+    while len(done) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(done) == [100, 200]
+    assert sender.held_offsets() == {PATH: 0}
+    assert sender.stats()['send_in_flight'] == 1
+
+    release.set()
+    sender.stop(5)
+    assert sender.held_offsets() == {}
+    assert sender.handled_batches == 3
+
+def test_expired_drain_keeps_batches_held():
+    """Si el vaciado del shutdown no termina a tiempo, lo que quedó en cola sigue reteniendo el checkpoint"""
+    sender = BatchSender(lambda batch: time.sleep(0.3), concurrency=1)
+    for start in (0, 100, 200, 300):
+        sender.submit(_batch(start))
+    sender.start()
+    sender.stop(0.1)
+    assert sender.handled_batches < 4
+    assert sender.held_offsets()[PATH] == 100 * sender.handled_batches
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from agents.BatchSizer import BatchSizer, INCREASE_BYTES
+
+def test_additive_increase_only_for_full_fast_batches():
+    sizer = BatchSizer(8000, initial=4000, latency_target=1.0)
+    sizer.success(1000, time.time())
+    assert sizer.limit == 4000
+    sizer.success(3500, time.time() - 2)
+    assert sizer.limit == 4000
+    sizer.success(3500, time.time())
+    assert sizer.limit == 4000 + INCREASE_BYTES
+
+def test_multiplicative_decrease_once_per_round_trip():
+    """Los rechazos de envíos que empezaron antes de la última reducción no la repiten"""
+    sizer = BatchSizer(8000, initial=4000)
+    sent_at = time.time()
+    sizer.overload(u"413", 4000, sent_at)
+    assert sizer.limit == 2000
+    sizer.overload(u"413", 2000, sent_at)
+    assert sizer.limit == 2000
+    sizer.overload(u"413", 2000, time.time())
+    assert sizer.limit == 1024
+    assert sizer.decreases == 2
+    assert BatchSizer.is_overload({'code': 413}) and BatchSizer.is_overload({'error': 'timeout'})
+    assert not BatchSizer.is_overload({'code': 401})
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import bz2
+import gzip
+import shutil
+import tempfile
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from readers.CompressedLogReader import CompressedLogReader, MAX_DECOMPRESSED_CHUNK, BZ2_MAX_LENGTH
+
+def _write(path, data):
+    if path.endswith('.gz'):
+        handle = gzip.open(path, 'wb')
+    elif path.endswith('.bz2'):
+        handle = bz2.BZ2File(path, 'wb')
+    else:
+        handle = open(path, 'wb')
+    handle.write(data)
+    handle.close()
+
+def _read_all(reader):
+    lines = []
+    while not reader.finished:
+        lines.extend(reader.read(max_lines=1000, with_offsets=True))
+    return lines
+
+def test_bz2_output_is_bounded_per_call():
+    """Un .bz2 muy compresible se descomprime en bloques de como mucho MAX_DECOMPRESSED_CHUNK bytes (Python 3.5+)"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log.1.bz2')
+        line = b'x' * 99 + b'\n'
+        _write(path, line * 100000)
+        reader = CompressedLogReader(path)
+        assert reader._open_file()
+        total = 0
+        while True:
+            data = reader._next_data()
+            if not data:
+                break
+            assert len(data) <= MAX_DECOMPRESSED_CHUNK or not BZ2_MAX_LENGTH
+            total += len(data)
+        reader.close()
+        assert total == len(line) * 100000
+    finally:
+        shutil.rmtree(directory)
+
+def test_resume_at_decompressed_offset():
+    """Al reanudar con el offset guardado se continúa en la línea siguiente, en .gz, .bz2 y sin comprimir"""
+    directory = tempfile.mkdtemp()
+    try:
+        data = b''.join(b'linea %d\n' % number for number in range(5000))
+        for name in ('app.log.1', 'app.log.2.gz', 'app.log.3.bz2'):
+            path = os.path.join(directory, name)
+            _write(path, data)
+            lines = _read_all(CompressedLogReader(path))
+            assert [line for line, _ in lines] == [u'linea %d' % number for number in range(5000)]
+
+            _, start = lines[3000]
+            resumed = _read_all(CompressedLogReader(path, start_position=start))
+            assert resumed == lines[3000:]
+    finally:
+        shutil.rmtree(directory)
+
+def test_concatenated_members():
+    """Varios streams concatenados ('gzip >>', pbzip2) se leen enteros"""
+    directory = tempfile.mkdtemp()
+    try:
+        for name in ('app.log.1.gz', 'app.log.1.bz2'):
+            path = os.path.join(directory, name)
+            members = []
+            for data in (b'uno\ndos\n', b'tres\n'):
+                _write(path, data)
+                with open(path, 'rb') as f:
+                    members.append(f.read())
+            with open(path, 'wb') as f:
+                f.write(b''.join(members))
+            assert [line for line, _ in _read_all(CompressedLogReader(path))] == [u'uno', u'dos', u'tres']
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import json
+import time
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from processors.DedupProcessor import DedupProcessor, mask
+
+def _records(lines, path='/app.log'):
+    return [(path, line, offset * 100) for offset, line in enumerate(lines)]
+
+def test_repetitions_become_one_summary():
+    """La primera aparición se envía; las repeticiones se cuentan y salen como un resumen al cerrar la ventana"""
+    processor = DedupProcessor(window=60)
+    out = list(processor.process(_records([u'fallo db', u'fallo db', u'otra', u'fallo db'])))
+    assert out == [('/app.log', u'fallo db', 0), ('/app.log', u'otra', 200)]
+    # Las repeticiones aún sin contar frenan el checkpoint desde la primera de ellas
+    assert processor.held_offsets() == {'/app.log': 100}
+
+    summaries = processor.flush(force=True)
+    assert len(summaries) == 1
+    path, line, start = summaries[0]
+    summary = json.loads(line)
+    assert (path, start) == ('/app.log', 100)
+    assert summary['repeated_line'] == u'fallo db' and summary['count'] == 2
+    assert processor.held_offsets() == {}
+    assert processor.stats()['dedup_suppressed_lines'] == 2
+
+def test_window_expiry_and_files_are_separate():
+    processor = DedupProcessor(window=0.05)
+    assert len(list(processor.process(_records([u'x', u'x'])))) == 1
+    assert len(list(processor.process(_records([u'x'], path='/otro.log')))) == 1
+    time.sleep(0.1)
+    # Al vencer la ventana, la línea vuelve a enviarse precedida por el resumen de la ventana anterior
+    out = list(processor.process(_records([u'x'])))
+    assert [json.loads(out[0][1])['count'], out[1][1]] == [1, u'x']
+    assert processor.flush() == []
+
+def test_masked_lines_and_max_keys():
+    """Con masked, las líneas que solo difieren en números o UUIDs son la misma; al llenar la tabla se cierra la más antigua"""
+    assert mask(u'id 123e4567-e89b-12d3-a456-426614174000 t=15') == mask(u'id 00000000-0000-0000-0000-000000000000 t=99')
+    processor = DedupProcessor(window=60, masked=True, max_keys=2)
+    out = list(processor.process(_records([u'req 1 ok', u'req 2 ok', u'a', u'b'])))
+    assert [out[0][1], out[1][1], out[3][1]] == [u'req 1 ok', u'a', u'b']
+    assert json.loads(out[2][1])['count'] == 1
+    assert processor.stats()['dedup_evictions'] == 1
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from readers import FileLogReader as file_log_reader
+from readers import PageCache
+from readers.FileLogReader import FileLogReader
+from readers.BackfillReader import BackfillReader
+from readers.Fingerprint import SAME, ROTATED
+
+def test_rotated_file_truncation_is_counted():
+    """Las líneas largas que se terminan de leer del archivo rotado se recortan y cuentan como las del archivo actual"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        open(path, 'w').close()
+        reader = FileLogReader(path, max_line_bytes=100, rotate_wait=0.5, chunk_size=64)
+        reader.read(timeout=0)
+        with open(path, 'a') as f:
+            f.write('a' * 50)
+        reader.read(timeout=0.1)
+        os.rename(path, path + '.1')
+        open(path, 'w').close()
+        reader.read(timeout=0.1)
+        # Un escritor lento sigue escribiendo en el archivo rotado
+        with open(path + '.1', 'a') as f:
+            f.write('a' * 250 + '\n' + 'b' * 300 + '\nshort\n' + 'c' * 400)
+
+        lines = []
+        for _ in range(10):
+            lines.extend(reader.read(timeout=0.2))
+        assert [len(line) for line in lines] == [100, 100, 5, 100]
+        assert reader.truncated_lines == 3
+        assert reader.dropped_bytes == 200 + 200 + 300
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_checkpoint_covers_rotated_file_while_draining():
+    """Mientras se drena el archivo rotado, el checkpoint guarda su inode y offset; el backfill continúa ahí al reiniciar"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'w') as f:
+            f.write('antes\n')
+        reader = FileLogReader(path, rotate_wait=60)
+        reader.read(timeout=0)
+        os.rename(path, path + '.1')
+        with open(path, 'w') as f:
+            f.write('nuevo\n')
+        with open(path + '.1', 'a') as f:
+            f.write('tardia 1\n')
+        lines = []
+        for _ in range(5):
+            lines.extend(reader.read(timeout=0.05))
+        assert lines == ['tardia 1', 'nuevo']
+
+        # Un escritor lento sigue escribiendo en el rotado y el agente se detiene antes de leerlo
+        with open(path + '.1', 'a') as f:
+            f.write('tardia 2\ntardia 3\n')
+        checkpoint = reader.get_checkpoint()
+        reader.close()
+        assert checkpoint['rotated']['inode'] == os.stat(path + '.1').st_ino
+        assert checkpoint['rotated']['position'] == len('antes\ntardia 1\n')
+
+        # logrotate lo comprime mientras el agente está detenido: se reconoce por su contenido
+        with open(path + '.1', 'rb') as f_in:
+            data = f_in.read()
+        compressed = gzip.open(path + '.1.gz', 'wb')
+        compressed.write(data)
+        compressed.close()
+        os.remove(path + '.1')
+
+        backfill = BackfillReader()
+        assert backfill.resume(path, checkpoint['rotated']) is not None
+        lines = []
+        while backfill.pending():
+            lines.extend(line for _, line, _ in backfill.read())
+        assert lines == ['tardia 2', 'tardia 3']
+    finally:
+        shutil.rmtree(directory)
+
+def test_offsets_count_bytes_not_characters():
+    """Los offsets son bytes del archivo: con UTF-8 multibyte y '\\r\\n' apuntan al inicio real de cada línea"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        data = u'ñandú 1\r\nacción 2\nsin fin'.encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(data)
+        reader = FileLogReader(path, chunk_size=4)
+        lines = reader.read(timeout=0, with_offsets=True)
+        assert lines == [(u'ñandú 1', 0), (u'acción 2', data.index(b'acci'))]
+        # La línea sin '\n' no se entrega ni cuenta para el offset
+        assert reader.get_current_position() == data.index(b'sin')
+        with open(path, 'ab') as f:
+            f.write(b'\n')
+        assert reader.read(timeout=0, with_offsets=True) == [(u'sin fin', data.index(b'sin'))]
+        assert reader.get_current_position() == len(data) + 1
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def _read_everything(reader, max_bytes=None):
+    lines = []
+    while True:
+        chunk = reader.read(timeout=0, max_bytes=max_bytes, with_offsets=True)
+        if not chunk:
+            return lines
+        lines.extend(chunk)
+
+def test_catchup_with_mmap_matches_block_reads():
+    """En catch-up (mmap) se entregan las mismas líneas y offsets que con lectura por bloques, y el mapa se libera al terminar"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'wb') as f:
+            for number in range(20000):
+                f.write(b'linea %d %s\n' % (number, b'x' * (number % 50)))
+            f.write(b'sin terminar')
+
+        expected = _read_everything(FileLogReader(path, catchup_threshold=None))
+        reader = FileLogReader(path, catchup_threshold=1024)
+        assert _read_everything(reader, max_bytes=64 * 1024) == expected
+        assert reader._map is None
+        assert reader.get_current_position() == os.path.getsize(path) - len('sin terminar')
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_restore_checkpoint_compares_content():
+    """Al arrancar se continúa en el offset solo si el contenido coincide; un copytruncate que ya creció se lee desde 0"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'w') as f:
+            f.write('uno\ndos\n')
+        reader = FileLogReader(path)
+        reader.read(timeout=0)
+        checkpoint = reader.get_checkpoint()
+        reader.close()
+
+        with open(path, 'a') as f:
+            f.write('tres\n')
+        reader = FileLogReader(path)
+        assert reader.restore_checkpoint(checkpoint) == SAME
+        assert reader.read(timeout=0) == [u'tres']
+        reader.close()
+
+        # copytruncate: mismo inode, contenido nuevo y ya más largo que el offset guardado
+        with open(path, 'w') as f:
+            f.write('otra cosa distinta\n')
+        reader = FileLogReader(path)
+        assert reader.restore_checkpoint(checkpoint) == ROTATED
+        assert reader.read(timeout=0) == [u'otra cosa distinta']
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_copytruncate_detected_while_tailing():
+    """Un truncamiento que vuelve a crecer por encima del offset antes de la siguiente lectura se detecta por la cola"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'w') as f:
+            f.write('uno\n')
+        reader = FileLogReader(path)
+        assert reader.read(timeout=0) == [u'uno']
+        with open(path, 'w') as f:
+            f.write('reemplazo\nmas\n')
+        assert reader.read(timeout=0) == [u'reemplazo', u'mas']
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_read_is_bounded_by_max_bytes():
+    """Con max_bytes cada llamada devuelve un tramo acotado del backlog y el resto queda en disco"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'w') as f:
+            for number in range(1000):
+                f.write('linea %04d\n' % number)
+        reader = FileLogReader(path, catchup_threshold=None)
+        first = reader.read(timeout=0, max_bytes=100)
+        # Se corta en la primera línea que alcanza el presupuesto: 10 líneas de 11 bytes
+        assert first == [u'linea %04d' % number for number in range(10)]
+        assert reader.get_current_position() == 110
+        rest = _read_everything(reader, max_bytes=1000)
+        assert len(rest) == 990 and rest[0] == (u'linea 0010', 110)
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_read_without_timeout_returns_with_the_first_lines():
+    """timeout=None espera hasta tener al menos una línea y devuelve en cuanto la tiene"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        open(path, 'w').close()
+        reader = FileLogReader(path)
+        reader.read(timeout=0)
+        with open(path, 'a') as f:
+            f.write('hola\n')
+        assert reader.read() == [u'hola']
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_long_line_is_cut_without_buffering_its_remainder():
+    """Una línea de más de max_line_bytes se recorta; su resto se descarta al leer y el offset sigue contando sus bytes"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'w') as f:
+            f.write('corta\n' + 'x' * 5000)
+        reader = FileLogReader(path, max_line_bytes=100, chunk_size=256, catchup_threshold=None)
+        assert reader.read(timeout=0) == [u'corta']
+        # El resto de la línea en curso no se acumula en memoria
+        assert len(reader._buffer) <= 100
+        with open(path, 'a') as f:
+            f.write('y' * 5000 + '\nsiguiente\n')
+        lines = reader.read(timeout=0, with_offsets=True)
+        assert lines == [(u'x' * 100, 6), (u'siguiente', 10007)]
+        assert reader.truncated_lines == 1 and reader.dropped_bytes == 9900
+        assert reader.get_current_position() == 10007 + len('siguiente\n')
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_drop_cache_releases_only_checkpointed_windows():
+    """Se libera de la page cache lo ya guardado en el checkpoint, en ventanas completas y una sola vez"""
+    directory = tempfile.mkdtemp()
+    window = file_log_reader.DROP_CACHE_WINDOW
+    file_log_reader.DROP_CACHE_WINDOW = 4096
+    try:
+        path = os.path.join(directory, 'app.log')
+        with open(path, 'w') as f:
+            f.write(('x' * 99 + '\n') * 100)
+        reader = FileLogReader(path, catchup_threshold=None)
+        reader.read(timeout=0, max_bytes=5000)
+        assert reader.get_current_position() == 5000
+        # Un checkpoint más allá de lo entregado no libera lo que aún no se leyó
+        released = reader.drop_cache(10000)
+        if not PageCache.available():
+            assert released == 0
+            reader.close()
+            return
+        assert released == 4096 and reader.cache_released_bytes == 4096
+        assert reader.drop_cache(5000) == 0
+        reader.read(timeout=0)
+        assert reader.drop_cache(reader.get_current_position()) == 4096
+        reader.close()
+
+        reader = FileLogReader(path, drop_cache=False)
+        reader.read(timeout=0)
+        assert reader.drop_cache(reader.get_current_position()) == 0
+        reader.close()
+    finally:
+        file_log_reader.DROP_CACHE_WINDOW = window
+        shutil.rmtree(directory)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from readers.FileWatcher import InotifyFileWatcher, PollingFileWatcher, create_file_watcher
+from readers.FileLogReader import FileLogReader
+
+def _append_later(path, data, delay=0.2):
+    def append():
+        time.sleep(delay)
+        with open(path, 'a') as f:
+            f.write(data)
+    thread = threading.Thread(target=append)
+    thread.start()
+    return thread
+
+def test_inotify_wakes_on_append_and_rotation():
+    """Con inotify, wait() vuelve al escribir en el archivo o al crearse el nuevo tras la rotación"""
+    watcher = create_file_watcher()
+    if isinstance(watcher, PollingFileWatcher):
+        return # Sin inotify (fuera de Linux) no hay nada que comprobar
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        open(path, 'w').close()
+        watcher.watch(path)
+        assert watcher.wait(0.05) is False
+
+        thread = _append_later(path, 'linea\n')
+        assert watcher.wait(5) is True
+        thread.join()
+        assert watcher.changed() == set([os.path.abspath(path)])
+
+        os.rename(path, path + '.1')
+        open(path, 'w').close()
+        assert watcher.wait(1) is True
+        assert os.path.abspath(path) in watcher.changed()
+    finally:
+        watcher.close()
+        shutil.rmtree(directory)
+
+def test_reader_returns_as_soon_as_a_line_arrives():
+    """read() bloquea en el watcher y devuelve la línea sin esperar a un intervalo de polling"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        open(path, 'w').close()
+        reader = FileLogReader(path)
+        assert reader.read(timeout=0) == []
+        thread = _append_later(path, 'hola\n')
+        start = time.time()
+        assert reader.read(max_lines=1, timeout=5) == [u'hola']
+        thread.join()
+        assert time.time() - start < 2
+        if isinstance(reader._watcher, InotifyFileWatcher):
+            assert not reader._watcher._degraded
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
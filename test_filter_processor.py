@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from processors.FilterProcessor import FilterProcessor
+
+def _kept(processor, lines):
+    return [line for _, line, _ in processor.process([('/app.log', line, offset) for offset, line in enumerate(lines)])]
+
+def test_levels_with_aliases_and_lines_without_level():
+    """Los niveles se normalizan (Laravel y JSON); las líneas sin nivel reconocible se envían"""
+    processor = FilterProcessor(levels='warning,error', aliases={'oops': 'error'})
+    lines = [
+        u'[2024-01-01 10:00:00] production.DEBUG: detalle',
+        u'[2024-01-01 10:00:00] production.WARN: disco',
+        u'{"level": "advertencia", "msg": "cola"}',
+        u'{"level": "oops", "msg": "x"}',
+        u'{"level": "info", "msg": "ok"}',
+        u'sin nivel'
+    ]
+    assert _kept(processor, lines) == [lines[1], lines[2], lines[3], lines[5]]
+    assert processor.stats() == {'filtered_lines': 2, 'filter_hits': {'levels': 2}}
+
+def test_include_exclude_and_service_rules():
+    """Las reglas de un servicio reemplazan sus niveles y se suman a include/exclude generales"""
+    processor = FilterProcessor(exclude=r'healthcheck', levels=['error'],
+                                services={'billing': {'levels': 'info,error', 'exclude': r'ping'}})
+    lines = [
+        u'{"service": "billing", "level": "info", "msg": "cobro"}',
+        u'{"service": "billing", "level": "info", "msg": "ping"}',
+        u'{"service": "web", "level": "info", "msg": "visita"}',
+        u'{"service": "web", "level": "error", "msg": "healthcheck"}',
+        u'{"service": "web", "level": "error", "msg": "caída"}'
+    ]
+    assert _kept(processor, lines) == [lines[0], lines[4]]
+    assert processor.stats()['filter_hits'] == {'billing/exclude': 1, 'levels': 1, 'exclude': 1}
+
+    processor = FilterProcessor(include=r'ERROR|CRIT')
+    assert _kept(processor, [u'ERROR uno', u'INFO dos', u'CRIT tres']) == [u'ERROR uno', u'CRIT tres']
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from readers.Syslog import StreamFramer, decode_message
+from readers.Inputs import create_input
+
+def _read_until(reader, count, seconds=2):
+    lines = []
+    deadline = time.time() + seconds
+    while len(lines) < count and time.time() < deadline:
+        lines.extend(reader.read())
+        time.sleep(0.01)
+    return lines
+
+def test_framer_octet_counting_and_newlines():
+    """Las dos tramas de RFC 6587 se separan aunque lleguen partidas entre lecturas"""
+    framer = StreamFramer(100)
+    data = b'11 <14>1 hola\n<14>1 adios\n9 <14>1 fin'
+    messages = []
+    for index in range(len(data)):
+        messages.extend(framer.feed(data[index:index + 1]))
+    assert messages == [b'<14>1 hola\n', b'<14>1 adios', b'<14>1 fin']
+    assert framer.finish() is None
+
+def test_framer_truncates_without_buffering():
+    """Un mensaje de más de max_bytes se recorta y su resto se cuenta como descartado"""
+    framer = StreamFramer(10, octet_counting=False)
+    messages = framer.feed(b'x' * 25)
+    messages.extend(framer.feed(b'y' * 25 + b'\ncorto\n'))
+    assert messages == [b'x' * 10, b'corto']
+    assert framer.truncated == 1
+    assert framer.dropped_bytes == 40
+
+def test_udp_input():
+    reader = create_input('udp://127.0.0.1:0')
+    try:
+        address = reader._socket.getsockname()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for number in range(20):
+            sender.sendto(('<14>1 - host app - - - mensaje %d' % number).encode('utf-8'), address)
+        sender.close()
+        lines = _read_until(reader, 20)
+        assert [line for _, line, _ in lines] == [u'<14>1 - host app - - - mensaje %d' % number for number in range(20)]
+        assert all(start is None for _, _, start in lines)
+        assert reader.stats()['input_messages'] == 20
+    finally:
+        reader.close()
+
+def test_tcp_input_delivers_remainder_on_close():
+    reader = create_input('tcp://127.0.0.1:0')
+    try:
+        sender = socket.create_connection(reader._socket.getsockname())
+        sender.sendall(b'13 <14>1 primero<14>1 segundo\n<14>1 sin fin')
+        sender.close()
+        lines = _read_until(reader, 3)
+        assert [line for _, line, _ in lines] == [u'<14>1 primero', u'<14>1 segundo', u'<14>1 sin fin']
+    finally:
+        reader.close()
+
+def test_fifo_input_survives_writer_reopen():
+    """Un FIFO se sigue leyendo cuando el proceso que escribe lo cierra y vuelve a abrirlo"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'agent.fifo')
+        reader = create_input('pipe://' + path)
+        assert reader.read() == []
+        for text in (b'uno\ndos\n', b'tres'):
+            fd = os.open(path, os.O_WRONLY)
+            os.write(fd, text)
+            os.close(fd)
+        lines = _read_until(reader, 3)
+        assert [line for _, line, _ in lines] == [u'uno', u'dos', u'tres']
+        assert not reader.finished
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_decode_message_strips_bom_and_line_end():
+    assert decode_message(b'<14>1 - host app - - - \xef\xbb\xbfmensaje \xc3\xb1\r\n') == u'<14>1 - host app - - - mensaje ñ'
+
+def test_unix_sockets():
+    """Socket Unix de datagramas (un mensaje por datagrama) y de tipo stream (tramas con '\\n')"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'dgram.sock')
+        reader = create_input('unix://' + path, max_line_bytes=100)
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.sendto(b'<14>uno', path)
+        sender.sendto(b'x' * 300, path)
+        sender.close()
+        lines = _read_until(reader, 2)
+        assert [line for _, line, _ in lines] == [u'<14>uno', u'x' * 100]
+        assert reader.stats()['truncated_lines'] == 1
+        reader.close()
+
+        path = os.path.join(directory, 'stream.sock')
+        reader = create_input('unixstream://' + path)
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sender.connect(path)
+        sender.sendall(b'dos\ntres\n')
+        sender.close()
+        assert [line for _, line, _ in _read_until(reader, 2)] == [u'dos', u'tres']
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import json
+import zlib
+import shutil
+import time
+import tempfile
+import threading
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from six.moves import BaseHTTPServer
+from clients.JSONAPIClient import JSONAPIClient, COMPRESSIONS
+from clients.TokenBucket import TokenBucket
+from agents.BatchBuilder import encode
+from agents.LogAgent import LogAgent
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length')))
+        encoding = self.headers.get('Content-Encoding')
+        self.server.received.append((encoding, len(body), zlib.decompress(body, COMPRESSIONS[encoding]) if encoding else body))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{"ok": true}')
+
+    def log_message(self, *args):
+        pass
+
+def _server():
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%d/api' % server.server_address[1]
+
+def test_compressed_body_is_sent_with_content_encoding():
+    """El body viaja comprimido con su Content-Encoding y el servidor recupera el JSON original"""
+    server, url = _server()
+    try:
+        body = json.dumps({'logs': ['linea %d' % number for number in range(500)]}).encode('utf-8')
+        for compression in ('gzip', 'deflate'):
+            client = JSONAPIClient(url, compression=compression)
+            assert client.send('logs', body) == (True, {'ok': True})
+            encoding, size, received = server.received[-1]
+            assert encoding == compression and received == body
+            assert size == len(client.compress(body)) < len(body)
+
+        # Un body ya comprimido (el que se midió contra el límite) no se vuelve a comprimir
+        client = JSONAPIClient(url, compression='gzip')
+        client.send('logs', client.compress(body), compressed=True)
+        assert server.received[-1][2] == body
+
+        JSONAPIClient(url, compression='none').send('logs', body)
+        assert server.received[-1] == (None, len(body), body)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_unknown_compression_is_rejected():
+    try:
+        JSONAPIClient('http://127.0.0.1:9/api', compression='brotli')
+    except ValueError:
+        pass
+    else:
+        assert False, u"Una compresión no soportada debería fallar"
+
+def test_agent_checks_the_limit_on_compressed_bytes():
+    """Con compresión, un body que solo sin comprimir supera batch_max_bytes se envía entero y se aprende el ratio"""
+    server, url = _server()
+    directory = tempfile.mkdtemp()
+    try:
+        agent = LogAgent({
+            'source': 'test', 'api_url': url, 'secret_token': 'test', 'compression': 'gzip',
+            'state_file': os.path.join(directory, 'agent.state'), 'log_files': [],
+            'inputs': ['udp://127.0.0.1:0'], 'batch_max_bytes': 7500
+        })
+        batch = agent._new_batch()
+        for number in range(200):
+            line = u'INFO request handled path=/api/items status=200 n=%d' % number
+            batch.add('/var/log/app.log', line, encode(line))
+        body = batch.body()
+        assert len(body) > 7500
+        assert agent._send_batch(batch, body)[0]
+        encoding, size, received = server.received[-1]
+        assert encoding == 'gzip' and size <= 7500 and received == body
+        assert agent.compression_ratio > 2.0
+        assert agent._batch_limit() > agent.batch_sizer.limit
+        for source in agent.inputs:
+            source.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(directory)
+
+def test_token_bucket_reserves_ahead():
+    """La ráfaga sale sin esperar; lo que la supera espera en orden lo que le corresponde según el ritmo"""
+    bucket = TokenBucket(rate=1000, capacity=2000)
+    assert bucket.reserve(2000) == 0.0
+    assert abs(bucket.reserve(500) - 0.5) < 0.05
+    # Un consumo mayor que la capacidad espera detrás del anterior, sin bloquearse
+    assert abs(bucket.reserve(3000) - 3.5) < 0.05
+
+def test_client_throttles_requests_per_second():
+    """Con max_requests_per_second, los envíos tras la ráfaga esperan y se cuentan en stats()"""
+    server, url = _server()
+    try:
+        client = JSONAPIClient(url, max_requests_per_second=5, burst_seconds=0.2)
+        start = time.time()
+        for _ in range(4):
+            assert client.send('logs', b'{}')[0]
+        # Ráfaga de un request y después uno cada 0.2 s
+        assert time.time() - start >= 0.55
+        stats = client.stats()
+        assert stats['throttled_requests'] >= 2 and stats['throttled_seconds'] > 0
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import threading
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from agents.LogAgent import LogAgent
+
+def _agent(directory, **config):
+    """LogAgent con el estado en `directory` y una API a la que nunca llega nada (los tests reemplazan el envío)."""
+    settings = {
+        'source': 'test',
+        'api_url': 'http://127.0.0.1:9/api/logs',
+        'secret_token': 'test',
+        'state_file': os.path.join(directory, 'agent.state'),
+        'log_files': [],
+        'batch_interval': 0.1,
+        'batch_max_latency': 0.3
+    }
+    settings.update(config)
+    return LogAgent(settings)
+
+def test_inputs_only_agent_has_no_file_reader():
+    """Con INPUTS y sin LOG_FILE / LOG_FILES no se crea el lector de archivos y los mensajes se leen igual"""
+    directory = tempfile.mkdtemp()
+    try:
+        agent = _agent(directory, inputs=['udp://127.0.0.1:0'])
+        assert agent.log_reader is None
+        agent.initialize()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.sendto(b'<14>1 - host app - - - hola', agent.inputs[0]._socket.getsockname())
+        sender.close()
+        time.sleep(0.1)
+        records = list(agent._iter_records())
+        assert [line for _, line, _ in records] == [u'<14>1 - host app - - - hola']
+        assert agent.metrics()['input_messages'] == 1
+        agent._save_checkpoint()
+        for source in agent.inputs:
+            source.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_agent_requires_files_or_inputs():
+    directory = tempfile.mkdtemp()
+    try:
+        try:
+            _agent(directory)
+        except ValueError:
+            pass
+        else:
+            assert False, u"LogAgent sin archivos ni inputs debería fallar"
+    finally:
+        shutil.rmtree(directory)
+
+def _capture(agent):
+    """Reemplaza el envío a la API: las líneas de cada batch se guardan en la lista devuelta."""
+    sent = []
+    def send_batch(batch, body=None):
+        sent.extend(entry[1] for entry in batch.entries)
+        return True, {}
+    agent._send_batch = send_batch
+    return sent
+
+def test_cleanup_flushes_held_events_and_summaries():
+    """Al detenerse, el evento multilínea a medias y el resumen de repeticiones de un input se envían"""
+    directory = tempfile.mkdtemp()
+    try:
+        agent = _agent(directory, inputs=['udp://127.0.0.1:0'], multiline_start=r'^\[', multiline_timeout=60, dedup_window=60)
+        sent = _capture(agent)
+        agent.initialize()
+        agent.sender.start()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for line in (b'[1] inicio', b'at a', b'[2] repetida', b'[2] repetida', b'[2] repetida'):
+            sender.sendto(line, agent.inputs[0]._socket.getsockname())
+        sender.close()
+        time.sleep(0.1)
+        agent.execute()
+        agent._shutdown_requested = True
+        agent.cleanup()
+
+        assert sent[:2] == [u'[1] inicio\nat a', u'[2] repetida']
+        assert len(sent) == 3 and u'"count": 2' in sent[2]
+    finally:
+        shutil.rmtree(directory)
+
+def test_size_rejections_end_up_sent_not_dropped():
+    """Con 413, las mitades y la línea recortada pasan por los pendientes hasta que la API las acepta"""
+    directory = tempfile.mkdtemp()
+    try:
+        agent = _agent(directory, inputs=['udp://127.0.0.1:0'])
+        sent = []
+        def send_batch(batch, body=None):
+            if len(batch.body()) > 1500:
+                return False, {'error': 'payload too large', 'code': 413}
+            sent.extend(entry[1] for entry in batch.entries)
+            return True, {}
+        agent._send_batch = send_batch
+        batch = agent._new_batch()
+        lines = [u'linea %d %s' % (number, 'x' * 200) for number in range(20)] + [u'grande ' + 'y' * 4000]
+        for line in lines:
+            line, encoded = agent._encode_line(line)
+            batch.add('/var/log/app.log', line, encoded, None)
+
+        agent._send_and_handle_batch(batch)
+        for _ in range(20):
+            if not agent.state_manager.state['pending_batches']:
+                break
+            agent._process_pending_batches()
+
+        assert agent.state_manager.state['pending_batches'] == []
+        assert sorted(line for line in sent if not line.startswith(u'grande')) == sorted(lines[:-1])
+        shortened = [line for line in sent if line.startswith(u'grande')]
+        assert len(shortened) == 1 and shortened[0].endswith(u'...[TRUNCATED]')
+        assert agent.split_batches > 0 and agent.shortened_lines > 0
+        for source in agent.inputs:
+            source.close()
+    finally:
+        shutil.rmtree(directory)
+
+def _append(path, text):
+    with open(path, 'a') as f:
+        f.write(text)
+
+def _run_once(agent):
+    """Una pasada completa y el cierre del agente (envía lo pendiente y guarda el checkpoint)."""
+    agent.sender.start()
+    agent.execute()
+    agent._shutdown_requested = True
+    agent.cleanup()
+
+def test_each_file_resumes_from_its_own_checkpoint():
+    """Con varios archivos, al reiniciar cada uno continúa desde su offset y no se reenvía nada"""
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(directory, name) for name in ('a.log', 'b.log')]
+        for path in paths:
+            _append(path, 'vieja\n')
+
+        agent = _agent(directory, log_files=paths)
+        sent = _capture(agent)
+        agent.initialize()
+        _append(paths[0], 'a1\n')
+        _append(paths[1], 'b1\nb2\n')
+        _run_once(agent)
+        assert sorted(sent) == [u'a1', u'b1', u'b2']
+
+        _append(paths[1], 'b3\n')
+        agent = _agent(directory, log_files=paths)
+        sent = _capture(agent)
+        agent.initialize()
+        _run_once(agent)
+        assert sent == [u'b3']
+        assert agent.state_manager.get_file_state(paths[0])['position'] == len('vieja\na1\n')
+    finally:
+        shutil.rmtree(directory)
+
+def test_profile_follows_read_lag_with_hysteresis():
+    """Se pasa a catch-up con CATCHUP_LAG_BYTES de retraso y se vuelve a live solo por debajo de CATCHUP_EXIT_BYTES"""
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'app.log')
+        _append(path, '')
+        agent = _agent(directory, log_files=[path], catchup_lag_mb=64 / 1024)
+        agent.initialize()
+        assert agent.mode == 'live'
+
+        _append(path, ('x' * 99 + '\n') * 1024)
+        agent._update_profile()
+        assert agent.mode == 'catchup'
+        assert agent.READ_BUFFER_BYTES == agent.PROFILES['catchup']['read_buffer_bytes']
+
+        # Con un retraso entre los dos umbrales sigue en catch-up
+        agent.log_reader.read(timeout=0, max_bytes=60 * 1024)
+        agent._update_profile()
+        assert agent.CATCHUP_EXIT_BYTES < agent.lag < agent.CATCHUP_LAG_BYTES
+        assert agent.mode == 'catchup'
+
+        agent.log_reader.read(timeout=0)
+        agent._update_profile()
+        assert agent.mode == 'live' and agent.metrics()['mode'] == 'live'
+        agent.log_reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_partial_batch_lingers_until_max_latency():
+    """A ritmo bajo la pasada espera a que el batch se llene hasta BATCH_MAX_LATENCY: las líneas salen juntas"""
+    directory = tempfile.mkdtemp()
+    try:
+        agent = _agent(directory, inputs=['udp://127.0.0.1:0'], batch_interval=0.05, batch_max_latency=0.5)
+        sent = _capture(agent)
+        agent.initialize()
+        agent.sender.start()
+        address = agent.inputs[0]._socket.getsockname()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.sendto(b'primera', address)
+        later = threading.Timer(0.2, lambda: sender.sendto(b'segunda', address))
+        later.start()
+        start = time.time()
+        agent.execute()
+        later.join()
+        sender.close()
+        assert time.time() - start >= 0.4
+        assert agent.flush_interval == 0.5
+        agent._shutdown_requested = True
+        agent.cleanup()
+        assert sent == [u'primera', u'segunda']
+        assert agent.sender.handled_batches == 1
+    finally:
+        shutil.rmtree(directory)
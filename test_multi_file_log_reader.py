@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import shutil
+import tempfile
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from readers.MultiFileLogReader import MultiFileLogReader
+
+def test_budget_limited_read_rotates_files():
+    """Con el presupuesto de bytes agotado, la pasada siguiente empieza por el archivo siguiente"""
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(directory, '%s.log' % name) for name in ('a', 'b', 'c')]
+        for path in paths:
+            open(path, 'w').close()
+        reader = MultiFileLogReader([os.path.join(directory, '*.log')])
+        reader.read(timeout=0)
+        for path in paths:
+            with open(path, 'a') as f:
+                for number in range(5):
+                    f.write('%s %d %s\n' % (os.path.basename(path), number, 'x' * 50))
+
+        # Cada línea ocupa 59 bytes: con 100 de presupuesto cada pasada lee dos líneas de un solo archivo
+        first_paths = []
+        for _ in range(4):
+            records = reader.read(timeout=0.2, max_bytes=100)
+            assert records
+            assert set(record[0] for record in records) == set([records[0][0]])
+            first_paths.append(records[0][0])
+        assert first_paths == [paths[0], paths[1], paths[2], paths[0]]
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_only_most_recent_files_stay_open():
+    """Con max_open_files solo quedan abiertos los archivos usados más recientemente; los cerrados se reabren al cambiar"""
+    directory = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(directory, 'worker-%d.log' % number) for number in range(5)]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write('%s inicio\n' % os.path.basename(path))
+        reader = MultiFileLogReader([os.path.join(directory, '*.log')], max_open_files=2)
+        records = reader.read(timeout=0.2)
+        assert len(records) == 5
+        assert reader.stats()['open_files'] == 2
+        closed = [path for path in paths if not reader.readers[path].is_open()]
+        assert len(closed) == 3
+
+        with open(closed[0], 'a') as f:
+            f.write('otra\n')
+        records = reader.read(timeout=1.5)
+        assert [(path, line) for path, line, _ in records] == [(closed[0], u'otra')]
+        assert reader.positions()[closed[0]]['position'] == os.path.getsize(closed[0])
+        assert reader.stats()['open_files'] <= 2
+        reader.close()
+    finally:
+        shutil.rmtree(directory)
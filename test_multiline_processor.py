@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import time
+
+# Configuración de rutas para imports
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(PROJECT_ROOT, 'lib')
+sys.path.insert(0, LIB_DIR)
+
+from agents.BatchBuilder import encode
+from processors.MultilineProcessor import MultilineProcessor
+
+def test_event_size_counts_encoded_bytes():
+    """Los eventos con acentos, comillas y tabs no superan el límite en bytes del JSON codificado"""
+    processor = MultilineProcessor(start=r'^\[', max_event_size=6000)
+    lines = [u'[2024-01-01 10:00:00] production.ERROR: "ñ"\t'] + [u'  at línea "%d"\tñáé' % number for number in range(2000)]
+    events = list(processor.process([('/app.log', line, offset) for offset, line in enumerate(lines)]))
+    events.extend(processor.flush(force=True))
+
+    assert len(events) > 1
+    assert max(len(encode(event[1])) for event in events) <= 6000
+    assert sum(event[1].count(u'\n') + 1 for event in events) == len(lines)
+
+def _records(lines, path='/app.log'):
+    records = []
+    offset = 0
+    for line in lines:
+        records.append((path, line, offset))
+        offset += len(line.encode('utf-8')) + 1
+    return records
+
+def test_stack_trace_becomes_one_event_and_holds_its_offset():
+    """Las líneas de continuación se unen al evento; mientras está retenido su offset frena el checkpoint"""
+    processor = MultilineProcessor(start=r'^\[')
+    lines = [u'[10:00] ERROR boom', u'#0 /app/a.php(1)', u'#1 {main}', u'[10:01] INFO ok']
+    events = list(processor.process(_records(lines)))
+    assert events == [('/app.log', u'[10:00] ERROR boom\n#0 /app/a.php(1)\n#1 {main}', 0)]
+    assert processor.held_offsets() == {'/app.log': len(u'\n'.join(lines[:3])) + 1}
+    assert processor.flush(force=True) == [('/app.log', u'[10:01] INFO ok', len(u'\n'.join(lines[:3])) + 1)]
+    assert processor.held_offsets() == {}
+    assert processor.stats()['multiline_events'] == 1 and processor.stats()['multiline_merged_lines'] == 2
+
+def test_held_event_is_emitted_after_timeout():
+    processor = MultilineProcessor(start=r'^\[', timeout=0.05)
+    assert list(processor.process(_records([u'[10:00] ERROR a', u'  at b']))) == []
+    assert processor.flush() == []
+    time.sleep(0.1)
+    assert processor.flush() == [('/app.log', u'[10:00] ERROR a\n  at b', 0)]
+
+def test_offset_going_back_ends_the_event():
+    """Si el offset retrocede (rotación o truncamiento), la línea nueva no continúa el evento anterior"""
+    processor = MultilineProcessor(start=r'^\[')
+    events = list(processor.process([('/app.log', u'[10:00] ERROR a', 500), ('/app.log', u'  at b', 0)]))
+    assert events == [('/app.log', u'[10:00] ERROR a', 500)]
+    assert processor.flush(force=True) == [('/app.log', u'  at b', 0)]